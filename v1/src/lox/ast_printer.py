@@ -1,4 +1,18 @@
-from lox.syntax.expr import Expr, ExprVisitor, Binary, Grouping, Literal, Unary
+from lox.syntax.expr import (
+    Expr,
+    ExprVisitor,
+    Assign,
+    Logical,
+    Binary,
+    Unary,
+    Call,
+    Literal,
+    Variable,
+    Grouping,
+    Array,
+    Index,
+    SetIndex,
+)
 from lox.token import Token, TokenType
 
 
@@ -18,6 +32,12 @@ class AstPrinter(ExprVisitor[str]):
 
         return output + ")"
 
+    def visit_assign_expr(self, expr: Assign) -> str:
+        return self._parenthesize(f"= {expr.name.lexeme}", expr.value)
+
+    def visit_logical_expr(self, expr: Logical) -> str:
+        return self._parenthesize(expr.operator.lexeme, expr.left, expr.right)
+
     def visit_binary_expr(self, expr: Binary) -> str:
         return self._parenthesize(expr.operator.lexeme, expr.left, expr.right)
 
@@ -32,6 +52,23 @@ class AstPrinter(ExprVisitor[str]):
     def visit_unary_expr(self, expr: Unary) -> str:
         return self._parenthesize(expr.operator.lexeme, expr.right)
 
+    def visit_call_expr(self, expr: Call) -> str:
+        return self._parenthesize("call", expr.callee, *expr.arguments)
+
+    def visit_variable_expr(self, expr: Variable) -> str:
+        return expr.name.lexeme
+
+    def visit_array_expr(self, expr: Array) -> str:
+        return self._parenthesize("array", *expr.elements)
+
+    def visit_index_expr(self, expr: Index) -> str:
+        return self._parenthesize("index", expr.target, expr.index)
+
+    def visit_setindex_expr(self, expr: SetIndex) -> str:
+        return self._parenthesize(
+            "setindex", expr.target, expr.index, expr.value
+        )
+
 
 def main() -> None:
     expression: Expr = Binary(
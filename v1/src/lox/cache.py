@@ -0,0 +1,135 @@
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+import sys
+from typing import List, Optional
+
+from .syntax.flat import FlatTree, FlatTreeError
+from .syntax.stmt import Stmt
+from .token import Token
+
+
+# bump whenever the AST classes or the resolver's output change, so caches
+# written by older versions are ignored
+CACHE_VERSION = 9
+
+CACHE_DIR = "__loxcache__"
+
+# the only classes a cache file may create, by their module and name
+ALLOWED_CLASSES = {
+    (cls.__module__, cls.__qualname__): cls for cls in (FlatTree, Token)
+}
+
+
+class CachedProgram:
+    """
+    A program that has been through the front end: scanned, parsed,
+    optimized if asked to, and resolved
+
+    :param List[Stmt] statements: statements ready to be interpreted, with
+    their variables resolved
+    :param int removed: number of nodes the optimizer removed
+    """
+
+    __slots__ = ("statements", "removed")
+
+    statements: List[Stmt]
+    removed: int
+
+    def __init__(self, statements: List[Stmt], removed: int) -> None:
+        self.statements = statements
+        self.removed = removed
+
+
+class ProgramCache:
+    """
+    On disk cache of the front end output for one script, kept in a
+    `__loxcache__` directory next to it. The entry is keyed by a hash of
+    the source, the engine and optimizer settings, and `CACHE_VERSION`, so
+    it is ignored as soon as any of them change.
+
+    The file starts with the key as raw bytes, followed by the program
+    pickled as a `FlatTree`. The key is checked before anything is
+    unpickled, so a stale entry costs only reading the key. The key only
+    guards against stale entries, not tampered ones, so the program is read
+    with a `ProgramUnpickler`.
+
+    :param str path: location of the cache file
+    :param str key: hash the cached entry must match
+    """
+
+    path: str
+    key: str
+
+    def __init__(
+        self, filename: str, source: str, engine: str, optimize: bool
+    ) -> None:
+        directory, name = os.path.split(os.path.abspath(filename))
+        stem = os.path.splitext(name)[0]
+        suffix = ".opt" if optimize else ""
+        self.path = os.path.join(
+            directory, CACHE_DIR, f"{stem}.{engine}{suffix}.loxc"
+        )
+
+        digest = hashlib.sha256()
+        header = f"{CACHE_VERSION}:{sys.implementation.cache_tag}"
+        for part in (header, engine, str(optimize), source):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        self.key = digest.hexdigest()
+
+    def load(self) -> Optional[CachedProgram]:
+        """Load the cached program, if there is an up to date one"""
+        header = self.key.encode()
+        try:
+            with open(self.path, "rb") as file:
+                if file.read(len(header)) != header:
+                    return None
+                data = ProgramUnpickler(file).load()
+            if not (type(data) is tuple and len(data) == 2):
+                return None
+            (tree, removed) = data
+            if not (type(tree) is FlatTree and type(removed) is int):
+                return None
+            statements = tree.decode()
+        except (OSError, EOFError, pickle.UnpicklingError, FlatTreeError):
+            # missing, unreadable or not a cached program
+            return None
+
+        return CachedProgram(statements, removed)
+
+    def store(self, program: CachedProgram) -> None:
+        """Write `program` to the cache, ignoring failures"""
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temporary, "wb") as file:
+                file.write(self.key.encode())
+                pickle.dump(
+                    (FlatTree.encode(program.statements), program.removed),
+                    file,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+            # replace atomically, so concurrent runs never see a partial file
+            os.replace(temporary, self.path)
+        except (OSError, pickle.PicklingError):
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+
+class ProgramUnpickler(pickle.Unpickler):
+    """
+    Unpickler that only creates a `FlatTree` and tokens, which is all a
+    cached program is made of besides plain values. A cache file sits next
+    to its script, so one could have been planted, and a plain unpickler
+    would run whatever it says to.
+    """
+
+    def find_class(self, module: str, name: str) -> type:
+        if (module, name) in ALLOWED_CLASSES:
+            return ALLOWED_CLASSES[(module, name)]
+
+        raise pickle.UnpicklingError(f"{module}.{name} is not allowed")
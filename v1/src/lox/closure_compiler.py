@@ -0,0 +1,717 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Union
+
+from .syntax.expr import (
+    Expr,
+    ExprVisitor,
+    Assign,
+    Logical,
+    Binary,
+    Unary,
+    Call,
+    Literal,
+    Variable,
+    Grouping,
+    Array,
+    Index,
+    SetIndex,
+)
+from .syntax.stmt import (
+    Stmt,
+    StmtVisitor,
+    Function,
+    Var,
+    Expression,
+    If,
+    Print,
+    Return,
+    While,
+    Block,
+)
+from .lox_objects import LoxArray, LoxCallable
+from .lox_objects.lox_array import get_index, set_index
+from .lox_objects.lox_rope import concat, is_string
+from .token import Token, TokenType
+from .error import LoxRuntimeError, NativeError, ThrowRuntimeError
+from .environment import CELL, GLOBAL, Cell, Environment, UNDEFINED
+from .interpreter import (
+    BINARY_OPERATIONS,
+    CHAIN_NODES,
+    Interpreter,
+    NORMAL,
+    divide_by_zero,
+    operator_chain,
+    stringify,
+)
+from .optimizer import declares
+
+
+ExprFn = Callable[[Environment], object]
+# returns `NORMAL`, or the value of an executed `return`
+StmtFn = Callable[[Environment], object]
+
+# longest chain of operators, such as `a + b + c`, that is compiled to
+# nested closures
+CHAIN_LIMIT = 32
+
+
+class CompiledFunction(LoxCallable):
+    """
+    Lox function whose body has been compiled to a `StmtFn`
+
+    :param Function declaration: function statement this was created from
+    :param StmtFn body: compiled body, run in a fresh call environment
+    :param Environment closure: the cells the function captures
+    """
+
+    declaration: Function
+    body: StmtFn
+    closure: Environment
+    num_params: int
+
+    def __init__(
+        self, declaration: Function, body: StmtFn, closure: Environment
+    ) -> None:
+        self.declaration = declaration
+        self.body = body
+        self.closure = closure
+        self.num_params = len(declaration.params)
+
+    def arity(self) -> int:
+        return self.num_params
+
+    def call(self, interpreter: Interpreter, arguments: List[object]) -> object:
+        for slot in self.declaration.captured_params:
+            arguments[slot] = Cell(arguments[slot])
+
+        value = self.body(Environment(self.closure, arguments))
+        return None if value is NORMAL else value
+
+    def __str__(self) -> str:
+        return f"<fn {self.declaration.name.lexeme}>"
+
+
+class ClosureInterpreter(Interpreter):
+    """
+    Interpreter that compiles the resolved AST to Python closures once, then
+    runs those closures instead of visiting the tree on every evaluation.
+
+    Shares globals and builtins with `Interpreter`, so it can be used
+    anywhere an `Interpreter` is expected.
+    """
+
+    def interpret(self, statements: List[Stmt]) -> None:
+        compiled = self._compiler().compile(statements)
+        try:
+            for s in compiled:
+                s(self.environment)
+        except LoxRuntimeError as err:
+            ThrowRuntimeError(err)
+
+    def _compiler(self) -> ClosureCompiler:
+        return ClosureCompiler(self)
+
+
+class ClosureCompiler(ExprVisitor[ExprFn], StmtVisitor[StmtFn]):
+    """
+    Turns resolved statements into closures. Operators, variable depths and
+    callees are looked up here, so the returned closures only do the work
+    specific to their node.
+
+    :param Interpreter interpreter: interpreter holding the globals
+    :param int scope_depth: number of enclosing blocks and functions, 0 at
+    the top level where declarations define globals
+    """
+
+    interpreter: Interpreter
+    scope_depth: int
+
+    def __init__(self, interpreter: Interpreter) -> None:
+        self.interpreter = interpreter
+        self.scope_depth = 0
+
+    def compile(self, statements: List[Stmt]) -> List[StmtFn]:
+        return [self._stmt(s) for s in statements]
+
+    def _expr(self, expression: Expr) -> ExprFn:
+        if type(expression) in CHAIN_NODES:
+            chain = operator_chain(expression)  # type: ignore
+            if len(chain) > CHAIN_LIMIT:
+                return self._chain(chain)
+
+        return expression.accept(self)
+
+    def _chain(self, chain: List[Union[Binary, Logical]]) -> ExprFn:
+        """
+        Compile a long chain of binary and logical operators, as listed by
+        `operator_chain`, to a loop over its right operands. Nested closures
+        would take a Python frame per operator to run.
+        """
+        first = self._expr(chain[-1].left)
+        steps = tuple(
+            (
+                node.operator,
+                # None for a logical operator
+                BINARY_OPERATIONS[node.operator.type]
+                if type(node) is Binary
+                else None,
+                self._expr(node.right),
+            )
+            for node in reversed(chain)
+        )
+
+        def evaluate_chain(env: Environment) -> object:
+            value = first(env)
+            for (operator, operation, right) in steps:
+                if operation is not None:
+                    value = operation(operator, value, right(env))
+                elif operator.type == TokenType.OR:
+                    if value is None or value is False:
+                        value = right(env)
+                elif not (value is None or value is False):
+                    # and
+                    value = right(env)
+            return value
+
+        return evaluate_chain
+
+    def _stmt(self, statement: Stmt) -> StmtFn:
+        return statement.accept(self)
+
+    def _sequence(self, statements: List[Stmt]) -> StmtFn:
+        """
+        Compile `statements` to run one after another in a new local scope,
+        in whichever environment the caller runs them in
+        """
+        self.scope_depth += 1
+        compiled = tuple(self._stmt(s) for s in statements)
+        self.scope_depth -= 1
+
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def sequence(env: Environment) -> object:
+            for s in compiled:
+                value = s(env)
+                if value is not NORMAL:
+                    return value
+            return NORMAL
+
+        return sequence
+
+    def visit_assign_expr(self, expr: Assign) -> ExprFn:
+        value_fn = self._expr(expr.value)
+        name = expr.name
+        (depth, slot) = (expr.depth, expr.slot)
+
+        if depth == GLOBAL:
+            globals = self.interpreter.globals
+            global_slot = globals.slot(name.lexeme)
+            global_values = globals.values
+
+            def assign_global(env: Environment) -> object:
+                value = value_fn(env)
+                if global_values[global_slot] is UNDEFINED:
+                    globals.assign(name, global_slot, value)
+                global_values[global_slot] = value
+                return value
+
+            return assign_global
+        elif depth < 0:
+            return self._assign_cell(value_fn, CELL - depth, slot)
+
+        # blocks share their function's environment, and variables of
+        # enclosing functions are captured, so locals are always at depth 0
+        assert depth == 0, depth
+
+        def assign_local(env: Environment) -> object:
+            value = value_fn(env)
+            env.values[slot] = value
+            return value
+
+        return assign_local
+
+    def _assign_cell(self, value_fn: ExprFn, depth: int, slot: int) -> ExprFn:
+        """
+        Compile an assignment to a captured variable, in the current
+        environment or the closure
+        """
+        if depth == 0:
+
+            def assign_local_cell(env: Environment) -> object:
+                value = value_fn(env)
+                env.values[slot].value = value  # type: ignore
+                return value
+
+            return assign_local_cell
+
+        assert depth == 1, depth
+
+        def assign_cell(env: Environment) -> object:
+            value = value_fn(env)
+            env.enclosing.values[slot].value = value  # type: ignore
+            return value
+
+        return assign_cell
+
+    def visit_logical_expr(self, expr: Logical) -> ExprFn:
+        left = self._expr(expr.left)
+        right = self._expr(expr.right)
+
+        if expr.operator.type == TokenType.OR:
+
+            def logical_or(env: Environment) -> object:
+                value = left(env)
+                if value is None or value is False:
+                    return right(env)
+                return value
+
+            return logical_or
+
+        def logical_and(env: Environment) -> object:
+            value = left(env)
+            if value is None or value is False:
+                return value
+            return right(env)
+
+        return logical_and
+
+    def visit_binary_expr(self, expr: Binary) -> ExprFn:
+        compile_operator = BINARY_COMPILERS.get(expr.operator.type)
+        # the parser only builds `Binary` nodes for these operators
+        assert compile_operator is not None, expr.operator
+        return compile_operator(
+            expr.operator, self._expr(expr.left), self._expr(expr.right)
+        )
+
+    def visit_unary_expr(self, expr: Unary) -> ExprFn:
+        right = self._expr(expr.right)
+        operator = expr.operator
+
+        if operator.type == TokenType.MINUS:
+
+            def negate(env: Environment) -> object:
+                value = right(env)
+                if type(value) is float:
+                    return -value  # type: ignore
+                raise LoxRuntimeError(operator, "Operand must be a number")
+
+            return negate
+
+        def bang(env: Environment) -> object:
+            value = right(env)
+            return value is None or value is False
+
+        return bang
+
+    def visit_call_expr(self, expr: Call) -> ExprFn:
+        callee_fn = self._expr(expr.callee)
+        argument_fns = tuple(self._expr(arg) for arg in expr.arguments)
+        paren = expr.paren
+        interpreter = self.interpreter
+        num_args = len(argument_fns)
+
+        def call(env: Environment) -> object:
+            callee = callee_fn(env)
+            arguments = [arg(env) for arg in argument_fns]
+
+            if type(callee) is CompiledFunction:
+                if callee.num_params != num_args:
+                    raise LoxRuntimeError(
+                        paren,
+                        f"Expected {callee.num_params} arguments but got {num_args}.",
+                    )
+
+                for slot in callee.declaration.captured_params:
+                    arguments[slot] = Cell(arguments[slot])
+
+                try:
+                    value = callee.body(Environment(callee.closure, arguments))
+                except RecursionError:
+                    raise LoxRuntimeError(paren, "Stack overflow.")
+                return None if value is NORMAL else value
+
+            if not isinstance(callee, LoxCallable):
+                raise LoxRuntimeError(
+                    paren, "Can only call functions and classes"
+                )
+
+            fn_arity = callee.arity()
+            if num_args != fn_arity:
+                raise LoxRuntimeError(
+                    paren,
+                    f"Expected {fn_arity} arguments but got {num_args}.",
+                )
+
+            try:
+                return callee.call(interpreter, arguments)
+            except NativeError as err:
+                raise LoxRuntimeError(paren, err.message)
+            except RecursionError:
+                raise LoxRuntimeError(paren, "Stack overflow.")
+
+        return call
+
+    def visit_literal_expr(self, expr: Literal) -> ExprFn:
+        value = expr.value
+        return lambda env: value
+
+    def visit_variable_expr(self, expr: Variable) -> ExprFn:
+        name = expr.name
+        (depth, slot) = (expr.depth, expr.slot)
+
+        if depth == GLOBAL:
+            globals = self.interpreter.globals
+            global_slot = globals.slot(name.lexeme)
+            global_values = globals.values
+
+            def get_global(env: Environment) -> object:
+                value = global_values[global_slot]
+                if value is UNDEFINED:
+                    return globals.get(name, global_slot)
+                return value
+
+            return get_global
+        elif depth < 0:
+            return self._get_cell(CELL - depth, slot)
+
+        # as in `visit_assign_expr`, locals are always at depth 0
+        assert depth == 0, depth
+        return lambda env: env.values[slot]
+
+    def _get_cell(self, depth: int, slot: int) -> ExprFn:
+        """
+        Compile a read of a captured variable, in the current environment
+        or the closure
+        """
+        if depth == 0:
+            return lambda env: env.values[slot].value  # type: ignore
+
+        assert depth == 1, depth
+        return lambda env: env.enclosing.values[slot].value  # type: ignore
+
+    def visit_grouping_expr(self, expr: Grouping) -> ExprFn:
+        return self._expr(expr.expression)
+
+    def visit_array_expr(self, expr: Array) -> ExprFn:
+        element_fns = tuple(self._expr(e) for e in expr.elements)
+        return lambda env: LoxArray.of([e(env) for e in element_fns])
+
+    def visit_index_expr(self, expr: Index) -> ExprFn:
+        target_fn = self._expr(expr.target)
+        index_fn = self._expr(expr.index)
+        bracket = expr.bracket
+
+        def index(env: Environment) -> object:
+            target = target_fn(env)
+            try:
+                return get_index(target, index_fn(env))
+            except NativeError as err:
+                raise LoxRuntimeError(bracket, err.message)
+
+        return index
+
+    def visit_setindex_expr(self, expr: SetIndex) -> ExprFn:
+        target_fn = self._expr(expr.target)
+        index_fn = self._expr(expr.index)
+        value_fn = self._expr(expr.value)
+        bracket = expr.bracket
+
+        def set_item(env: Environment) -> object:
+            target = target_fn(env)
+            index = index_fn(env)
+            value = value_fn(env)
+            try:
+                set_index(target, index, value)
+            except NativeError as err:
+                raise LoxRuntimeError(bracket, err.message)
+            return value
+
+        return set_item
+
+    def visit_function_stmt(self, stmt: Function) -> StmtFn:
+        body = self._sequence(stmt.body)
+        name = stmt.name.lexeme
+        upvalues = stmt.upvalues
+
+        if self.scope_depth == 0:
+            global_slot = self.interpreter.globals.slot(name)
+            global_values = self.interpreter.globals.values
+
+            # functions declared at the top level have nothing to capture
+            def global_function(env: Environment) -> object:
+                closure = Environment(None, [])
+                global_values[global_slot] = CompiledFunction(
+                    stmt, body, closure
+                )
+                return NORMAL
+
+            return global_function
+
+        if stmt.captured:
+
+            def captured_function(env: Environment) -> object:
+                # define the cell first, as the function may capture itself
+                cell = Cell(None)
+                env.values.append(cell)
+                closure = Environment(
+                    None, [env.get_at(d, slot) for (d, slot) in upvalues]
+                )
+                cell.value = CompiledFunction(stmt, body, closure)
+                return NORMAL
+
+            return captured_function
+
+        def function(env: Environment) -> object:
+            closure = Environment(
+                None, [env.get_at(d, slot) for (d, slot) in upvalues]
+            )
+            env.values.append(CompiledFunction(stmt, body, closure))
+            return NORMAL
+
+        return function
+
+    def visit_var_stmt(self, stmt: Var) -> StmtFn:
+        name = stmt.name.lexeme
+        initializer: ExprFn = (
+            (lambda env: None)
+            if stmt.initializer is None
+            else self._expr(stmt.initializer)
+        )
+
+        if self.scope_depth == 0:
+            global_slot = self.interpreter.globals.slot(name)
+            global_values = self.interpreter.globals.values
+
+            def define_global(env: Environment) -> object:
+                global_values[global_slot] = initializer(env)
+                return NORMAL
+
+            return define_global
+
+        if stmt.captured:
+
+            def define_cell(env: Environment) -> object:
+                env.values.append(Cell(initializer(env)))
+                return NORMAL
+
+            return define_cell
+
+        def define(env: Environment) -> object:
+            env.values.append(initializer(env))
+            return NORMAL
+
+        return define
+
+    def visit_expression_stmt(self, stmt: Expression) -> StmtFn:
+        expression = self._expr(stmt.expression)
+
+        def expression_stmt(env: Environment) -> object:
+            expression(env)
+            return NORMAL
+
+        return expression_stmt
+
+    def visit_if_stmt(self, stmt: If) -> StmtFn:
+        condition = self._expr(stmt.condition)
+        branch_true = self._stmt(stmt.branch_true)
+
+        if stmt.branch_false is None:
+
+            def if_then(env: Environment) -> object:
+                value = condition(env)
+                if value is None or value is False:
+                    return NORMAL
+                return branch_true(env)
+
+            return if_then
+
+        branch_false = self._stmt(stmt.branch_false)
+
+        def if_else(env: Environment) -> object:
+            value = condition(env)
+            if value is None or value is False:
+                return branch_false(env)
+            return branch_true(env)
+
+        return if_else
+
+    def visit_print_stmt(self, stmt: Print) -> StmtFn:
+        expression = self._expr(stmt.expression)
+
+        def print_stmt(env: Environment) -> object:
+            print(stringify(expression(env)))
+            return NORMAL
+
+        return print_stmt
+
+    def visit_return_stmt(self, stmt: Return) -> StmtFn:
+        if stmt.value is None:
+            return lambda env: None
+
+        return self._expr(stmt.value)
+
+    def visit_while_stmt(self, stmt: While) -> StmtFn:
+        condition = self._expr(stmt.condition)
+        body = self._stmt(stmt.body)
+
+        def while_stmt(env: Environment) -> object:
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    return NORMAL
+                value = body(env)
+                if value is not NORMAL:
+                    return value
+
+        return while_stmt
+
+    def visit_block_stmt(self, stmt: Block) -> StmtFn:
+        if not stmt.statements:
+            return lambda env: NORMAL
+
+        body = self._sequence(stmt.statements)
+        base = stmt.base
+        if base < 0:
+            return lambda env: body(Environment(env))
+        elif not declares(stmt):
+            return body
+
+        # the block's variables go in the enclosing function's environment
+        def block(env: Environment) -> object:
+            value = body(env)
+            del env.values[base:]
+            return value
+
+        return block
+
+
+# Each binary operator compiles to its own closure, with the operation
+# written out rather than passed in, so running it takes no extra call.
+BinaryCompiler = Callable[[Token, ExprFn, ExprFn], ExprFn]
+
+
+def compile_not_equal(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def not_equal(env: Environment) -> object:
+        return left(env) != right(env)
+
+    return not_equal
+
+
+def compile_equal(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def equal(env: Environment) -> object:
+        return left(env) == right(env)
+
+    return equal
+
+
+def compile_greater(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def greater(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a > b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return greater
+
+
+def compile_greater_equal(
+    operator: Token, left: ExprFn, right: ExprFn
+) -> ExprFn:
+    def greater_equal(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a >= b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return greater_equal
+
+
+def compile_less(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def less(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a < b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return less
+
+
+def compile_less_equal(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def less_equal(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a <= b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return less_equal
+
+
+def compile_add(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def add(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a + b  # type: ignore
+        elif is_string(a) and is_string(b):
+            return concat(a, b)  # type: ignore
+        raise LoxRuntimeError(
+            operator, "Operands must both be numbers or strings"
+        )
+
+    return add
+
+
+def compile_subtract(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def subtract(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a - b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return subtract
+
+
+def compile_multiply(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def multiply(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            return a * b  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return multiply
+
+
+def compile_divide(operator: Token, left: ExprFn, right: ExprFn) -> ExprFn:
+    def divide(env: Environment) -> object:
+        a = left(env)
+        b = right(env)
+        if type(a) is float and type(b) is float:
+            try:
+                return a / b  # type: ignore
+            except ZeroDivisionError:
+                return divide_by_zero(a, b)  # type: ignore
+        raise LoxRuntimeError(operator, "Operands must be a number")
+
+    return divide
+
+
+# the compiler of each binary operator, by token type
+BINARY_COMPILERS: Dict[int, BinaryCompiler] = {
+    TokenType.BANG_EQUAL: compile_not_equal,
+    TokenType.EQUAL_EQUAL: compile_equal,
+    TokenType.GREATER: compile_greater,
+    TokenType.GREATER_EQUAL: compile_greater_equal,
+    TokenType.LESS: compile_less,
+    TokenType.LESS_EQUAL: compile_less_equal,
+    TokenType.PLUS: compile_add,
+    TokenType.MINUS: compile_subtract,
+    TokenType.STAR: compile_multiply,
+    TokenType.SLASH: compile_divide,
+}
@@ -1,2 +1,5 @@
+# deepest Lox call stack any engine allows
+FRAMES_MAX = 1024
+
 had_error = False
 had_runtime_error = False
@@ -1,53 +1,125 @@
 from __future__ import annotations
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from .token import Token
 from lox.error import LoxRuntimeError
 
-import sys
+
+# value of a global that has been referenced but not defined yet
+UNDEFINED = object()
+
+# resolved depth of a global variable
+GLOBAL = -1
+# a variable that a closure captures is stored in a `Cell`, and the depth of
+# the environment holding the cell is stored as `CELL - depth`
+CELL = -2
+
+
+class Cell:
+    """
+    Box for a variable that closures capture. The environment slot of the
+    variable holds the cell, and each closure that captures the variable
+    holds the same cell, so they all see its assignments.
+
+    :param object value: value of the variable
+    """
+
+    __slots__ = ("value",)
+
+    value: object
+
+    def __init__(self, value: object) -> None:
+        self.value = value
 
 
 class Environment:
-    values: Dict[str, object]
-    enclosing: Optional[Environment]
+    """
+    Local scope. Variables are stored in declaration order, and are reached
+    by the `(depth, slot)` pairs the resolver computes.
 
-    def __init__(self, enclosing: Optional[Environment] = None):
-        self.values = {}
-        self.enclosing = enclosing
+    A function's closure is an environment too, holding only the cells the
+    function captures. It is the enclosing environment of each call, so a
+    function never keeps the scopes it was declared in alive.
 
-    def get(self, name: Token) -> object:
-        try:
-            return self.values[name.lexeme]
-        except KeyError:
-            if self.enclosing is not None:
-                return self.enclosing.get(name)
+    :param List[object] values: variable values, indexed by slot
+    :param Optional[Environment] enclosing: surrounding scope
+    """
+
+    __slots__ = ("values", "enclosing")
+
+    values: List[object]
+    enclosing: Optional[Environment]
 
-        raise LoxRuntimeError(name, f"Undefined variable {name.lexeme}")
+    def __init__(
+        self,
+        enclosing: Optional[Environment] = None,
+        values: Optional[List[object]] = None,
+    ) -> None:
+        self.values = [] if values is None else values
+        self.enclosing = enclosing
 
-    def get_at(self, depth: int, name: str) -> object:
-        return self._ancestor(depth).values[name]
+    def get_at(self, depth: int, slot: int) -> object:
+        return self._ancestor(depth).values[slot]
 
     def _ancestor(self, depth: int) -> Environment:
         env: Environment = self
-        for i in range(depth):
+        while depth:
             # since the resolver ran, we know that env.enclosing is not
             # None so we can ignore the check
             env = env.enclosing  # type: ignore
+            depth -= 1
 
         return env
 
     def define(self, name: str, value: object) -> None:
-        self.values[name] = value
+        # the resolver numbers slots in the order declarations execute, so
+        # the next free slot is always the end of the list
+        self.values.append(value)
+
+    def assign_at(self, depth: int, slot: int, value: object) -> None:
+        self._ancestor(depth).values[slot] = value
+
+
+class GlobalEnvironment(Environment):
+    """
+    Outermost scope. Globals are late bound, so each name is given a slot in
+    `values` the first time it is defined or referenced, holding `UNDEFINED`
+    until it is defined. A slot is never reused for another name, so nodes
+    can cache the slot of the global they refer to, and the cached slot
+    stays valid when a global is redefined, as in the REPL.
+
+    :param Dict[str, int] slots: slot of each global, by name
+    """
+
+    __slots__ = ("slots",)
+
+    slots: Dict[str, int]
 
-    def assign(self, name: Token, value: object) -> None:
-        if name.lexeme in self.values:
-            self.values[name.lexeme] = value
-            return
-        elif self.enclosing is not None:
-            self.enclosing.assign(name, value)
-            return
+    def __init__(self) -> None:
+        super().__init__()
+        self.slots = {}
+
+    def slot(self, name: str) -> int:
+        """Find the slot of global `name`, allocating one if needed"""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.values)
+            self.values.append(UNDEFINED)
+
+        return slot
+
+    def get(self, name: Token, slot: int) -> object:
+        value = self.values[slot]
+        if value is UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable {name.lexeme}")
+
+        return value
+
+    def define(self, name: str, value: object) -> None:
+        self.values[self.slot(name)] = value
 
-        raise LoxRuntimeError(name, f"Undefined variable {name.lexeme}")
+    def assign(self, name: Token, slot: int, value: object) -> None:
+        if self.values[slot] is UNDEFINED:
+            raise LoxRuntimeError(name, f"Undefined variable {name.lexeme}")
 
-    def assign_at(self, depth: int, name: Token, value: object) -> None:
-        self._ancestor(depth).values[name.lexeme] = value
+        self.values[slot] = value
@@ -10,6 +10,10 @@ def _report(line: int, where: str, message: str) -> None:
     config.had_error = True
 
 
+def ThrowScanError(line: int, message: str) -> None:
+    _report(line, "", message)
+
+
 def ThrowError(token: Token, message: str) -> None:
     if token.type == TokenType.EOF:
         _report(token.line, " at end", message)
@@ -5,6 +5,13 @@ class LoxParseError(RuntimeError):
     pass
 
 
+class LoxIncompleteInput(RuntimeError):
+    """
+    Raised by the REPL front end when the input ends partway through a
+    declaration, so the next line should be read as its continuation
+    """
+
+
 class LoxRuntimeError(RuntimeError):
     token: Token
     message: str
@@ -15,9 +22,15 @@ class LoxRuntimeError(RuntimeError):
         self.message = message
 
 
-class LoxReturn(RuntimeError):
-    value: object
+class NativeError(RuntimeError):
+    """
+    Runtime error raised by native functions and objects, which have no
+    token to report it at. The engine reports it at the expression that
+    used them.
+    """
+
+    message: str
 
-    def __init__(self, value: object) -> None:
-        super().__init__()
-        self.value = value
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
@@ -0,0 +1,365 @@
+from __future__ import annotations
+import collections
+import json
+from array import array
+from typing import (
+    Callable,
+    Counter,
+    Dict,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from .closure_compiler import (
+    ClosureCompiler,
+    ClosureInterpreter,
+    ExprFn,
+    StmtFn,
+)
+from .environment import Environment
+from .interpreter import CHAIN_NODES, Interpreter, NORMAL
+from .syntax.expr import EXPR_VISITORS, Binary, Logical
+from .syntax.stmt import STMT_VISITORS, Block, Function, Stmt
+from .vm import VM, Chunk, OpCode
+from .vm.debug import instruction_size
+from .vm.objects import VMFunction
+
+
+Engine = Union[Interpreter, VM]
+
+
+class Instrumentation:
+    """
+    Counts the work an engine does while running a program. `install`
+    swaps counting versions of the engine's dispatch methods onto one
+    engine instance, so engines that are not instrumented are unchanged.
+
+    :param Counter[str] executed: AST nodes run, by node type, or VM
+    instructions run, by opcode
+    :param Counter[str] calls: calls of each Lox function, by name
+    :param int environments: environments created for calls and top level
+    blocks. Other blocks keep their variables in the environment of the
+    function they are in. Always 0 on the VM, which keeps locals on its
+    stack.
+    :param int early_exits: calls and top level blocks left early by a
+    `return`. Always 0 on the VM.
+    """
+
+    executed: Counter[str]
+    calls: Counter[str]
+    environments: int
+    early_exits: int
+
+    def __init__(self) -> None:
+        self.executed = collections.Counter()
+        self.calls = collections.Counter()
+        self.environments = 0
+        self.early_exits = 0
+
+    def install(self, engine: Engine) -> None:
+        if isinstance(engine, ClosureInterpreter):
+            self._install_closure(engine)
+        elif isinstance(engine, Interpreter):
+            self._install_tree(engine)
+        else:
+            self._install_vm(engine)
+
+    def _install_tree(self, interpreter: Interpreter) -> None:
+        executed = self.executed
+        # function names by the id of their body, which is all that
+        # `LoxFunction.call` passes to the interpreter
+        bodies: Dict[int, str] = {}
+
+        for name in dir(Interpreter):
+            if name.startswith("visit_"):
+                visit = getattr(interpreter, name)
+                setattr(interpreter, name, counted_visit(executed, visit))
+
+        visit_function = interpreter.visit_function_stmt
+
+        def visit_function_stmt(stmt: Function) -> object:
+            bodies[id(stmt.body)] = stmt.name.lexeme
+            return visit_function(stmt)
+
+        execute_body = interpreter._execute_body
+
+        def _execute_body(
+            statements: List[Stmt], execution_env: Environment
+        ) -> object:
+            self.calls[bodies[id(statements)]] += 1
+            return execute_body(statements, execution_env)
+
+        execute_block = interpreter._execute_block
+
+        def _execute_block(
+            statements: List[Stmt], execution_env: Environment
+        ) -> object:
+            self.environments += 1
+            value = execute_block(statements, execution_env)
+            if value is not NORMAL:
+                self.early_exits += 1
+            return value
+
+        evaluate_chain = interpreter._evaluate_chain
+
+        def _evaluate_chain(expr: Union[Binary, Logical]) -> object:
+            # only the outermost operator of a chain goes through a visitor
+            node = expr.left
+            while type(node) in CHAIN_NODES:
+                executed[type(node).__name__] += 1
+                node = node.left  # type: ignore
+            return evaluate_chain(expr)
+
+        interpreter.visit_function_stmt = visit_function_stmt  # type: ignore
+        interpreter._evaluate_chain = _evaluate_chain  # type: ignore
+        interpreter._execute_body = _execute_body  # type: ignore
+        interpreter._execute_block = _execute_block  # type: ignore
+        bind_dispatch(interpreter)
+
+    def _install_closure(self, interpreter: ClosureInterpreter) -> None:
+        make_compiler = interpreter._compiler
+
+        def _compiler() -> ClosureCompiler:
+            compiler = make_compiler()
+            self._instrument_compiler(compiler)
+            return compiler
+
+        interpreter._compiler = _compiler  # type: ignore
+
+    def _instrument_compiler(self, compiler: ClosureCompiler) -> None:
+        executed = self.executed
+        # for each body about to be compiled, the function it is the body
+        # of, if any, and whether it runs in an environment of its own
+        pending: List[Tuple[Optional[str], bool]] = []
+
+        for name in dir(ClosureCompiler):
+            if name.startswith("visit_"):
+                visit = getattr(compiler, name)
+                setattr(compiler, name, counted_compile(executed, visit))
+
+        visit_function = compiler.visit_function_stmt
+
+        def visit_function_stmt(stmt: Function) -> StmtFn:
+            # compiling the body is the first thing the visitor does
+            pending.append((stmt.name.lexeme, True))
+            return visit_function(stmt)
+
+        visit_block = compiler.visit_block_stmt
+
+        def visit_block_stmt(stmt: Block) -> StmtFn:
+            # an empty block has no body to compile
+            if stmt.statements:
+                pending.append((None, stmt.base < 0))
+            return visit_block(stmt)
+
+        sequence = compiler._sequence
+
+        def _sequence(statements: List[Stmt]) -> StmtFn:
+            (function, own_env) = pending.pop() if pending else (None, True)
+            body = sequence(statements)
+            if not own_env:
+                return body
+
+            def counted_sequence(env: Environment) -> object:
+                if function is not None:
+                    self.calls[function] += 1
+                self.environments += 1
+                value = body(env)
+                if value is not NORMAL:
+                    self.early_exits += 1
+                return value
+
+            return counted_sequence
+
+        chain = compiler._chain
+
+        def _chain(nodes: List[Union[Binary, Logical]]) -> ExprFn:
+            # a long chain runs as one loop, without a closure per operator
+            compiled = chain(nodes)
+            kinds = collections.Counter(type(node).__name__ for node in nodes)
+
+            def counted_chain(env: Environment) -> object:
+                executed.update(kinds)
+                return compiled(env)
+
+            return counted_chain
+
+        compiler.visit_function_stmt = visit_function_stmt  # type: ignore
+        compiler.visit_block_stmt = visit_block_stmt  # type: ignore
+        compiler._chain = _chain  # type: ignore
+        compiler._sequence = _sequence  # type: ignore
+        bind_dispatch(compiler)
+
+    def _install_vm(self, vm: VM) -> None:
+        compile = vm._compile
+
+        def _compile(statements: List[Stmt]) -> VMFunction:
+            function = compile(statements)
+            self._instrument_function(function, CallTracker())
+            return function
+
+        vm._compile = _compile  # type: ignore
+
+    def _instrument_function(
+        self, function: VMFunction, tracker: CallTracker
+    ) -> None:
+        chunk = function.chunk
+        if isinstance(chunk.code, CountingCode):
+            return
+
+        chunk.code = CountingCode(  # type: ignore
+            chunk, function.name, self, tracker
+        )
+
+        # nested functions live in the constant pool
+        for constant in chunk.constants:
+            if isinstance(constant, VMFunction):
+                self._instrument_function(constant, tracker)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "executed": dict(self.executed.most_common()),
+            "calls": dict(self.calls.most_common()),
+            "environments": self.environments,
+            "early_exits": self.early_exits,
+        }
+
+    def report(self, file: TextIO, format: str = "table") -> None:
+        if format == "json":
+            json.dump(self.as_dict(), file, indent=2)
+            print(file=file)
+            return
+
+        print(f"{'executed':24}{'count':>12}", file=file)
+        for (name, count) in self.executed.most_common():
+            print(f"{name:24}{count:>12}", file=file)
+
+        print(f"\n{'calls':24}{'count':>12}", file=file)
+        for (name, count) in self.calls.most_common():
+            print(f"{name:24}{count:>12}", file=file)
+
+        print(f"\n{'environments':24}{self.environments:>12}", file=file)
+        print(f"{'early exits':24}{self.early_exits:>12}", file=file)
+
+
+def bind_dispatch(visitor: object) -> None:
+    """
+    Give `visitor` its own dispatch tables, calling the visit methods set on
+    the instance. The class tables would skip them.
+    """
+
+    def through(visit: Callable[[object], object]) -> Callable:
+        return lambda _visitor, node: visit(node)
+
+    visitor._expr_table = tuple(  # type: ignore
+        through(getattr(visitor, name)) for name in EXPR_VISITORS
+    )
+    visitor._stmt_table = tuple(  # type: ignore
+        through(getattr(visitor, name)) for name in STMT_VISITORS
+    )
+
+
+def counted_visit(
+    executed: Counter[str], visit: Callable[[object], object]
+) -> Callable[[object], object]:
+    """Wrap an interpreter visitor to count the nodes it runs"""
+
+    def counted(node: object) -> object:
+        executed[type(node).__name__] += 1
+        return visit(node)
+
+    return counted
+
+
+def counted_compile(
+    executed: Counter[str], visit: Callable[[object], Callable]
+) -> Callable[[object], Callable]:
+    """
+    Wrap a closure compiler visitor so that the closure it compiles counts
+    each time it runs
+    """
+
+    def counted(node: object) -> Callable:
+        compiled = visit(node)
+        kind = type(node).__name__
+
+        def counted_run(env: Environment) -> object:
+            executed[kind] += 1
+            return compiled(env)
+
+        return counted_run
+
+    return counted
+
+
+class CallTracker:
+    """
+    Opcode read last by the instrumented VM. An instruction at offset 0 read
+    right after a CALL is the start of a call, rather than a loop that jumped
+    back to the start of the function.
+
+    :param int last: last opcode read
+    """
+
+    __slots__ = ("last",)
+
+    last: int
+
+    def __init__(self) -> None:
+        self.last = -1
+
+
+class CountingCode:
+    """
+    Stand-in for a chunk's code array that counts the instructions the VM
+    reads from it. Operand bytes are read through it too, so it records
+    which offsets hold opcodes.
+
+    :param array code: the original code
+    :param List[Optional[str]] opcodes: name of the opcode starting at each
+    offset, None for operand bytes
+    """
+
+    __slots__ = ("code", "opcodes", "function", "instrumentation", "tracker")
+
+    code: array
+    opcodes: List[Optional[str]]
+    function: str
+    instrumentation: Instrumentation
+    tracker: CallTracker
+
+    def __init__(
+        self,
+        chunk: Chunk,
+        function: Optional[str],
+        instrumentation: Instrumentation,
+        tracker: CallTracker,
+    ) -> None:
+        self.code = chunk.code
+        self.function = "<script>" if function is None else function
+        self.instrumentation = instrumentation
+        self.tracker = tracker
+
+        self.opcodes = [None] * len(chunk.code)
+        offset = 0
+        while offset < len(chunk.code):
+            self.opcodes[offset] = OpCode(chunk.code[offset]).name
+            offset += instruction_size(chunk, offset)
+
+    def __getitem__(self, offset: int) -> int:
+        byte = self.code[offset]
+        name = self.opcodes[offset]
+
+        if name is not None:
+            self.instrumentation.executed[name] += 1
+            if offset == 0 and self.tracker.last == OpCode.CALL:
+                self.instrumentation.calls[self.function] += 1
+            self.tracker.last = byte
+
+        return byte
+
+    def __len__(self) -> int:
+        return len(self.code)
@@ -1,5 +1,7 @@
 from __future__ import annotations
-from typing import List, Dict
+import math
+import sys
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from .syntax.expr import (
     Expr,
@@ -12,6 +14,9 @@ from .syntax.expr import (
     Literal,
     Variable,
     Grouping,
+    Array,
+    Index,
+    SetIndex,
 )
 from .syntax.stmt import (
     Stmt,
@@ -25,33 +30,58 @@ from .syntax.stmt import (
     While,
     Block,
 )
-from .lox_objects import LoxCallable, LoxFunction, builtin
+from .lox_objects import LoxArray, LoxCallable, LoxFunction, LoxMap, builtin
+from .lox_objects.lox_array import get_index, set_index
+from .lox_objects.lox_rope import concat, is_string
 from .token import Token, TokenType
-from .error import LoxRuntimeError, LoxReturn, ThrowRuntimeError
-from .environment import Environment
+from . import config
+from .error import LoxRuntimeError, NativeError, ThrowRuntimeError
+from .environment import (
+    CELL,
+    GLOBAL,
+    Cell,
+    Environment,
+    GlobalEnvironment,
+    UNDEFINED,
+)
+
+
+# Completion value of a statement that did not execute a `return`. Executing
+# a statement produces either this or the value being returned, so returns
+# unwind through the visitors without raising an exception.
+NORMAL = object()
+
+# Python frames a Lox call may take on the tree walking engines, which
+# recurse on the Python stack. Generous, since nested statements and
+# expressions in a function body add frames to each call.
+PYTHON_FRAMES_PER_CALL = 32
+
+# nodes evaluated by walking down their left operands in a loop
+CHAIN_NODES = (Binary, Logical)
 
 
-# TODO change `object` to be a better version of the java `Void` type
-class Interpreter(ExprVisitor[object], StmtVisitor[None]):
+class Interpreter(ExprVisitor[object], StmtVisitor[object]):
     """
     Interpreter
 
-    :param Environment globals:
+    :param GlobalEnvironment globals:
     :param Environment environment:
-    :param Dict[Expr, int] locals:
     """
 
-    globals: Environment
+    globals: GlobalEnvironment
     environment: Environment
-    locals: Dict[Expr, int]
 
     def __init__(self) -> None:
-        self.globals = Environment()
-        self.environment = Environment()
-        # self.environment = self.globals
-        self.locals = {}
+        self.globals = GlobalEnvironment()
+        self.environment = self.globals
 
-        self.globals.define("clock", builtin.Clock())
+        # allow as deep a Lox call stack as the VM does
+        limit = config.FRAMES_MAX * PYTHON_FRAMES_PER_CALL
+        if sys.getrecursionlimit() < limit:
+            sys.setrecursionlimit(limit)
+
+        for (name, native) in builtin.NATIVES.items():
+            self.globals.define(name, native)
 
     def interpret(self, statements: List[Stmt]) -> None:
         try:
@@ -60,106 +90,136 @@ class Interpreter(ExprVisitor[object], StmtVisitor[None]):
         except LoxRuntimeError as err:
             ThrowRuntimeError(err)
 
-    def resolve(self, expression: Expr, depth: int) -> None:
-        self.locals[expression] = depth
+    def call_value(self, callee: object, arguments: List[object]) -> object:
+        """Call a Lox value from a native function"""
+        if not isinstance(callee, LoxCallable):
+            raise NativeError("Can only call functions and classes")
+
+        fn_arity = callee.arity()
+        if len(arguments) != fn_arity:
+            raise NativeError(
+                f"Expected {fn_arity} arguments but got {len(arguments)}."
+            )
+
+        return callee.call(self, arguments)
 
     def _evaluate(self, expression: Expr) -> object:
         """Visit `expression`"""
-        return expression.accept(self)
+        return self._expr_table[expression.kind](self, expression)
 
-    def _execute(self, statement: Stmt) -> None:
-        """Visit `statement`"""
-        statement.accept(self)
+    def _execute(self, statement: Stmt) -> object:
+        """Visit `statement`, returning its completion value"""
+        return self._stmt_table[statement.kind](self, statement)
 
     def _execute_block(
         self, statements: List[Stmt], execution_env: Environment
-    ) -> None:
+    ) -> object:
+        """
+        Execute `statements` in `execution_env`. Stops at the first `return`
+        and gives back its value, otherwise returns `NORMAL`.
+        """
         previous_env: Environment = self.environment
+        stmt_table = self._stmt_table
         try:
             self.environment = execution_env
             for s in statements:
-                self._execute(s)
+                value = stmt_table[s.kind](self, s)
+                if value is not NORMAL:
+                    return value
+            return NORMAL
         finally:
             self.environment = previous_env
 
-    def _look_up_variable(self, name: Token, expression: Expr) -> object:
-        try:
-            depth: int = self.locals[expression]
-            return self.environment.get_at(depth, name.lexeme)
-        except KeyError:
-            return self.globals.get(name)
+    def _execute_body(
+        self, statements: List[Stmt], execution_env: Environment
+    ) -> object:
+        """
+        Execute a function body in `execution_env`, returning the value of its
+        `return` statement or nil
+        """
+        value = self._execute_block(statements, execution_env)
+        return None if value is NORMAL else value
+
+    def _look_up_variable(self, expr: Variable) -> object:
+        (depth, slot) = (expr.depth, expr.slot)
+        if depth == 0:
+            return self.environment.values[slot]
+        elif depth > 0:
+            return self.environment.get_at(depth, slot)
+        elif depth != GLOBAL:
+            return self.environment.get_at(CELL - depth, slot).value
+
+        if slot < 0:
+            slot = expr.slot = self.globals.slot(expr.name.lexeme)
+        value = self.globals.values[slot]
+        if value is UNDEFINED:
+            return self.globals.get(expr.name, slot)
+        return value
 
     def visit_assign_expr(self, expr: Assign) -> object:
         value: object = self._evaluate(expr.value)
-
-        try:
-            depth: int = self.locals[expr]
-            self.environment.assign_at(depth, expr.name, value)
-        except KeyError:
-            self.globals.assign(expr.name, value)
+        depth = expr.depth
+
+        if depth == 0:
+            self.environment.values[expr.slot] = value
+        elif depth > 0:
+            self.environment.assign_at(depth, expr.slot, value)
+        elif depth != GLOBAL:
+            self.environment.get_at(CELL - depth, expr.slot).value = value
+        else:
+            if expr.slot < 0:
+                expr.slot = self.globals.slot(expr.name.lexeme)
+            self.globals.assign(expr.name, expr.slot, value)
 
         return value
 
     def visit_logical_expr(self, expr: Logical) -> object:
-        left = self._evaluate(expr.left)
-        left_true = is_truthy(left)
+        if type(expr.left) in CHAIN_NODES:
+            return self._evaluate_chain(expr)
 
-        if expr.operator.type == TokenType.OR:
-            if left_true:
-                return left
-        else:
-            if not left_true:
-                return left
+        left = self._evaluate(expr.left)
+        if is_truthy(left) == (expr.operator.type == TokenType.OR):
+            return left
 
         return self._evaluate(expr.right)
 
     def visit_binary_expr(self, expr: Binary) -> object:
+        if type(expr.left) in CHAIN_NODES:
+            return self._evaluate_chain(expr)
+
         left = self._evaluate(expr.left)
         right = self._evaluate(expr.right)
+        operator = expr.operator
+        operation = BINARY_OPERATIONS[operator.type]
+        return operation(operator, left, right)  # type: ignore
+
+    def _evaluate_chain(self, expr: Union[Binary, Logical]) -> object:
+        """
+        Evaluate a chain of binary and logical operators nested through
+        their left operands, such as `a + b + c + ...`, with an explicit
+        stack. The parser builds a long chain of left associative operators
+        into a tree as deep as the chain is long, which would otherwise
+        take that many Python frames to evaluate.
+        """
+        chain = operator_chain(expr)
+        value = self._evaluate(chain[-1].left)
+
+        for node in reversed(chain):
+            if type(node) is Binary:
+                right = self._evaluate(node.right)
+                operator = node.operator
+                operation = BINARY_OPERATIONS[operator.type]
+                value = operation(operator, value, right)  # type: ignore
+            elif is_truthy(value) != (node.operator.type == TokenType.OR):
+                # a logical operator that doesn't short circuit
+                value = self._evaluate(node.right)
 
-        if expr.operator.type == TokenType.BANG_EQUAL:
-            return left != right
-        elif expr.operator.type == TokenType.EQUAL_EQUAL:
-            return left == right
-        elif expr.operator.type == TokenType.GREATER:
-            check_number_operands(expr.operator, left, right)
-            return float(left) > float(right)
-        elif expr.operator.type == TokenType.GREATER_EQUAL:
-            check_number_operands(expr.operator, left, right)
-            return float(left) >= float(right)
-        elif expr.operator.type == TokenType.LESS:
-            check_number_operands(expr.operator, left, right)
-            return float(left) < float(right)
-        elif expr.operator.type == TokenType.LESS_EQUAL:
-            check_number_operands(expr.operator, left, right)
-            return float(left) <= float(right)
-        elif expr.operator.type == TokenType.MINUS:
-            check_number_operands(expr.operator, left, right)
-            return float(left) - float(right)
-        elif expr.operator.type == TokenType.PLUS:
-            if isinstance(left, float) and isinstance(right, float):
-                return float(left) + float(right)
-            elif isinstance(left, str) and isinstance(right, str):
-                return str(left) + str(right)
-            else:
-                raise LoxRuntimeError(
-                    expr.operator, "Operands must both be numbers or strings"
-                )
-        elif expr.operator.type == TokenType.SLASH:
-            check_number_operands(expr.operator, left, right)
-            return float(left) / float(right)
-        elif expr.operator.type == TokenType.STAR:
-            check_number_operands(expr.operator, left, right)
-            return float(left) * float(right)
+        return value
 
     def visit_unary_expr(self, expr: Unary) -> object:
         right: object = self._evaluate(expr.right)
-
-        if expr.operator.type == TokenType.MINUS:
-            check_number_operands(expr.operator, right)
-            return -1 * float(right)
-        elif expr.operator.type == TokenType.BANG:
-            return not is_truthy(right)
+        operator = expr.operator
+        return UNARY_OPERATIONS[operator.type](operator, right)  # type: ignore
 
     def visit_call_expr(self, expr: Call) -> object:
         callee: object = self._evaluate(expr.callee)
@@ -168,15 +228,18 @@ class Interpreter(ExprVisitor[object], StmtVisitor[None]):
             self._evaluate(arg) for arg in expr.arguments
         ]
 
-        if not isinstance(callee, LoxCallable):
+        if type(callee) is LoxFunction:
+            # skip the generic protocol for the common case. The argument
+            # list becomes the parameter slots of the call environment.
+            fn_arity = callee.num_params
+        elif isinstance(callee, LoxCallable):
+            fn_arity = callee.arity()
+        else:
             raise LoxRuntimeError(
                 expr.paren, "Can only call functions and classes"
             )
 
-        function: LoxCallable = callee
-
-        len_args = len(arguments)
-        fn_arity = function.arity()
+        len_args = len(expr.arguments)
 
         if len_args != fn_arity:
             raise LoxRuntimeError(
@@ -184,57 +247,141 @@ class Interpreter(ExprVisitor[object], StmtVisitor[None]):
                 f"Expected {fn_arity} arguments but got {len_args}.",
             )
 
-        return function.call(self, arguments)
+        try:
+            return callee.call(self, arguments)
+        except NativeError as err:
+            raise LoxRuntimeError(expr.paren, err.message)
+        except RecursionError:
+            # Lox recursion too deep for the Python stack
+            raise LoxRuntimeError(expr.paren, "Stack overflow.")
 
     def visit_literal_expr(self, expr: Literal) -> object:
         return expr.value
 
     def visit_variable_expr(self, expr: Variable) -> object:
-        return self._look_up_variable(expr.name, expr)
+        return self._look_up_variable(expr)
 
     def visit_grouping_expr(self, expr: Grouping) -> object:
         return self._evaluate(expr.expression)
 
-    def visit_function_stmt(self, stmt: Function) -> None:
-        function: LoxFunction = LoxFunction(stmt, self.environment)
-        self.environment.define(stmt.name.lexeme, function)
+    def visit_array_expr(self, expr: Array) -> object:
+        return LoxArray.of([self._evaluate(e) for e in expr.elements])
+
+    def visit_index_expr(self, expr: Index) -> object:
+        target = self._evaluate(expr.target)
+        index = self._evaluate(expr.index)
 
-        return None
+        try:
+            return get_index(target, index)
+        except NativeError as err:
+            raise LoxRuntimeError(expr.bracket, err.message)
+
+    def visit_setindex_expr(self, expr: SetIndex) -> object:
+        target = self._evaluate(expr.target)
+        index = self._evaluate(expr.index)
+        value = self._evaluate(expr.value)
 
-    def visit_var_stmt(self, stmt: Var) -> None:
+        try:
+            set_index(target, index, value)
+        except NativeError as err:
+            raise LoxRuntimeError(expr.bracket, err.message)
+
+        return value
+
+    def visit_function_stmt(self, stmt: Function) -> object:
+        if not stmt.captured:
+            function = LoxFunction(stmt, self._closure(stmt))
+            self.environment.define(stmt.name.lexeme, function)
+            return NORMAL
+
+        # define the cell first, as the function may capture itself
+        cell = Cell(None)
+        self.environment.define(stmt.name.lexeme, cell)
+        cell.value = LoxFunction(stmt, self._closure(stmt))
+        return NORMAL
+
+    def _closure(self, stmt: Function) -> Environment:
+        """Collect the cells `stmt` captures from the current environment"""
+        env = self.environment
+        cells = [env.get_at(depth, slot) for (depth, slot) in stmt.upvalues]
+        return Environment(None, cells)
+
+    def visit_var_stmt(self, stmt: Var) -> object:
         value = None
         if stmt.initializer is not None:
             value = self._evaluate(stmt.initializer)
 
+        if stmt.captured:
+            value = Cell(value)
+
         self.environment.define(stmt.name.lexeme, value)
+        return NORMAL
 
-    def visit_expression_stmt(self, stmt: Expression) -> None:
+    def visit_expression_stmt(self, stmt: Expression) -> object:
         self._evaluate(stmt.expression)
+        return NORMAL
 
-    def visit_if_stmt(self, stmt: If) -> None:
+    def visit_if_stmt(self, stmt: If) -> object:
         if is_truthy(self._evaluate(stmt.condition)):
-            self._execute(stmt.branch_true)
+            return self._execute(stmt.branch_true)
         elif stmt.branch_false is not None:
-            self._execute(stmt.branch_false)
+            return self._execute(stmt.branch_false)
 
-    def visit_print_stmt(self, stmt: Print) -> None:
+        return NORMAL
+
+    def visit_print_stmt(self, stmt: Print) -> object:
         value = self._evaluate(stmt.expression)
         print(stringify(value))
+        return NORMAL
 
-    def visit_return_stmt(self, stmt: Return) -> None:
+    def visit_return_stmt(self, stmt: Return) -> object:
         value: object = None
         if stmt.value is not None:
             value = self._evaluate(stmt.value)
 
-        raise LoxReturn(value)
+        return value
 
-    def visit_while_stmt(self, stmt: While) -> None:
+    def visit_while_stmt(self, stmt: While) -> object:
         while is_truthy(self._evaluate(stmt.condition)):
-            self._execute(stmt.body)
+            value = self._execute(stmt.body)
+            if value is not NORMAL:
+                return value
 
-    def visit_block_stmt(self, stmt: Block) -> None:
-        self._execute_block(stmt.statements, Environment(self.environment))
-        return None
+        return NORMAL
+
+    def visit_block_stmt(self, stmt: Block) -> object:
+        base = stmt.base
+        if base < 0:
+            return self._execute_block(
+                stmt.statements, Environment(self.environment)
+            )
+
+        # the block's variables go in the current environment, and are
+        # dropped once it ends. A `return` drops the whole environment.
+        stmt_table = self._stmt_table
+        for s in stmt.statements:
+            value = stmt_table[s.kind](self, s)
+            if value is not NORMAL:
+                return value
+
+        del self.environment.values[base:]
+        return NORMAL
+
+
+def operator_chain(
+    expr: Union[Binary, Logical]
+) -> List[Union[Binary, Logical]]:
+    """
+    List the binary and logical operators nested through the left operands
+    of `expr`, starting with `expr` itself
+    """
+    chain: List[Union[Binary, Logical]] = []
+    node: Expr = expr
+    while type(node) in CHAIN_NODES:
+        chain.append(node)  # type: ignore
+        node = node.left  # type: ignore
+
+    return chain
 
 
 def is_truthy(obj: object) -> bool:
@@ -246,22 +393,138 @@ def is_truthy(obj: object) -> bool:
         return True
 
 
-def check_number_operands(operator: Token, *operands: object) -> None:
-    if all([isinstance(op, float) for op in operands]):
-        return
+# Operators, as functions of the operator token and the evaluated operands.
+# Each checks for the operand types it expects first, and only works out
+# which error to raise once that fails.
+BinaryOperation = Callable[[Token, object, object], object]
+UnaryOperation = Callable[[Token, object], object]
+
+
+def not_equal(operator: Token, left: object, right: object) -> object:
+    return left != right
+
+
+def equal(operator: Token, left: object, right: object) -> object:
+    return left == right
+
+
+def greater(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left > right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def greater_equal(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left >= right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
 
-    raise LoxRuntimeError(
-        operator, f"Operand{'s' if len(operands) > 1 else ''} must be a number"
-    )
+def less(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left < right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def less_equal(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left <= right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def add(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left + right  # type: ignore
+    elif is_string(left) and is_string(right):
+        return concat(left, right)  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must both be numbers or strings")
+
+
+def subtract(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left - right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def multiply(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        return left * right  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def divide(operator: Token, left: object, right: object) -> object:
+    if type(left) is float and type(right) is float:
+        try:
+            return left / right  # type: ignore
+        except ZeroDivisionError:
+            return divide_by_zero(left, right)  # type: ignore
+    raise LoxRuntimeError(operator, "Operands must be a number")
+
+
+def divide_by_zero(dividend: float, divisor: float) -> float:
+    """
+    Divide by a zero `divisor` as IEEE 754 does, which Python refuses to:
+    nan for 0 / 0, otherwise an infinity with the sign of the result
+    """
+    if dividend == 0 or math.isnan(dividend):
+        return math.nan
+    return math.copysign(math.inf, dividend) * math.copysign(1.0, divisor)
+
+
+def negate(operator: Token, right: object) -> object:
+    if type(right) is float:
+        return -right  # type: ignore
+    raise LoxRuntimeError(operator, "Operand must be a number")
+
+
+def bang(operator: Token, right: object) -> object:
+    return right is None or right is False
+
+
+def operation_table(
+    operations: Dict[int, Callable[..., object]]
+) -> Tuple[Optional[Callable[..., object]], ...]:
+    """Lay out `operations` in a tuple indexed by token type"""
+    return tuple(operations.get(kind) for kind in range(max(operations) + 1))
+
+
+# the operation of each binary and unary operator, by token type
+BINARY_OPERATIONS: Tuple[Optional[BinaryOperation], ...] = operation_table(
+    {
+        TokenType.BANG_EQUAL: not_equal,
+        TokenType.EQUAL_EQUAL: equal,
+        TokenType.GREATER: greater,
+        TokenType.GREATER_EQUAL: greater_equal,
+        TokenType.LESS: less,
+        TokenType.LESS_EQUAL: less_equal,
+        TokenType.PLUS: add,
+        TokenType.MINUS: subtract,
+        TokenType.STAR: multiply,
+        TokenType.SLASH: divide,
+    }
+)
+UNARY_OPERATIONS: Tuple[Optional[UnaryOperation], ...] = operation_table(
+    {TokenType.MINUS: negate, TokenType.BANG: bang}
+)
 
 
 def stringify(obj: object):
     if obj is None:
         return "nil"
+    elif isinstance(obj, bool):
+        return "true" if obj else "false"
     elif isinstance(obj, float):
         text: str = str(obj)
         # handle case where we have a Lox integer
         # don't want to print the trailing ".0"
         return text[:-2] if text.endswith(".0") else text
+    elif isinstance(obj, LoxArray):
+        return "[" + ", ".join(stringify(item) for item in obj.items) + "]"
+    elif isinstance(obj, LoxMap):
+        entries = (
+            f"{stringify(key)}: {stringify(value)}"
+            for (key, value) in zip(obj.keys(), obj.values())
+        )
+        return "{" + ", ".join(entries) + "}"
     else:
         return str(obj)
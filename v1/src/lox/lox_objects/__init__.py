@@ -1,2 +1,5 @@
 from .lox_callable import LoxCallable
 from .lox_function import LoxFunction
+from .lox_array import LoxArray
+from .lox_map import LoxMap
+from .lox_rope import LoxRope
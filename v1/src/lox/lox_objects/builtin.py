@@ -1,13 +1,23 @@
 from __future__ import annotations
 
-from datetime import time
-from typing import List
+from array import array
+from time import time
+from typing import Dict, List
 
 from . import LoxCallable
+from .lox_array import LoxArray
+from .lox_map import LoxMap
+from .lox_rope import LoxRope
 from lox import interpreter
+from lox.error import NativeError
 
 
-class Clock(LoxCallable):
+class Native(LoxCallable):
+    def __str__(self) -> str:
+        return "<native function>"
+
+
+class Clock(Native):
     def arity(self) -> int:
         return 0
 
@@ -16,5 +26,259 @@ class Clock(LoxCallable):
     ) -> object:
         return time()
 
-    def __str__(self) -> str:
-        return "<native function>"
+
+class Len(Native):
+    """
+    len(value): number of elements of an array, entries of a map, or
+    characters of a string
+    """
+
+    def arity(self) -> int:
+        return 1
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        value = arguments[0]
+        if type(value) not in (LoxArray, LoxMap, str, LoxRope):
+            raise NativeError(
+                "Can only take the length of arrays, maps and strings"
+            )
+
+        return float(len(value))  # type: ignore
+
+
+class Push(Native):
+    """push(array, value): append `value` to `array`"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        to_array(arguments[0]).append(arguments[1])
+        return None
+
+
+class Pop(Native):
+    """pop(array): remove and return the last element of `array`"""
+
+    def arity(self) -> int:
+        return 1
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        target = to_array(arguments[0])
+        if not target.items:
+            raise NativeError("Can't pop from an empty array")
+
+        return target.items.pop()
+
+
+class Sum(Native):
+    """sum(array): total of an array of numbers"""
+
+    def arity(self) -> int:
+        return 1
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        items = to_array(arguments[0]).items
+        if type(items) is not array and not all(
+            type(item) is float for item in items
+        ):
+            raise NativeError("Can only sum arrays of numbers")
+
+        return float(sum(items))  # type: ignore
+
+
+class Range(Native):
+    """range(start, end): array of the integers from `start` to `end - 1`"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        (start, end) = (to_int(arguments[0]), to_int(arguments[1]))
+        return LoxArray(array("d", range(start, end)))
+
+
+class Map(Native):
+    """map(array, function): new array of `function` applied to each element"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        items = to_array(arguments[0]).items
+        function = arguments[1]
+        call_value = interpreter.call_value
+
+        return LoxArray.of([call_value(function, [item]) for item in items])
+
+
+class Fill(Native):
+    """fill(array, value): set every element of `array` to `value`"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        target = to_array(arguments[0])
+        value = arguments[1]
+        target.items = LoxArray.of([value]).items * len(target.items)
+        return None
+
+
+class Slice(Native):
+    """slice(array, start, end): new array of the elements from `start` to
+    `end - 1`"""
+
+    def arity(self) -> int:
+        return 3
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        target = to_array(arguments[0])
+        (start, end) = (to_int(arguments[1]), to_int(arguments[2]))
+        if not 0 <= start <= end <= len(target.items):
+            raise NativeError(f"Slice {start}:{end} out of range")
+
+        return LoxArray(target.items[start:end])
+
+
+class HashMap(Native):
+    """hashmap(): new empty map"""
+
+    def arity(self) -> int:
+        return 0
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return LoxMap()
+
+
+class Get(Native):
+    """get(map, key): value stored for `key`, or nil if there is none"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return to_map(arguments[0]).get(arguments[1])
+
+
+class Set(Native):
+    """set(map, key, value): store `value` for `key`"""
+
+    def arity(self) -> int:
+        return 3
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        to_map(arguments[0]).set(arguments[1], arguments[2])
+        return None
+
+
+class Has(Native):
+    """has(map, key): whether a value is stored for `key`"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return to_map(arguments[0]).has(arguments[1])
+
+
+class Delete(Native):
+    """delete(map, key): remove `key`, returning whether it was there"""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return to_map(arguments[0]).delete(arguments[1])
+
+
+class Keys(Native):
+    """keys(map): array of the keys of `map`, in insertion order"""
+
+    def arity(self) -> int:
+        return 1
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return LoxArray.of(to_map(arguments[0]).keys())
+
+
+class Values(Native):
+    """values(map): array of the values of `map`, in insertion order"""
+
+    def arity(self) -> int:
+        return 1
+
+    def call(
+        self, interpreter: interpreter.Interpreter, arguments: List[object]
+    ) -> object:
+        return LoxArray.of(to_map(arguments[0]).values())
+
+
+# natives every engine defines as globals
+NATIVES: Dict[str, LoxCallable] = {
+    "clock": Clock(),
+    "len": Len(),
+    "push": Push(),
+    "pop": Pop(),
+    "sum": Sum(),
+    "range": Range(),
+    "map": Map(),
+    "fill": Fill(),
+    "slice": Slice(),
+    "hashmap": HashMap(),
+    "get": Get(),
+    "set": Set(),
+    "has": Has(),
+    "delete": Delete(),
+    "keys": Keys(),
+    "values": Values(),
+}
+
+
+def to_array(value: object) -> LoxArray:
+    if type(value) is not LoxArray:
+        raise NativeError("Expected an array")
+
+    return value  # type: ignore
+
+
+def to_map(value: object) -> LoxMap:
+    if type(value) is not LoxMap:
+        raise NativeError("Expected a map")
+
+    return value  # type: ignore
+
+
+def to_int(value: object) -> int:
+    if type(value) is not float or not value.is_integer():  # type: ignore
+        raise NativeError("Expected an integer")
+
+    return int(value)  # type: ignore
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from array import array
+from typing import Iterable, List, Union
+
+from lox.error import NativeError
+
+
+class LoxArray:
+    """
+    Growable Lox array. While every element is a number, the elements are
+    stored unboxed in an `array("d")`. Storing anything else switches the
+    array to a plain list for good.
+
+    :param Union[array, List[object]] items: elements
+    """
+
+    __slots__ = ("items",)
+
+    items: Union[array, List[object]]
+
+    def __init__(self, items: Union[array, List[object]]) -> None:
+        self.items = items
+
+    @classmethod
+    def of(cls, elements: Iterable[object]) -> LoxArray:
+        """Create an array holding `elements`, numeric if possible"""
+        items = list(elements)
+        if all(type(item) is float for item in items):
+            return cls(array("d", items))  # type: ignore
+
+        return cls(items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _offset(self, index: object) -> int:
+        if type(index) is not float or not index.is_integer():  # type: ignore
+            raise NativeError("Array index must be an integer")
+
+        offset = int(index)  # type: ignore
+        if not 0 <= offset < len(self.items):
+            raise NativeError(f"Array index {offset} out of range")
+
+        return offset
+
+    def get(self, index: object) -> object:
+        return self.items[self._offset(index)]
+
+    def set(self, index: object, value: object) -> None:
+        offset = self._offset(index)
+        self._allow(value)
+        self.items[offset] = value  # type: ignore
+
+    def append(self, value: object) -> None:
+        self._allow(value)
+        self.items.append(value)  # type: ignore
+
+    def _allow(self, value: object) -> None:
+        """Make sure `value` can be stored in `items`"""
+        if type(value) is not float and type(self.items) is array:
+            self.items = list(self.items)
+
+
+def get_index(target: object, index: object) -> object:
+    if type(target) is not LoxArray:
+        raise NativeError("Only arrays can be indexed")
+
+    return target.get(index)  # type: ignore
+
+
+def set_index(target: object, index: object, value: object) -> None:
+    if type(target) is not LoxArray:
+        raise NativeError("Only arrays can be indexed")
+
+    target.set(index, value)  # type: ignore
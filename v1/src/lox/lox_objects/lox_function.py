@@ -1,43 +1,44 @@
 from __future__ import annotations
-import copy
 from typing import List
 
 from lox import interpreter
-from lox.error import LoxReturn
-from lox.environment import Environment
+from lox.environment import Cell, Environment
 from lox.lox_objects import LoxCallable
 from lox.syntax import stmt
 
 
 class LoxFunction(LoxCallable):
+    """
+    Lox function value
+
+    :param stmt.Function declaration: function statement this was created
+    from
+    :param Environment closure: the cells the function captures, in the
+    order of `declaration.upvalues`
+    :param int num_params:
+    """
+
     declaration: stmt.Function
     closure: Environment
+    num_params: int
 
     def __init__(self, declaration: stmt.Function, closure: Environment) -> None:
         self.declaration = declaration
-        # TODO should this be a deepcopy
         self.closure = closure
+        self.num_params = len(declaration.params)
 
     def arity(self) -> int:
-        return len(self.declaration.params)
+        return self.num_params
 
     def call(
         self, interpreter: interpreter.Interpreter, arguments: List[object]
     ) -> object:
-        # TODO should this be a deepcopy
-        environment: Environment = Environment(
-            self.closure
-        )
-
-        for (i, param) in enumerate(self.declaration.params):
-            environment.define(param.lexeme, arguments[i])
-
-        try:
-            interpreter._execute_block(self.declaration.body, environment)
-        except LoxReturn as ret:
-            return ret.value
+        # parameters take the first slots of the call environment, in order
+        for slot in self.declaration.captured_params:
+            arguments[slot] = Cell(arguments[slot])
+        environment: Environment = Environment(self.closure, arguments)
 
-        return None
+        return interpreter._execute_body(self.declaration.body, environment)
 
     def __str__(self) -> str:
         return f"<fn {self.declaration.name.lexeme}>"
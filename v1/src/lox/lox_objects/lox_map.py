@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import Dict, List
+
+from lox.error import NativeError
+from .lox_rope import LoxRope
+
+
+class BoolKey:
+    """
+    Stands in for a boolean key. Python treats `True` and `1.0` as the same
+    dict key, but Lox does not.
+
+    :param bool value: boolean this is the key for
+    """
+
+    __slots__ = ("value",)
+
+    value: bool
+
+    def __init__(self, value: bool) -> None:
+        self.value = value
+
+
+TRUE_KEY = BoolKey(True)
+FALSE_KEY = BoolKey(False)
+
+
+class LoxMap:
+    """
+    Lox hash map, backed by a dict. Keys are numbers, strings, booleans or
+    nil, which hash the same way for equal Lox values.
+
+    :param Dict[object, object] entries: values by key, with booleans
+    stored as `BoolKey`s
+    """
+
+    __slots__ = ("entries",)
+
+    entries: Dict[object, object]
+
+    def __init__(self) -> None:
+        self.entries = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: object) -> object:
+        return self.entries.get(to_key(key))
+
+    def set(self, key: object, value: object) -> None:
+        self.entries[to_key(key)] = value
+
+    def has(self, key: object) -> bool:
+        return to_key(key) in self.entries
+
+    def delete(self, key: object) -> bool:
+        """Remove `key`, returning whether it was there"""
+        return self.entries.pop(to_key(key), self) is not self
+
+    def keys(self) -> List[object]:
+        return [from_key(key) for key in self.entries]
+
+    def values(self) -> List[object]:
+        return list(self.entries.values())
+
+
+def to_key(value: object) -> object:
+    kind = type(value)
+    if kind is float or kind is str or value is None:
+        return value
+    elif kind is bool:
+        return TRUE_KEY if value else FALSE_KEY
+    elif kind is LoxRope:
+        return value.text()  # type: ignore
+
+    raise NativeError("Map keys must be numbers, strings, booleans or nil")
+
+
+def from_key(key: object) -> object:
+    return key.value if type(key) is BoolKey else key  # type: ignore
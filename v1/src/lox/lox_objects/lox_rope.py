@@ -0,0 +1,80 @@
+from __future__ import annotations
+from typing import List, Optional, Union
+
+
+# concatenations shorter than this are plain `str` additions, which are
+# cheaper than a rope when the copy is small
+ROPE_MIN = 128
+
+
+class LoxRope:
+    """
+    Lox string built by concatenation, kept as a list of parts until its
+    text is needed. Appending to a rope appends to its parts list, which is
+    shared with the rope being appended to, so building a string in a loop
+    is linear rather than quadratic. A rope only owns the first `count`
+    parts; if another rope already appended past them the list is copied.
+
+    Ropes compare, hash and print like the `str` they stand for.
+
+    :param List[str] parts: pieces of the text, possibly shared
+    :param int count: number of leading `parts` that make up this rope
+    :param int length: length of the text
+    :param Optional[str] flat: the joined text, once it has been needed
+    """
+
+    __slots__ = ("parts", "count", "length", "flat")
+
+    parts: List[str]
+    count: int
+    length: int
+    flat: Optional[str]
+
+    def __init__(self, parts: List[str], length: int) -> None:
+        self.parts = parts
+        self.count = len(parts)
+        self.length = length
+        self.flat = None
+
+    def text(self) -> str:
+        if self.flat is None:
+            self.flat = "".join(self.parts[: self.count])
+        return self.flat
+
+    def __str__(self) -> str:
+        return self.text()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is LoxRope:
+            other = other.text()  # type: ignore
+        return self.text() == other
+
+    def __hash__(self) -> int:
+        return hash(self.text())
+
+
+LoxString = Union[str, LoxRope]
+
+
+def is_string(value: object) -> bool:
+    return type(value) is str or type(value) is LoxRope
+
+
+def concat(left: LoxString, right: LoxString) -> LoxString:
+    """Concatenate two Lox strings"""
+    length = len(left) + len(right)
+    if type(left) is str:
+        if length < ROPE_MIN:
+            return left + str(right)
+        parts = [left]
+    else:
+        parts = left.parts  # type: ignore
+        if left.count != len(parts):  # type: ignore
+            # another rope has already been built on top of `left`
+            parts = parts[: left.count]  # type: ignore
+
+    parts.append(right if type(right) is str else right.text())  # type: ignore
+    return LoxRope(parts, length)  # type: ignore
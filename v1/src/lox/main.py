@@ -1,25 +1,67 @@
+import argparse
 import sys
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, TextIO, Union
 import readline
 
 from . import config
-from .scanner import Scanner
-from .parser import Parser
+from .error import LoxIncompleteInput
+from .scanner import Scanner, RegexScanner, ReplScanner, StreamScanner
+from .parser import Parser, ReplParser, StreamParser
 from .syntax.stmt import Stmt
 from .ast_printer import AstPrinter
 from .interpreter import Interpreter
+from .closure_compiler import ClosureInterpreter
 from .resolver import Resolver
+from .optimizer import Optimizer
+from .cache import CachedProgram, ProgramCache
+from .profiler import Profiler
+from .instrumentation import Instrumentation
+from .vm import VM
 
 
-def run(source: str, interpreter: Optional[Interpreter] = None) -> None:
+Engine = Union[Interpreter, VM]
+
+ENGINES: Dict[str, Callable[[], Engine]] = {
+    "tree": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VM,
+}
+
+SCANNERS: Dict[str, Callable[[str], Union[Scanner, RegexScanner]]] = {
+    "default": Scanner,
+    "regex": RegexScanner,
+}
+
+
+def run(
+    source: str,
+    interpreter: Optional[Engine] = None,
+    engine: str = "tree",
+    optimize: bool = False,
+    scanner: str = "default",
+    cache: Optional[ProgramCache] = None,
+) -> None:
     """
     Run a lox program from source
 
     :param str source: program source to run
-    :param Optional[Interpreter] interpreter: interpreter to use when running
+    :param Optional[Engine] interpreter: interpreter to use when running
+    :param str engine: key into `ENGINES`, used when no interpreter is given
+    :param bool optimize: run the `Optimizer` over the parsed program and
+    report how many nodes it removed on stderr
+    :param str scanner: key into `SCANNERS`
+    :param Optional[ProgramCache] cache: cache to load the front end output
+    from, or to store it in. Only valid with a fresh interpreter.
     """
-    scanner = Scanner(source)
-    tokens = scanner.scan_tokens()
+    if interpreter is None:
+        interpreter = ENGINES[engine]()
+
+    program = cache.load() if cache is not None else None
+    if program is not None:
+        run_cached(program, interpreter, optimize)
+        return
+
+    tokens = SCANNERS[scanner](source).scan_tokens()
 
     parser = Parser(tokens)
     statements: List[Stmt] = parser.parse()
@@ -32,54 +74,345 @@ def run(source: str, interpreter: Optional[Interpreter] = None) -> None:
 
     # AstPrinter().print(expression)
 
+    optimizer = Optimizer() if optimize else None
+    execute(statements, interpreter, optimizer, cache)
+
+    if optimizer is not None:
+        report_optimizer(optimizer)
+
+
+def run_stream(
+    file: TextIO,
+    engine: str = "tree",
+    optimize: bool = False,
+    interpreter: Optional[Engine] = None,
+) -> None:
+    """
+    Run a lox program while it is being read. Each top level declaration is
+    executed as soon as it has been parsed, so the source and AST of the
+    whole program are never held in memory at once. Unlike `run`, the
+    declarations before a syntax error have already run when it is found.
+
+    :param TextIO file: file to read the program from
+    :param str engine: key into `ENGINES`
+    :param bool optimize: optimize each declaration before running it
+    :param Optional[Engine] interpreter: interpreter to use, instead of a
+    new one for `engine`
+    """
     if interpreter is None:
-        interpreter = Interpreter()
+        interpreter = ENGINES[engine]()
+    optimizer = Optimizer() if optimize else None
+
+    for statement in StreamParser(StreamScanner(file)).declarations():
+        if config.had_error or config.had_runtime_error:
+            break
+
+        execute([statement], interpreter, optimizer)
+
+    if optimizer is not None:
+        report_optimizer(optimizer)
 
-    Resolver(interpreter).resolve(statements)
+
+def execute(
+    statements: List[Stmt],
+    interpreter: Engine,
+    optimizer: Optional[Optimizer] = None,
+    cache: Optional[ProgramCache] = None,
+    resolver: Optional[Resolver] = None,
+) -> None:
+    """
+    Optimize, resolve and run parsed statements
+
+    :param List[Stmt] statements: statements to run
+    :param Engine interpreter: interpreter to run them with
+    :param Optional[Optimizer] optimizer: optimizer to apply first, if any
+    :param Optional[ProgramCache] cache: cache to store the resolved
+    statements in before running them, if any
+    :param Optional[Resolver] resolver: resolver to use, instead of a new
+    one
+    """
+    if optimizer is not None:
+        # check the whole program first, since the optimizer drops dead code
+        # along with any errors in it. The optimized program is resolved
+        # again below, as removing code can move variables to other slots.
+        Resolver().resolve(statements)
+        if config.had_error:
+            return
+        statements = optimizer.optimize(statements)
+
+    # the VM compiler resolves variables itself
+    if isinstance(interpreter, Interpreter):
+        (resolver or Resolver()).resolve(statements)
+        if config.had_error:
+            return
+
+    if cache is not None:
+        removed = optimizer.removed if optimizer is not None else 0
+        cache.store(CachedProgram(statements, removed))
 
     interpreter.interpret(statements)
 
 
-def run_file(filename: str) -> None:
+def run_cached(
+    program: CachedProgram, interpreter: Engine, optimize: bool = False
+) -> None:
+    """
+    Run a program loaded from a `ProgramCache`, skipping the front end
+
+    :param CachedProgram program: program to run
+    :param Engine interpreter: interpreter to run it with
+    :param bool optimize: report the optimizer's result, as `run` would
+    """
+    interpreter.interpret(program.statements)
+
+    if optimize:
+        report_removed(program.removed)
+
+
+def report_optimizer(optimizer: Optimizer) -> None:
+    report_removed(optimizer.removed)
+
+
+def report_removed(removed: int) -> None:
+    print(f"[optimizer] removed {removed} nodes", file=sys.stderr)
+
+
+def run_file(
+    filename: str,
+    engine: str = "tree",
+    optimize: bool = False,
+    scanner: str = "default",
+    stream: bool = False,
+    use_cache: bool = True,
+    instrumentation: Optional[Instrumentation] = None,
+) -> None:
     """
     Run a lox program from a file
 
-    :param str filename: file to run
+    :param str filename: file to run, or "-" to read standard input
+    :param str engine: key into `ENGINES`
+    :param bool optimize: optimize the program before running it
+    :param str scanner: key into `SCANNERS`, ignored when streaming
+    :param bool stream: read and run the program incrementally with
+    `run_stream`
+    :param bool use_cache: load the resolved program from, and save it to,
+    a `ProgramCache` next to the script
+    :param Optional[Instrumentation] instrumentation: instrumentation to
+    install on the interpreter
     """
-    with open(filename, "r") as file:
-        contents = file.read()
-        run(contents)
+    interpreter = ENGINES[engine]()
+    if instrumentation is not None:
+        instrumentation.install(interpreter)
+
+    with (sys.stdin if filename == "-" else open(filename, "r")) as file:
+        if stream:
+            run_stream(file, optimize=optimize, interpreter=interpreter)
+        else:
+            contents = file.read()
+            cache = None
+            if use_cache and filename != "-":
+                cache = ProgramCache(filename, contents, engine, optimize)
+
+            run(
+                contents,
+                interpreter,
+                optimize=optimize,
+                scanner=scanner,
+                cache=cache,
+            )
+
         if config.had_error:
             sys.exit(65)
         if config.had_runtime_error:
             sys.exit(70)
 
 
-def run_prompt() -> None:
+def report_profile(profiler: Profiler, output: str) -> None:
+    profiler.stop()
+
+    with open(output, "w") as file:
+        profiler.write_collapsed(file)
+
+    profiler.report(sys.stderr)
+    print(f"[profile] collapsed stacks written to {output}", file=sys.stderr)
+
+
+class Session:
+    """
+    Front end state of an interactive session, kept across inputs. Only
+    the new input is scanned, parsed and resolved, so the cost of a line
+    doesn't grow with the number of declarations before it. Input that
+    ends partway through a declaration is buffered until a later line
+    completes it.
+
+    :param Engine interpreter: interpreter running every input
+    :param Resolver resolver: resolver shared by every input
+    :param Optional[Optimizer] optimizer: optimizer applied to each input
+    :param Dict[str, str] symbols: symbol table shared by every scanner
+    :param List[str] pending: lines of an unfinished declaration
+    """
+
+    interpreter: Engine
+    resolver: Resolver
+    optimizer: Optional[Optimizer]
+    symbols: Dict[str, str]
+    pending: List[str]
+
+    def __init__(self, engine: str = "tree", optimize: bool = False) -> None:
+        self.interpreter = ENGINES[engine]()
+        self.resolver = Resolver()
+        self.optimizer = Optimizer() if optimize else None
+        self.symbols = {}
+        self.pending = []
+
+    def feed(self, line: str) -> bool:
+        """
+        Run `line`, together with any buffered lines before it. A blank line
+        ends an unfinished declaration, reporting its errors.
+
+        :return: whether the input is unfinished and more lines are needed
+        """
+        if self.pending and not line.strip():
+            source = "\n".join(self.pending)
+            self.pending = []
+            tokens = Scanner(source, self.symbols).scan_tokens()
+            self._execute(Parser(tokens).parse())
+            return False
+
+        self.pending.append(line)
+        source = "\n".join(self.pending)
+
+        try:
+            tokens = ReplScanner(source, self.symbols).scan_tokens()
+            # don't wait for more input after a scan error was reported
+            parser = Parser(tokens) if config.had_error else ReplParser(tokens)
+            statements = parser.parse()
+        except LoxIncompleteInput:
+            if not config.had_error:
+                return True
+            statements = []
+
+        self.pending = []
+        self._execute(statements)
+        return False
+
+    def reset(self) -> None:
+        """Drop the buffered lines"""
+        self.pending = []
+
+    def _execute(self, statements: List[Stmt]) -> None:
+        if config.had_error:
+            return
+
+        removed = self.optimizer.removed if self.optimizer is not None else 0
+        execute(
+            statements, self.interpreter, self.optimizer, resolver=self.resolver
+        )
+
+        if self.optimizer is not None:
+            report_removed(self.optimizer.removed - removed)
+
+
+def run_prompt(engine: str = "tree", optimize: bool = False) -> None:
     """
     Launch a Lox REPL
+
+    :param str engine: key into `ENGINES`
+    :param bool optimize: optimize each input before running it
     """
     show_prompt = True
-    interpreter = Interpreter()
+    session = Session(engine, optimize)
 
     while show_prompt:
         try:
-            line = input("> ")
-            run(line, interpreter)
+            line = input("... " if session.pending else "> ")
+            session.feed(line)
         except EOFError:
             print("")
             show_prompt = False
         except KeyboardInterrupt:
             print("KeyboardInterrupt")
+            session.reset()
         finally:
             config.had_error = False
 
 
 def main() -> None:
-    if len(sys.argv) > 2:
-        print("Usage: lox.py [script]", file=sys.stderr)
-        sys.exit(64)
-    elif len(sys.argv) == 2:
-        run_file(sys.argv[1])
+    arg_parser = argparse.ArgumentParser(prog="lox")
+    arg_parser.add_argument("script", nargs="?")
+    arg_parser.add_argument(
+        "--engine",
+        choices=ENGINES.keys(),
+        default="tree",
+        help="execution engine to run the program with",
+    )
+    arg_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="fold constants and remove dead code before running",
+    )
+    arg_parser.add_argument(
+        "--scanner",
+        choices=SCANNERS.keys(),
+        default="default",
+        help="scanner implementation, regex is faster on large sources",
+    )
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="read the script in chunks and run declarations as they parse",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="don't read or write the __loxcache__ of parsed programs",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="sample the script and report its hottest functions and lines",
+    )
+    arg_parser.add_argument(
+        "--profile-output",
+        default="lox.collapsed",
+        help="file to write the profile's collapsed stacks to, for flamegraphs",
+    )
+    arg_parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="count the nodes or instructions, calls and environments the "
+        "script runs, and report them on stderr at exit",
+    )
+    arg_parser.add_argument(
+        "--trace-format",
+        choices=["table", "json"],
+        default="table",
+        help="format of the --trace report",
+    )
+    args = arg_parser.parse_args()
+
+    if args.script is not None:
+        profiler = Profiler() if args.profile else None
+        if profiler is not None:
+            profiler.start()
+
+        instrumentation = Instrumentation() if args.trace else None
+
+        try:
+            run_file(
+                args.script,
+                args.engine,
+                args.optimize,
+                args.scanner,
+                args.stream,
+                args.cache,
+                instrumentation,
+            )
+        finally:
+            if profiler is not None:
+                report_profile(profiler, args.profile_output)
+            if instrumentation is not None:
+                instrumentation.report(sys.stderr, args.trace_format)
     else:
-        run_prompt()
+        run_prompt(args.engine, args.optimize)
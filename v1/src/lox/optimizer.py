@@ -0,0 +1,289 @@
+from __future__ import annotations
+from typing import List, Optional, Union
+
+from .syntax.expr import (
+    Expr,
+    ExprVisitor,
+    Assign,
+    Logical,
+    Binary,
+    Unary,
+    Call,
+    Literal,
+    Variable,
+    Grouping,
+    Array,
+    Index,
+    SetIndex,
+)
+from .syntax.stmt import (
+    Stmt,
+    StmtVisitor,
+    Function,
+    Var,
+    Expression,
+    If,
+    Print,
+    Return,
+    While,
+    Block,
+)
+from .token import TokenType
+from .interpreter import is_truthy, operator_chain
+
+
+class Optimizer(ExprVisitor[Expr], StmtVisitor[Optional[Stmt]]):
+    """
+    Simplifies parsed statements before they are resolved: folds constant
+    subexpressions, unwraps groupings and drops code that can never run.
+
+    An operation is only folded when evaluating it cannot fail, so runtime
+    errors such as `-"a"` or `1 + nil` still happen, at their original line.
+
+    :param int removed: total number of nodes removed so far
+    """
+
+    removed: int
+
+    def __init__(self) -> None:
+        self.removed = 0
+
+    def optimize(self, statements: List[Stmt]) -> List[Stmt]:
+        before = count_nodes(statements)
+        optimized = self._statements(statements)
+        self.removed += before - count_nodes(optimized)
+
+        return optimized
+
+    def _expr(self, expression: Expr) -> Expr:
+        return expression.accept(self)
+
+    def _stmt(self, statement: Stmt) -> Stmt:
+        """
+        Optimize a statement that is the body of an if or while, where one
+        statement is required
+        """
+        optimized = statement.accept(self)
+        return Block([]) if optimized is None else optimized
+
+    def _statements(self, statements: List[Stmt]) -> List[Stmt]:
+        optimized: List[Stmt] = []
+
+        for s in statements:
+            result = s.accept(self)
+
+            if isinstance(result, Block) and not declares(result):
+                # a block without declarations does not need its own scope
+                optimized.extend(result.statements)
+            elif result is not None:
+                optimized.append(result)
+
+            if isinstance(result, Return):
+                # anything after a return in the same block is unreachable
+                break
+
+        return optimized
+
+    def visit_assign_expr(self, expr: Assign) -> Expr:
+        expr.value = self._expr(expr.value)
+        return expr
+
+    def visit_logical_expr(self, expr: Logical) -> Expr:
+        return self._chain(expr)
+
+    def visit_binary_expr(self, expr: Binary) -> Expr:
+        return self._chain(expr)
+
+    def _chain(self, expr: Union[Binary, Logical]) -> Expr:
+        """
+        Optimize `expr` and the binary and logical operators nested through
+        its left operands, innermost first, in a loop rather than by
+        recursing once per operator
+        """
+        chain = operator_chain(expr)
+        optimized = self._expr(chain[-1].left)
+
+        for node in reversed(chain):
+            node.left = optimized
+            node.right = self._expr(node.right)
+            if type(node) is Binary:
+                optimized = self._fold_binary(node)  # type: ignore
+            else:
+                optimized = self._fold_logical(node)  # type: ignore
+
+        return optimized
+
+    def _fold_logical(self, expr: Logical) -> Expr:
+        if not isinstance(expr.left, Literal):
+            return expr
+
+        left_true = is_truthy(expr.left.value)
+        if expr.operator.type == TokenType.OR:
+            return expr.left if left_true else expr.right
+        else:
+            return expr.right if left_true else expr.left
+
+    def _fold_binary(self, expr: Binary) -> Expr:
+        if not (
+            isinstance(expr.left, Literal) and isinstance(expr.right, Literal)
+        ):
+            return expr
+
+        left = expr.left.value
+        right = expr.right.value
+        op_type = expr.operator.type
+
+        if op_type == TokenType.BANG_EQUAL:
+            return Literal(left != right)
+        elif op_type == TokenType.EQUAL_EQUAL:
+            return Literal(left == right)
+        elif op_type == TokenType.PLUS and type(left) is type(right) is str:
+            return Literal(left + right)  # type: ignore
+
+        if not (type(left) is type(right) is float):
+            # leave the operand type error to the interpreter
+            return expr
+
+        a: float = left  # type: ignore
+        b: float = right  # type: ignore
+
+        if op_type == TokenType.PLUS:
+            return Literal(a + b)
+        elif op_type == TokenType.MINUS:
+            return Literal(a - b)
+        elif op_type == TokenType.STAR:
+            return Literal(a * b)
+        elif op_type == TokenType.SLASH and b != 0:
+            return Literal(a / b)
+        elif op_type == TokenType.GREATER:
+            return Literal(a > b)
+        elif op_type == TokenType.GREATER_EQUAL:
+            return Literal(a >= b)
+        elif op_type == TokenType.LESS:
+            return Literal(a < b)
+        elif op_type == TokenType.LESS_EQUAL:
+            return Literal(a <= b)
+
+        return expr
+
+    def visit_unary_expr(self, expr: Unary) -> Expr:
+        expr.right = self._expr(expr.right)
+
+        if not isinstance(expr.right, Literal):
+            return expr
+
+        value = expr.right.value
+        if expr.operator.type == TokenType.BANG:
+            return Literal(not is_truthy(value))
+        elif type(value) is float:
+            return Literal(-value)  # type: ignore
+
+        return expr
+
+    def visit_call_expr(self, expr: Call) -> Expr:
+        expr.callee = self._expr(expr.callee)
+        expr.arguments = [self._expr(arg) for arg in expr.arguments]
+        return expr
+
+    def visit_literal_expr(self, expr: Literal) -> Expr:
+        return expr
+
+    def visit_variable_expr(self, expr: Variable) -> Expr:
+        return expr
+
+    def visit_grouping_expr(self, expr: Grouping) -> Expr:
+        return self._expr(expr.expression)
+
+    def visit_array_expr(self, expr: Array) -> Expr:
+        expr.elements = [self._expr(e) for e in expr.elements]
+        return expr
+
+    def visit_index_expr(self, expr: Index) -> Expr:
+        expr.target = self._expr(expr.target)
+        expr.index = self._expr(expr.index)
+        return expr
+
+    def visit_setindex_expr(self, expr: SetIndex) -> Expr:
+        expr.target = self._expr(expr.target)
+        expr.index = self._expr(expr.index)
+        expr.value = self._expr(expr.value)
+        return expr
+
+    def visit_function_stmt(self, stmt: Function) -> Optional[Stmt]:
+        stmt.body = self._statements(stmt.body)
+        return stmt
+
+    def visit_var_stmt(self, stmt: Var) -> Optional[Stmt]:
+        if stmt.initializer is not None:
+            stmt.initializer = self._expr(stmt.initializer)
+        return stmt
+
+    def visit_expression_stmt(self, stmt: Expression) -> Optional[Stmt]:
+        stmt.expression = self._expr(stmt.expression)
+
+        if isinstance(stmt.expression, Literal):
+            # evaluating a literal has no effect
+            return None
+
+        return stmt
+
+    def visit_if_stmt(self, stmt: If) -> Optional[Stmt]:
+        stmt.condition = self._expr(stmt.condition)
+
+        if isinstance(stmt.condition, Literal):
+            if is_truthy(stmt.condition.value):
+                return stmt.branch_true.accept(self)
+            elif stmt.branch_false is not None:
+                return stmt.branch_false.accept(self)
+            return None
+
+        stmt.branch_true = self._stmt(stmt.branch_true)
+        if stmt.branch_false is not None:
+            stmt.branch_false = self._stmt(stmt.branch_false)
+
+        return stmt
+
+    def visit_print_stmt(self, stmt: Print) -> Optional[Stmt]:
+        stmt.expression = self._expr(stmt.expression)
+        return stmt
+
+    def visit_return_stmt(self, stmt: Return) -> Optional[Stmt]:
+        if stmt.value is not None:
+            stmt.value = self._expr(stmt.value)
+        return stmt
+
+    def visit_while_stmt(self, stmt: While) -> Optional[Stmt]:
+        stmt.condition = self._expr(stmt.condition)
+
+        if isinstance(stmt.condition, Literal) and not is_truthy(
+            stmt.condition.value
+        ):
+            return None
+
+        stmt.body = self._stmt(stmt.body)
+        return stmt
+
+    def visit_block_stmt(self, stmt: Block) -> Optional[Stmt]:
+        stmt.statements = self._statements(stmt.statements)
+        return stmt
+
+
+def declares(block: Block) -> bool:
+    """Check if `block` declares any variables or functions in its scope"""
+    return any(isinstance(s, (Var, Function)) for s in block.statements)
+
+
+def count_nodes(node: object) -> int:
+    """Count the `Expr` and `Stmt` nodes in `node`, which may be a list"""
+    count = 0
+    pending = [node]
+
+    while pending:
+        item = pending.pop()
+        if isinstance(item, list):
+            pending.extend(item)
+        elif isinstance(item, (Expr, Stmt)):
+            count += 1
+            pending.extend(getattr(item, f) for f in item._fields)
+
+    return count
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
 
 from .token import Token, TokenType
 
@@ -10,6 +10,23 @@ from .syntax.stmt import Stmt
 from lox import error
 
 
+# precedence and node class of each binary operator, loosest first
+BINARY_OPERATORS: Dict[int, Tuple[int, Type[Expr]]] = {
+    TokenType.OR: (1, expr.Logical),
+    TokenType.AND: (2, expr.Logical),
+    TokenType.BANG_EQUAL: (3, expr.Binary),
+    TokenType.EQUAL_EQUAL: (3, expr.Binary),
+    TokenType.GREATER: (4, expr.Binary),
+    TokenType.GREATER_EQUAL: (4, expr.Binary),
+    TokenType.LESS: (4, expr.Binary),
+    TokenType.LESS_EQUAL: (4, expr.Binary),
+    TokenType.MINUS: (5, expr.Binary),
+    TokenType.PLUS: (5, expr.Binary),
+    TokenType.SLASH: (6, expr.Binary),
+    TokenType.STAR: (6, expr.Binary),
+}
+
+
 class Parser:
     tokens: List[Token]
     _current: int
@@ -19,13 +36,14 @@ class Parser:
         self._current = 0
 
     def parse(self) -> List[Stmt]:
-        statements: List[Stmt] = []
+        return list(self.declarations())
+
+    def declarations(self) -> Iterator[Stmt]:
+        """Parse and yield the top level declarations one at a time"""
         while not self._is_at_end():
             s = self._declaration()
             if s is not None:
-                statements.append(s)
-
-        return statements
+                yield s
 
     def _declaration(self) -> Optional[Stmt]:
         try:
@@ -164,7 +182,7 @@ class Parser:
         keyword: Token = self._previous()
         value: Optional[Expr] = None
 
-        if not self._match(TokenType.SEMICOLON):
+        if not self._check(TokenType.SEMICOLON):
             value = self._expression()
 
         self._consume(TokenType.SEMICOLON, "Expected ';' after return value")
@@ -194,7 +212,7 @@ class Parser:
         return self._assignment()
 
     def _assignment(self) -> Expr:
-        expression: Expr = self._logic_or()
+        expression: Expr = self._binary()
 
         if self._match(TokenType.EQUAL):
             equals: Token = self._previous()
@@ -202,81 +220,39 @@ class Parser:
 
             if isinstance(expression, expr.Variable):
                 return expr.Assign(expression.name, value)
+            elif isinstance(expression, expr.Index):
+                return expr.SetIndex(
+                    expression.target,
+                    expression.bracket,
+                    expression.index,
+                    value,
+                )
 
             self._error(equals, "Invalid assignment target")
 
         return expression
 
-    def _logic_or(self) -> Expr:
-        expression: Expr = self._logic_and()
-
-        while self._match(TokenType.OR):
-            operator = self._previous()
-            right = self._equality()
-            expression = expr.Logical(expression, operator, right)
-
-        return expression
-
-    def _logic_and(self) -> Expr:
-        expression: Expr = self._equality()
-
-        while self._match(TokenType.AND):
-            operator = self._previous()
-            right = self._equality()
-            expression = expr.Logical(expression, operator, right)
-
-        return expression
-
-    def _equality(self) -> Expr:
-        expression: Expr = self._comparison()
-
-        while self._match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            operator = self._previous()
-            right = self._comparison()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _comparison(self) -> Expr:
-        expression: Expr = self._term()
-
-        while self._match(
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-        ):
-            operator: Token = self._previous()
-            right: Expr = self._term()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _term(self) -> Expr:
-        expression: Expr = self._factor()
-
-        while self._match(
-            TokenType.MINUS,
-            TokenType.PLUS,
-        ):
-            operator: Token = self._previous()
-            right: Expr = self._factor()
-            expression = expr.Binary(expression, operator, right)
-
-        return expression
-
-    def _factor(self) -> Expr:
+    def _binary(self, min_precedence: int = 1) -> Expr:
+        """
+        Parse a chain of binary and logical operators binding at least as
+        tightly as `min_precedence`, by precedence climbing. Operators of
+        the same precedence are folded into the tree in a loop, so a long
+        chain such as `a + b + c + ...` parses in bounded stack.
+        """
         expression: Expr = self._unary()
 
-        while self._match(
-            TokenType.SLASH,
-            TokenType.STAR,
-        ):
-            operator = self._previous()
-            right = self._unary()
-            expression = expr.Binary(expression, operator, right)
+        while True:
+            operator: Token = self._peek()
+            entry = BINARY_OPERATORS.get(operator.type)
+            if entry is None or entry[0] < min_precedence:
+                return expression
 
-        return expression
+            (precedence, node_class) = entry
+            self._advance()
+            # operators are left associative, so the right operand only
+            # takes operators that bind more tightly
+            right: Expr = self._binary(precedence + 1)
+            expression = node_class(expression, operator, right)
 
     def _unary(self) -> Expr:
         if self._match(TokenType.BANG, TokenType.MINUS):
@@ -292,6 +268,12 @@ class Parser:
         while True:
             if self._match(TokenType.LEFT_PAREN):
                 expression = self._finish_call(expression)
+            elif self._match(TokenType.LEFT_BRACKET):
+                index = self._expression()
+                bracket = self._consume(
+                    TokenType.RIGHT_BRACKET, "Expected ']' after index"
+                )
+                expression = expr.Index(expression, bracket, index)
             else:
                 break
 
@@ -336,12 +318,31 @@ class Parser:
                 TokenType.RIGHT_PAREN, "Expected ')' after expression"
             )
             return expr.Grouping(expression)
+        elif self._match(TokenType.LEFT_BRACKET):
+            return self._finish_array()
         else:
             raise self._error(self._peek(), "Expected expression")
 
+    def _finish_array(self) -> Expr:
+        elements: List[Expr] = []
+
+        if not self._check(TokenType.RIGHT_BRACKET):
+            # do while
+            while True:
+                elements.append(self._expression())
+
+                if not self._match(TokenType.COMMA):
+                    break
+
+        bracket: Token = self._consume(
+            TokenType.RIGHT_BRACKET, "Expected ']' after array elements"
+        )
+
+        return expr.Array(bracket, elements)
+
     # helper methods
 
-    def _match(self, *types: TokenType) -> bool:
+    def _match(self, *types: int) -> bool:
         """Check if the type of the current token type matches any of `types`.
         If it does, advance the current position by 1"""
         for token_type in types:
@@ -351,7 +352,7 @@ class Parser:
 
         return False
 
-    def _check(self, token_type: TokenType) -> bool:
+    def _check(self, token_type: int) -> bool:
         """Check if current token is of type `token_type`"""
         if self._is_at_end():
             return False
@@ -377,7 +378,7 @@ class Parser:
         """Returns the token before the current one"""
         return self.tokens[self._current - 1]
 
-    def _consume(self, tt: TokenType, message: str) -> Token:
+    def _consume(self, tt: int, message: str) -> Token:
         """
         If current token has type `tt`, return it and increment current
         position. Otherwise, raise an error with `message`
@@ -412,3 +413,52 @@ class Parser:
                 return
 
             self._advance()
+
+
+class StreamParser(Parser):
+    """
+    Parser that pulls tokens from an iterator as it goes, such as a
+    `StreamScanner`. Only the current and previous token are kept, which is
+    all the lookahead the grammar needs.
+
+    :param Iterator[Token] _stream: remaining tokens
+    :param Token _current_token:
+    :param Optional[Token] _previous_token:
+    """
+
+    _stream: Iterator[Token]
+    _current_token: Token
+    _previous_token: Optional[Token]
+
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        super().__init__([])
+        self._stream = iter(tokens)
+        self._current_token = next(self._stream)
+        self._previous_token = None
+
+    def _advance(self) -> Token:
+        if not self._is_at_end():
+            self._previous_token = self._current_token
+            self._current_token = next(self._stream)
+
+        return self._previous()
+
+    def _peek(self) -> Token:
+        return self._current_token
+
+    def _previous(self) -> Token:
+        return self._previous_token  # type: ignore
+
+
+class ReplParser(Parser):
+    """
+    Parser for REPL input. An error at the end of the input means the
+    declaration isn't finished yet, so it raises `LoxIncompleteInput`
+    instead of being reported.
+    """
+
+    def _error(self, token: Token, message: str) -> error.LoxParseError:
+        if token.type == TokenType.EOF:
+            raise error.LoxIncompleteInput()
+
+        return super()._error(token, message)
@@ -0,0 +1,271 @@
+from __future__ import annotations
+import collections
+import os
+import sys
+import threading
+from types import FrameType
+from typing import Callable, Counter, Dict, List, Optional, TextIO, Tuple
+
+from .closure_compiler import CompiledFunction
+from .environment import Environment
+from .lox_objects import LoxFunction
+from .syntax.expr import Expr
+from .syntax.stmt import Stmt
+from .token import Token
+from .vm.vm import VM
+
+
+# Lox call stack of a sample, outermost first, as (function, line) pairs
+LoxStack = Tuple[Tuple[str, int], ...]
+
+SCRIPT = "<script>"
+
+# locals of the tree interpreter holding the node being run, attributes of
+# nodes holding a token, and locals of the closure compiler's closures
+# holding the token of their node
+NODE_LOCALS = ("expr", "stmt")
+TOKEN_NAMES = ("name", "operator", "paren", "keyword", "bracket")
+
+LOX_DIR = os.path.dirname(os.path.abspath(__file__))
+THIS_FILE = os.path.abspath(__file__)
+COUNTING_WRAPPERS = ("counted_call", "counted_body")
+
+
+class Profiler:
+    """
+    Sampling profiler for Lox programs. While running, a background thread
+    periodically inspects the main thread's Python stack and rebuilds the
+    Lox call stack from it, so time is attributed to Lox functions and
+    lines rather than to the interpreter's own methods.
+
+    Calls of `LoxFunction` and `CompiledFunction` are counted by swapping
+    in counting implementations for the duration of the profile, so nothing
+    changes when profiling is off. The VM inlines its calls, so it has no
+    call counts.
+
+    :param float interval: seconds between samples
+    :param Counter[LoxStack] samples: number of samples taken of each stack
+    :param Counter[str] calls: number of calls of each function, by name
+    """
+
+    interval: float
+    samples: Counter[LoxStack]
+    calls: Counter[str]
+    _thread: Optional[threading.Thread]
+    _stopped: threading.Event
+    _target: int
+    _restore: List[Callable[[], None]]
+
+    def __init__(self, interval: float = 0.001) -> None:
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.calls = collections.Counter()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._target = threading.get_ident()
+        self._restore = []
+
+    def start(self) -> None:
+        """Start profiling the calling thread"""
+        self._target = threading.get_ident()
+        self._count_calls()
+
+        # let the sampling thread take the GIL often enough
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, self.interval / 4))
+        self._restore.append(lambda: sys.setswitchinterval(switch_interval))
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        while self._restore:
+            self._restore.pop()()
+
+    def _count_calls(self) -> None:
+        calls = self.calls
+        lox_call = LoxFunction.call
+        compiled_init = CompiledFunction.__init__
+
+        def counted_call(
+            self: LoxFunction, interpreter: object, arguments: List[object]
+        ) -> object:
+            calls[self.declaration.name.lexeme] += 1
+            return lox_call(self, interpreter, arguments)  # type: ignore
+
+        def counted_init(
+            self: CompiledFunction,
+            declaration: object,
+            body: Callable[[Environment], object],
+            closure: Environment,
+        ) -> None:
+            # the closure compiler runs `body` directly, so count there
+            function = self
+
+            def counted_body(env: Environment) -> object:
+                calls[function.declaration.name.lexeme] += 1
+                return body(env)
+
+            compiled_init(self, declaration, counted_body, closure)  # type: ignore
+
+        def restore() -> None:
+            LoxFunction.call = lox_call  # type: ignore
+            CompiledFunction.__init__ = compiled_init  # type: ignore
+
+        LoxFunction.call = counted_call  # type: ignore
+        CompiledFunction.__init__ = counted_init  # type: ignore
+        self._restore.append(restore)
+
+    def _sample_loop(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+
+            stack = lox_stack(frame)
+            del frame
+            if stack:
+                self.samples[stack] += 1
+
+    def report(self, file: TextIO, limit: int = 20) -> None:
+        """Print the hottest functions and lines to `file`"""
+        total = sum(self.samples.values())
+        print(
+            f"[profile] {total} samples every {self.interval * 1000:g}ms",
+            file=file,
+        )
+        if total == 0:
+            return
+
+        function_self: Counter[str] = collections.Counter()
+        function_total: Counter[str] = collections.Counter()
+        line_self: Counter[int] = collections.Counter()
+        line_total: Counter[int] = collections.Counter()
+
+        for (stack, count) in self.samples.items():
+            (function, line) = stack[-1]
+            function_self[function] += count
+            line_self[line] += count
+            for name in {name for (name, _) in stack}:
+                function_total[name] += count
+            for number in {number for (_, number) in stack}:
+                line_total[number] += count
+
+        print(
+            f"{'function':24}{'calls':>10}{'self':>9}{'total':>9}", file=file
+        )
+        for (name, count) in function_total.most_common(limit):
+            calls = str(self.calls[name]) if name in self.calls else "-"
+            print(
+                f"{name:24}{calls:>10}"
+                f"{percent(function_self[name], total):>9}"
+                f"{percent(count, total):>9}",
+                file=file,
+            )
+
+        print(f"\n{'line':24}{'':>10}{'self':>9}{'total':>9}", file=file)
+        for (number, count) in line_self.most_common(limit):
+            # samples taken before the first node of a function has a line
+            label = str(number) if number else "unknown"
+            print(
+                f"{label:<24}{'':>10}{percent(count, total):>9}"
+                f"{percent(line_total[number], total):>9}",
+                file=file,
+            )
+
+    def write_collapsed(self, file: TextIO) -> None:
+        """
+        Write the samples in the collapsed stack format read by flamegraph
+        tools: one `function:line;function:line count` line per stack
+        """
+        for (stack, count) in sorted(self.samples.items()):
+            frames = ";".join(f"{name}:{line}" for (name, line) in stack)
+            print(f"{frames} {count}", file=file)
+
+
+def percent(count: int, total: int) -> str:
+    return f"{count / total * 100:.1f}%"
+
+
+def lox_stack(frame: Optional[FrameType]) -> LoxStack:
+    """Rebuild the Lox call stack from the innermost Python `frame`"""
+    frames: List[FrameType] = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+
+    stack: List[Tuple[str, int]] = [(SCRIPT, 0)]
+
+    for frame in reversed(frames):
+        code = frame.f_code
+        if not code.co_filename.startswith(LOX_DIR):
+            continue
+
+        if code is VM_RUN:
+            return vm_stack(frame)
+
+        if code.co_filename == THIS_FILE:
+            if code.co_name not in COUNTING_WRAPPERS:
+                continue
+
+            # a call counting wrapper marks where a Lox function starts
+            f_locals = frame.f_locals
+            function = f_locals.get("function", f_locals.get("self"))
+            if isinstance(function, (LoxFunction, CompiledFunction)):
+                name = function.declaration.name
+                stack.append((name.lexeme, name.line))
+            continue
+
+        line = current_line(frame.f_locals)
+        if line is not None:
+            stack[-1] = (stack[-1][0], line)
+
+    return tuple(stack)
+
+
+def current_line(f_locals: Dict[str, object]) -> Optional[int]:
+    """Find the line of the node an interpreter frame is running"""
+    for name in NODE_LOCALS:
+        node = f_locals.get(name)
+        if isinstance(node, (Expr, Stmt)):
+            for attribute in TOKEN_NAMES:
+                token = getattr(node, attribute, None)
+                if isinstance(token, Token):
+                    return token.line
+
+    for name in TOKEN_NAMES:
+        token = f_locals.get(name)
+        if isinstance(token, Token):
+            return token.line
+
+    return None
+
+
+def vm_stack(frame: FrameType) -> LoxStack:
+    """Read the Lox call stack of the `VM._run` Python `frame`"""
+    f_locals = frame.f_locals
+    vm: VM = f_locals["self"]  # type: ignore
+    call_frames = list(vm.frames)
+
+    stack: List[Tuple[str, int]] = []
+    for (i, call_frame) in enumerate(call_frames):
+        function = call_frame.closure.function
+        ip = f_locals.get("ip", 0) if i == len(call_frames) - 1 else call_frame.ip
+
+        try:
+            line = function.chunk.get_line(max(ip - 1, 0))  # type: ignore
+        except IndexError:
+            line = 0
+
+        stack.append((function.name or SCRIPT, line))
+
+    return tuple(stack)
+
+
+VM_RUN = VM._run.__code__
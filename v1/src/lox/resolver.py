@@ -1,6 +1,5 @@
 from __future__ import annotations
-from functools import singledispatchmethod
-from typing import List, Dict
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 from .syntax.expr import (
     Expr,
@@ -13,6 +12,9 @@ from .syntax.expr import (
     Literal,
     Variable,
     Grouping,
+    Array,
+    Index,
+    SetIndex,
 )
 from .syntax.stmt import (
     Stmt,
@@ -29,49 +31,184 @@ from .syntax.stmt import (
 from .lox_objects import LoxCallable, LoxFunction, builtin
 from .token import Token, TokenType
 from . import error
-from .environment import Environment
-from .interpreter import Interpreter
+from .environment import CELL, GLOBAL
 from .stack import Stack
 
 
-class Resolver(ExprVisitor[None], StmtVisitor[None]):
+class LocalVariable:
+    """
+    Local variable declared in a scope
+
+    :param int slot: index of the variable in the environment of the
+    function it is declared in
+    :param bool defined: whether or not its initializer has resolved
+    :param Union[Var, Function] declaration: statement declaring the
+    variable, or the function it is a parameter of
+    :param bool param: whether the variable is a parameter
+    :param bool captured: whether a closure captures the variable, which
+    is then stored in a `Cell`
+    :param List[Union[Variable, Assign]] uses: references resolved before
+    the variable was captured, which then have to use its cell
     """
-    Resolver
 
-    :param Interpreter interpreter:
-    :param Stack[Dict[str, bool]] scopes: Stack of scopes, where each scope is
-    a dict of identifiers mapped to whether or not its initializer has
-    resolved
+    slot: int
+    defined: bool
+    declaration: Union[Var, Function]
+    param: bool
+    captured: bool
+    uses: List[Union[Variable, Assign]]
+
+    def __init__(
+        self, slot: int, declaration: Union[Var, Function], param: bool
+    ) -> None:
+        self.slot = slot
+        self.defined = False
+        self.declaration = declaration
+        self.param = param
+        self.captured = False
+        self.uses = []
+
+
+class Scope:
+    """
+    Block or function scope
+
+    :param Dict[str, LocalVariable] variables: variables visible in the
+    scope, by name
+    :param int base: slot of the scope's first variable. A block's variables
+    follow those of the scopes enclosing it in the same function.
+    :param int size: number of slots declared so far. A redeclared name gets
+    a new slot, so this can exceed `len(variables)`
     """
 
-    interpreter: Interpreter
-    scopes: Stack[Dict[str, bool]]
+    variables: Dict[str, LocalVariable]
+    base: int
+    size: int
 
-    def __init__(self, interpreter: Interpreter) -> None:
-        self.scopes = Stack()
-        self.interpreter = interpreter
+    def __init__(self, base: int = 0) -> None:
+        self.variables = {}
+        self.base = base
+        self.size = 0
 
-    def resolve(self, statements: List[Stmt]) -> None:
-        for s in statements:
-            self._resolve(s)
 
-    @singledispatchmethod
-    def _resolve(self, arg) -> None:
-        raise NotImplementedError
+class FunctionScope:
+    """
+    Function being resolved, or the top level of the script
+
+    :param Optional[FunctionScope] enclosing: function this one is declared
+    in, None for the top level
+    :param int first: index in `Resolver.scopes` of the function's
+    outermost scope, which holds its parameters
+    :param Dict[Tuple[int, int], int] upvalues: index of each cell the
+    function captures, by its (depth, slot) from the environment the
+    function is declared in
+    """
+
+    enclosing: Optional[FunctionScope]
+    first: int
+    upvalues: Dict[Tuple[int, int], int]
+
+    def __init__(self, enclosing: Optional[FunctionScope], first: int) -> None:
+        self.enclosing = enclosing
+        self.first = first
+        self.upvalues = {}
 
-    @_resolve.register
-    def _resolve_stmt(self, s: Stmt) -> None:
-        s.accept(self)
+    def add_upvalue(self, location: Tuple[int, int]) -> int:
+        """Find or add the upvalue for the cell at `location`"""
+        return self.upvalues.setdefault(location, len(self.upvalues))
 
-    @_resolve.register
-    def _resolve_expr(self, e: Expr) -> None:
-        e.accept(self)
+
+# what is left to do on the resolver's work stack: a node or list of nodes
+# to resolve, or an action to run once the nodes pushed after it are done
+Work = Union[Expr, Stmt, List[Expr], List[Stmt], Callable[[], None]]
+
+
+class Resolver(ExprVisitor[None], StmtVisitor[None]):
+    """
+    Resolver. Annotates each local `Variable` and `Assign` with the
+    `(depth, slot)` of the variable it refers to, and leaves globals at
+    depth -1.
+
+    Nodes are resolved from an explicit stack rather than by recursion, so
+    arbitrarily deep trees resolve in bounded Python stack. A visitor
+    schedules the node's children with `_push`, along with any action
+    such as ending a scope that has to run after them.
+
+    Functions don't keep their enclosing scopes alive. A variable declared
+    in one function and used in a function nested inside it is captured:
+    it is stored in a `Cell`, and each `Function` lists the cells its
+    closure needs in `upvalues`, which the inner function reaches through
+    its closure environment.
+
+    Since no scope outlives the block that declares it, blocks don't get
+    environments of their own. A function call's environment holds the
+    variables of every block in the function, with the slots of a block
+    reused once it ends, so locals are at depth 0 and the cells a function
+    captures are at depth 1. Only a block at the top level, outside any
+    function, gets an environment.
+
+    :param Stack[Scope] scopes: Stack of scopes, innermost last
+    :param FunctionScope function: innermost function being resolved
+    :param List[Work] work: nodes and actions still to be resolved, next
+    one last
+    """
+
+    scopes: Stack[Scope]
+    function: FunctionScope
+    work: List[Work]
+
+    def __init__(self) -> None:
+        self.scopes = Stack()
+        self.function = FunctionScope(None, 0)
+        self.work = []
+
+    def resolve(self, statements: List[Stmt]) -> None:
+        self._resolve(statements)
+
+    def _resolve(self, node: Work) -> None:
+        """Resolve a node, or each node in a list, and everything under it"""
+        work = self.work
+        base = len(work)
+        work.append(node)
+
+        try:
+            while len(work) > base:
+                item = work.pop()
+                if type(item) is list:
+                    work.extend(reversed(item))  # type: ignore
+                elif callable(item):
+                    item()
+                else:
+                    item.accept(self)  # type: ignore
+        finally:
+            # drop whatever an exception left behind
+            del work[base:]
+
+    def _push(self, *items: Optional[Work]) -> None:
+        """Schedule `items` to be resolved in order, skipping `None`s"""
+        for item in reversed(items):
+            if item is not None:
+                self.work.append(item)
 
     def _begin_scope(self) -> None:
         """
         Begin a new scope
         """
-        self.scopes.push({})
+        self.scopes.push(Scope())
+
+    def _begin_block(self, block: Block) -> None:
+        """
+        Begin the scope of `block`, in the environment of the enclosing
+        function if there is one
+        """
+        if self.scopes.empty():
+            block.base = -1
+            self._begin_scope()
+            return
+
+        enclosing = self.scopes.peek()
+        block.base = enclosing.base + enclosing.size
+        self.scopes.push(Scope(block.base))
 
     def _end_scope(self) -> None:
         """
@@ -79,15 +216,28 @@ class Resolver(ExprVisitor[None], StmtVisitor[None]):
         """
         self.scopes.pop()
 
-    def _declare(self, name: Token) -> None:
+    def _declare(
+        self,
+        name: Token,
+        declaration: Union[Var, Function],
+        param: bool = False,
+    ) -> None:
         """
-        Declare variable `name` in the inner most scope. Mark as "not ready"
-        in scope map since we have not finished resolving the initializer.
+        Declare variable `name` in the inner most scope, in the next free
+        slot. Mark as "not ready" in scope map since we have not finished
+        resolving the initializer.
         """
         if self.scopes.empty():
             return
 
-        self.scopes.peek()[name.lexeme] = False
+        scope = self.scopes.peek()
+        scope.variables[name.lexeme] = LocalVariable(
+            scope.base + scope.size, declaration, param
+        )
+        scope.size += 1
+
+        if not param:
+            declaration.captured = False
 
     def _define(self, name: Token) -> None:
         """
@@ -97,93 +247,162 @@ class Resolver(ExprVisitor[None], StmtVisitor[None]):
         if self.scopes.empty():
             return
 
-        self.scopes.peek()[name.lexeme] = True
+        self.scopes.peek().variables[name.lexeme].defined = True
+
+    def _resolve_local(self, expression: Union[Variable, Assign]) -> None:
+        first = self.function.first
+
+        for i in range(len(self.scopes) - 1, -1, -1):
+            local = self.scopes[i].variables.get(expression.name.lexeme)
+            if local is None:
+                continue
+
+            if i < first:
+                # declared in an enclosing function, so reached through
+                # this function's closure
+                expression.depth = CELL - 1
+                expression.slot = self._capture(self.function, i, local)
+            elif local.captured:
+                expression.depth = CELL
+                expression.slot = local.slot
+            else:
+                expression.depth = 0
+                expression.slot = local.slot
+                local.uses.append(expression)
+            return
+
+        # a global, whose slot the interpreter finds on first use. Set even
+        # so, since the optimizer has the program resolved twice.
+        expression.depth = GLOBAL
+        expression.slot = -1
 
-    def _resolve_local(self, expression: Expr, name: Token) -> None:
-        num_scopes = len(self.scopes)
+    def _capture(
+        self, function: FunctionScope, index: int, local: LocalVariable
+    ) -> int:
+        """
+        Find or add the upvalue of `function` for `local`, which is declared
+        in `scopes[index]`, in a function enclosing `function`
+        """
+        enclosing: FunctionScope = function.enclosing  # type: ignore
+
+        if index >= enclosing.first:
+            self._mark_captured(local)
+            location = (0, local.slot)
+        else:
+            # captured by `enclosing` first, then passed on from its closure
+            upvalue = self._capture(enclosing, index, local)
+            location = (1, upvalue)
+
+        return function.add_upvalue(location)
+
+    def _mark_captured(self, local: LocalVariable) -> None:
+        """Store `local` in a cell, and make its earlier uses read the cell"""
+        if local.captured:
+            return
 
-        for (i, scope) in enumerate(self.scopes):
-            if name.lexeme in scope:
-                self.interpreter.resolve(expression, len(self.scopes) - 1 - i)
+        local.captured = True
+        for use in local.uses:
+            use.depth = CELL - use.depth
+        local.uses = []
+
+        declaration = local.declaration
+        if local.param:
+            declaration.captured_params += (local.slot,)  # type: ignore
+        else:
+            declaration.captured = True
 
     def _resolve_function(self, function: Function) -> None:
+        self.function = FunctionScope(self.function, len(self.scopes))
         self._begin_scope()
 
+        function.captured_params = ()
         for param in function.params:
-            self._declare(param)
+            self._declare(param, function, param=True)
             self._define(param)
 
-        self._resolve(function.body)
+        self._push(function.body, lambda: self._end_function(function))
+
+    def _end_function(self, function: Function) -> None:
         self._end_scope()
+        function.upvalues = tuple(self.function.upvalues)
+        self.function = self.function.enclosing  # type: ignore
 
     def visit_assign_expr(self, expr: Assign) -> None:
-        self._resolve(expr.value)
-        self._resolve_local(expr, expr.name)
+        # the value can't declare anything, so resolving the target first
+        # gives the same answer
+        self._resolve_local(expr)
+        self._push(expr.value)
 
     def visit_logical_expr(self, expr: Logical) -> None:
-        self._resolve(expr.left)
-        self._resolve(expr.right)
+        self._push(expr.left, expr.right)
 
     def visit_binary_expr(self, expr: Binary) -> None:
-        self._resolve(expr.left)
-        self._resolve(expr.right)
+        self._push(expr.left, expr.right)
 
     def visit_unary_expr(self, expr: Unary) -> None:
-        self._resolve(expr.right)
+        self._push(expr.right)
 
     def visit_call_expr(self, expr: Call) -> None:
-        self._resolve(expr.callee)
-        for arg in expr.arguments:
-            self._resolve(arg)
+        self._push(expr.callee, expr.arguments)
 
     def visit_literal_expr(self, expr: Literal) -> None:
         # no-op
         pass
 
     def visit_variable_expr(self, expr: Variable) -> None:
-        if not self.scopes.empty() and not self.scopes.peek()[expr.name.lexeme]:
+        if not self.scopes.empty():
+            local = self.scopes.peek().variables.get(expr.name.lexeme)
+        else:
+            local = None
+
+        if local is not None and not local.defined:
             error.ThrowError(
                 expr.name, "Can't read local variable in its own initializer"
             )
 
-        self._resolve_local(expr, expr.name)
+        self._resolve_local(expr)
 
     def visit_grouping_expr(self, expr: Grouping) -> None:
-        self._resolve(expr.expression)
+        self._push(expr.expression)
+
+    def visit_array_expr(self, expr: Array) -> None:
+        self._push(expr.elements)
+
+    def visit_index_expr(self, expr: Index) -> None:
+        self._push(expr.target, expr.index)
+
+    def visit_setindex_expr(self, expr: SetIndex) -> None:
+        self._push(expr.target, expr.index, expr.value)
 
     def visit_function_stmt(self, stmt: Function) -> None:
-        self._declare(stmt.name)
+        self._declare(stmt.name, stmt)
         self._define(stmt.name)
 
         self._resolve_function(stmt)
 
     def visit_var_stmt(self, stmt: Var) -> None:
-        self._declare(stmt.name)
-        if stmt.initializer is not None:
-            self._resolve(stmt.initializer)
-
-        self._define(stmt.name)
+        self._declare(stmt.name, stmt)
+        # defined only once the initializer has been resolved
+        self._push(stmt.initializer, lambda: self._define(stmt.name))
 
     def visit_expression_stmt(self, stmt: Expression) -> None:
-        self._resolve(stmt)
+        self._push(stmt.expression)
 
     def visit_if_stmt(self, stmt: If) -> None:
-        self._resolve(stmt.condition)
-        self._resolve(stmt.branch_true)
-        if stmt.branch_false is not None:
-            self._resolve(stmt.branch_false)
+        self._push(stmt.condition, stmt.branch_true, stmt.branch_false)
 
     def visit_print_stmt(self, stmt: Print) -> None:
-        self._resolve(stmt.expression)
+        self._push(stmt.expression)
 
     def visit_return_stmt(self, stmt: Return) -> None:
-        raise NotImplementedError
+        if self.function.enclosing is None:
+            error.ThrowError(stmt.keyword, "Can't return from top-level code.")
+
+        self._push(stmt.value)
 
     def visit_while_stmt(self, stmt: While) -> None:
-        self._resolve(stmt.condition)
-        self._resolve(stmt.body)
+        self._push(stmt.condition, stmt.body)
 
     def visit_block_stmt(self, stmt: Block) -> None:
-        self._begin_scope()
-        self._resolve(stmt.statements)
-        self._end_scope()
+        self._begin_block(stmt)
+        self._push(stmt.statements, self._end_scope)
@@ -1,42 +1,102 @@
-from typing import List, Dict
-from .token import Token, TokenType as TokenType
-from lox.error import ThrowError
+import itertools
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+from .token import Token, TokenType
+from lox.error import LoxIncompleteInput, ThrowScanError
+
+
+KEYWORDS: Dict[str, int] = {
+    "and": TokenType.AND,
+    "class": TokenType.CLASS,
+    "else": TokenType.ELSE,
+    "false": TokenType.FALSE,
+    "for": TokenType.FOR,
+    "fun": TokenType.FUN,
+    "if": TokenType.IF,
+    "nil": TokenType.NIL,
+    "or": TokenType.OR,
+    "print": TokenType.PRINT,
+    "return": TokenType.RETURN,
+    "super": TokenType.SUPER,
+    "this": TokenType.THIS,
+    "true": TokenType.TRUE,
+    "var": TokenType.VAR,
+    "while": TokenType.WHILE,
+}
+
+OPERATORS: Dict[str, int] = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    "[": TokenType.LEFT_BRACKET,
+    "]": TokenType.RIGHT_BRACKET,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "!": TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=": TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    "<": TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+    ">": TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+}
+
+# One alternative per kind of lexeme, tried in order at each position. The
+# final `error` alternative matches any other single character, so the
+# matches cover the whole source.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<space>[ \t\r\n]+)
+    |(?P<comment>//[^\n]*)
+    |(?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<number>[0-9]+(?:\.[0-9]+)?)
+    |(?P<operator>[!=<>]=?|[(){}\[\],.\-+;*/])
+    |(?P<string>"[^"]*")
+    |(?P<unterminated>"[^"]*)
+    |(?P<error>.)
+    """,
+    re.VERBOSE,
+)
 
 
 class Scanner:
+    """
+    Hand written scanner, stepping through the source one character at a
+    time
+
+    :param str source: program source
+    :param Optional[Dict[str, str]] symbols: symbol table used to share
+    identifier and keyword lexemes. Pass the same table to every scanner
+    of a session, so a name that appears many times is stored once.
+    """
+
     source: str
     tokens: List[Token]
     start: int
     current: int
     line: int
-    keywords: Dict[str, TokenType]
+    keywords: Dict[str, int]
+    symbols: Dict[str, str]
 
-    def __init__(self, source: str) -> None:
+    def __init__(
+        self, source: str, symbols: Optional[Dict[str, str]] = None
+    ) -> None:
         self.source = source
         self.tokens = []
+        self.symbols = {} if symbols is None else symbols
 
         self.start = 0
         self.current = 0
         self.line = 1
 
-        self.keywords = {
-            "and": TokenType.AND,
-            "class": TokenType.CLASS,
-            "else": TokenType.ELSE,
-            "false": TokenType.FALSE,
-            "for": TokenType.FOR,
-            "fun": TokenType.FUN,
-            "if": TokenType.IF,
-            "nil": TokenType.NIL,
-            "or": TokenType.OR,
-            "print": TokenType.PRINT,
-            "return": TokenType.RETURN,
-            "super": TokenType.SUPER,
-            "this": TokenType.THIS,
-            "true": TokenType.TRUE,
-            "var": TokenType.VAR,
-            "while": TokenType.WHILE,
-        }
+        self.keywords = KEYWORDS
 
     def _is_at_end(self) -> bool:
         return self.current >= len(self.source)
@@ -45,7 +105,7 @@ class Scanner:
         self.current += 1
         return self.source[self.current - 1]
 
-    def _add_token(self, type: TokenType, literal: object = None) -> None:
+    def _add_token(self, type: int, literal: object = None) -> None:
         text = self.source[self.start:self.current]
         self.tokens.append(Token(type, text, literal, self.line))
 
@@ -72,7 +132,7 @@ class Scanner:
             self._advance()
 
         if self._is_at_end():
-            ThrowError(self.line, "Unterminated string.")
+            ThrowScanError(self.line, "Unterminated string.")
             return
 
         # closing quotation in string
@@ -117,12 +177,13 @@ class Scanner:
             self._advance()
 
         text = self.source[self.start : self.current]
+        text = self.symbols.setdefault(text, text)
         type = self.keywords.get(text)
 
         if type is None:
             type = TokenType.IDENTIFIER
 
-        self._add_token(type)
+        self.tokens.append(Token(type, text, None, self.line))
 
     def _scan_token(self) -> None:
         c = self._advance()
@@ -135,6 +196,10 @@ class Scanner:
             self._add_token(TokenType.LEFT_BRACE)
         elif c == "}":
             self._add_token(TokenType.RIGHT_BRACE)
+        elif c == "[":
+            self._add_token(TokenType.LEFT_BRACKET)
+        elif c == "]":
+            self._add_token(TokenType.RIGHT_BRACKET)
         elif c == ",":
             self._add_token(TokenType.COMMA)
         elif c == ".":
@@ -183,7 +248,7 @@ class Scanner:
             elif self._is_alpha(c):
                 self._identifier()
             else:
-                ThrowError(self.line, "Unexpected character.")
+                ThrowScanError(self.line, "Unexpected character.")
 
     def scan_tokens(self) -> List[Token]:
         while not self._is_at_end():
@@ -192,3 +257,134 @@ class Scanner:
 
         self.tokens.append(Token(TokenType.EOF, "", None, self.line))
         return self.tokens
+
+
+class ReplScanner(Scanner):
+    """
+    Scanner for REPL input, which raises `LoxIncompleteInput` instead of
+    reporting a string that is still open at the end of the input
+    """
+
+    def _string(self) -> None:
+        if self.source.find('"', self.current) < 0:
+            raise LoxIncompleteInput()
+
+        super()._string()
+
+
+def scan_chunks(
+    chunks: Iterable[str], symbols: Optional[Dict[str, str]] = None
+) -> Iterator[Token]:
+    """
+    Yield the tokens of the source made up of `chunks`, ending with EOF.
+    Identifier, keyword and operator lexemes are shared through `symbols`,
+    as in `Scanner`.
+
+    A match that reaches the last character of the text buffered so far may
+    be cut short by the chunk boundary (an identifier, `1.` before `5`, `!`
+    before `=`, an unfinished string or comment), so it is carried over and
+    rescanned together with the next chunk.
+    """
+    keywords = KEYWORDS
+    operators = OPERATORS
+    identifier = TokenType.IDENTIFIER
+    if symbols is None:
+        symbols = {}
+    intern = symbols.setdefault
+    line = 1
+    rest = ""
+
+    for chunk in itertools.chain(chunks, (None,)):
+        final = chunk is None
+        buffer = rest if chunk is None else rest + chunk
+        limit = len(buffer) - 1
+        position = 0
+
+        for match in TOKEN_PATTERN.finditer(buffer):
+            end = match.end()
+            if end >= limit and not final:
+                break
+            position = end
+
+            kind = match.lastgroup
+            text = match.group()
+
+            if kind == "identifier":
+                text = intern(text, text)
+                yield Token(keywords.get(text, identifier), text, None, line)
+            elif kind == "space":
+                line += text.count("\n")
+            elif kind == "operator":
+                text = intern(text, text)
+                yield Token(operators[text], text, None, line)
+            elif kind == "number":
+                yield Token(TokenType.NUMBER, text, float(text), line)
+            elif kind == "string":
+                # like `Scanner`, a multi-line string gets the line it ends on
+                line += text.count("\n")
+                yield Token(TokenType.STRING, text, text[1:-1], line)
+            elif kind == "comment":
+                pass
+            elif kind == "unterminated":
+                line += text.count("\n")
+                ThrowScanError(line, "Unterminated string.")
+            else:
+                ThrowScanError(line, "Unexpected character.")
+
+        rest = buffer[position:]
+
+    yield Token(TokenType.EOF, "", None, line)
+
+
+class RegexScanner:
+    """
+    Scanner driven by the single compiled `TOKEN_PATTERN`, instead of
+    stepping through the source one character at a time. Produces the same
+    tokens and errors as `Scanner`.
+    """
+
+    source: str
+    tokens: List[Token]
+    symbols: Dict[str, str]
+
+    def __init__(
+        self, source: str, symbols: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.source = source
+        self.tokens = []
+        self.symbols = {} if symbols is None else symbols
+
+    def scan_tokens(self) -> List[Token]:
+        self.tokens.extend(scan_chunks((self.source,), self.symbols))
+        return self.tokens
+
+
+class StreamScanner:
+    """
+    Scanner that reads its source from a file in chunks and produces tokens
+    on demand, so the whole script never has to be in memory at once.
+    Produces the same tokens and errors as `Scanner`, though errors are
+    reported as the tokens are consumed.
+
+    :param TextIO file: file to read the source from
+    :param int chunk_size: number of characters to read at a time
+    :param Optional[Dict[str, str]] symbols: symbol table, as in `Scanner`
+    """
+
+    file: TextIO
+    chunk_size: int
+    symbols: Dict[str, str]
+
+    def __init__(
+        self,
+        file: TextIO,
+        chunk_size: int = 1 << 16,
+        symbols: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.symbols = {} if symbols is None else symbols
+
+    def __iter__(self) -> Iterator[Token]:
+        chunks = iter(lambda: self.file.read(self.chunk_size), "")
+        return scan_chunks(chunks, self.symbols)
@@ -1,7 +1,6 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import TypeVar, Generic, List, Optional
+from typing import Any, Callable, TypeVar, Generic, List, Optional, Tuple
 
 from lox.token import Token
 
@@ -9,13 +8,64 @@ from lox.token import Token
 T = TypeVar("T")
 
 
+class ExprKind:
+    """
+    Integer tag of each `Expr` class, stored in its `kind` attribute.
+    Tags are never reused, so new classes go at the end.
+    """
+
+    ASSIGN = 0
+    LOGICAL = 1
+    BINARY = 2
+    UNARY = 3
+    CALL = 4
+    LITERAL = 5
+    VARIABLE = 6
+    GROUPING = 7
+    ARRAY = 8
+    INDEX = 9
+    SETINDEX = 10
+
+
+# name of the visitor method for each kind
+EXPR_VISITORS: Tuple[str, ...] = (
+    "visit_assign_expr",
+    "visit_logical_expr",
+    "visit_binary_expr",
+    "visit_unary_expr",
+    "visit_call_expr",
+    "visit_literal_expr",
+    "visit_variable_expr",
+    "visit_grouping_expr",
+    "visit_array_expr",
+    "visit_index_expr",
+    "visit_setindex_expr",
+)
+
+
 class Expr:
+    __slots__ = ()
+
+    kind: int
+    _fields: Tuple[str, ...]
+
     def accept(self, visitor: ExprVisitor[T]) -> T:
-        name = type(self).__qualname__.replace(".", "_").lower()
-        return getattr(visitor, f"visit_{name}_expr")(self)
+        return visitor._expr_table[self.kind](visitor, self)
+
+    def __repr__(self) -> str:
+        fields = (f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({', '.join(fields)})"
 
 
 class ExprVisitor(ABC, Generic[T]):
+    # visitor method for each kind, looked up once per visitor class
+    # instead of on every visit
+    _expr_table: Tuple[Callable[[Any, Any], Any], ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._expr_table = tuple(getattr(cls, name) for name in EXPR_VISITORS)
+
     @abstractmethod
     def visit_assign_expr(self, expr: Assign) -> T:
         raise NotImplementedError
@@ -48,21 +98,52 @@ class ExprVisitor(ABC, Generic[T]):
     def visit_grouping_expr(self, expr: Grouping) -> T:
         raise NotImplementedError
 
+    @abstractmethod
+    def visit_array_expr(self, expr: Array) -> T:
+        raise NotImplementedError
+
+    @abstractmethod
+    def visit_index_expr(self, expr: Index) -> T:
+        raise NotImplementedError
+
+    @abstractmethod
+    def visit_setindex_expr(self, expr: SetIndex) -> T:
+        raise NotImplementedError
+
 
-@dataclass
 class Assign(Expr):
     """
     Assign expression
 
     :param Token name:
     :param Expr value:
+    :param int depth:
+    :param int slot:
     """
 
+    __slots__ = ("name", "value", "depth", "slot")
+
+    kind = ExprKind.ASSIGN
+    _fields = __slots__
+
     name: Token
     value: Expr
+    depth: int
+    slot: int
+
+    def __init__(
+        self,
+        name: Token,
+        value: Expr,
+        depth: int = -1,
+        slot: int = -1,
+    ) -> None:
+        self.name = name
+        self.value = value
+        self.depth = depth
+        self.slot = slot
 
 
-@dataclass
 class Logical(Expr):
     """
     Logical expression
@@ -72,12 +153,21 @@ class Logical(Expr):
     :param Expr right:
     """
 
+    __slots__ = ("left", "operator", "right")
+
+    kind = ExprKind.LOGICAL
+    _fields = __slots__
+
     left: Expr
     operator: Token
     right: Expr
 
+    def __init__(self, left: Expr, operator: Token, right: Expr) -> None:
+        self.left = left
+        self.operator = operator
+        self.right = right
+
 
-@dataclass
 class Binary(Expr):
     """
     Binary expression
@@ -87,12 +177,21 @@ class Binary(Expr):
     :param Expr right:
     """
 
+    __slots__ = ("left", "operator", "right")
+
+    kind = ExprKind.BINARY
+    _fields = __slots__
+
     left: Expr
     operator: Token
     right: Expr
 
+    def __init__(self, left: Expr, operator: Token, right: Expr) -> None:
+        self.left = left
+        self.operator = operator
+        self.right = right
+
 
-@dataclass
 class Unary(Expr):
     """
     Unary expression
@@ -101,11 +200,19 @@ class Unary(Expr):
     :param Expr right:
     """
 
+    __slots__ = ("operator", "right")
+
+    kind = ExprKind.UNARY
+    _fields = __slots__
+
     operator: Token
     right: Expr
 
+    def __init__(self, operator: Token, right: Expr) -> None:
+        self.operator = operator
+        self.right = right
+
 
-@dataclass
 class Call(Expr):
     """
     Call expression
@@ -115,12 +222,26 @@ class Call(Expr):
     :param List[Expr] arguments:
     """
 
+    __slots__ = ("callee", "paren", "arguments")
+
+    kind = ExprKind.CALL
+    _fields = __slots__
+
     callee: Expr
     paren: Token
     arguments: List[Expr]
 
+    def __init__(
+        self,
+        callee: Expr,
+        paren: Token,
+        arguments: List[Expr],
+    ) -> None:
+        self.callee = callee
+        self.paren = paren
+        self.arguments = arguments
+
 
-@dataclass
 class Literal(Expr):
     """
     Literal expression
@@ -128,21 +249,41 @@ class Literal(Expr):
     :param object value:
     """
 
+    __slots__ = ("value",)
+
+    kind = ExprKind.LITERAL
+    _fields = __slots__
+
     value: object
 
+    def __init__(self, value: object) -> None:
+        self.value = value
+
 
-@dataclass
 class Variable(Expr):
     """
     Variable expression
 
     :param Token name:
+    :param int depth:
+    :param int slot:
     """
 
+    __slots__ = ("name", "depth", "slot")
+
+    kind = ExprKind.VARIABLE
+    _fields = __slots__
+
     name: Token
+    depth: int
+    slot: int
+
+    def __init__(self, name: Token, depth: int = -1, slot: int = -1) -> None:
+        self.name = name
+        self.depth = depth
+        self.slot = slot
 
 
-@dataclass
 class Grouping(Expr):
     """
     Grouping expression
@@ -150,4 +291,90 @@ class Grouping(Expr):
     :param Expr expression:
     """
 
+    __slots__ = ("expression",)
+
+    kind = ExprKind.GROUPING
+    _fields = __slots__
+
     expression: Expr
+
+    def __init__(self, expression: Expr) -> None:
+        self.expression = expression
+
+
+class Array(Expr):
+    """
+    Array expression
+
+    :param Token bracket:
+    :param List[Expr] elements:
+    """
+
+    __slots__ = ("bracket", "elements")
+
+    kind = ExprKind.ARRAY
+    _fields = __slots__
+
+    bracket: Token
+    elements: List[Expr]
+
+    def __init__(self, bracket: Token, elements: List[Expr]) -> None:
+        self.bracket = bracket
+        self.elements = elements
+
+
+class Index(Expr):
+    """
+    Index expression
+
+    :param Expr target:
+    :param Token bracket:
+    :param Expr index:
+    """
+
+    __slots__ = ("target", "bracket", "index")
+
+    kind = ExprKind.INDEX
+    _fields = __slots__
+
+    target: Expr
+    bracket: Token
+    index: Expr
+
+    def __init__(self, target: Expr, bracket: Token, index: Expr) -> None:
+        self.target = target
+        self.bracket = bracket
+        self.index = index
+
+
+class SetIndex(Expr):
+    """
+    SetIndex expression
+
+    :param Expr target:
+    :param Token bracket:
+    :param Expr index:
+    :param Expr value:
+    """
+
+    __slots__ = ("target", "bracket", "index", "value")
+
+    kind = ExprKind.SETINDEX
+    _fields = __slots__
+
+    target: Expr
+    bracket: Token
+    index: Expr
+    value: Expr
+
+    def __init__(
+        self,
+        target: Expr,
+        bracket: Token,
+        index: Expr,
+        value: Expr,
+    ) -> None:
+        self.target = target
+        self.bracket = bracket
+        self.index = index
+        self.value = value
@@ -0,0 +1,220 @@
+from __future__ import annotations
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+from lox.syntax import expr, stmt
+
+
+Node = Union[expr.Expr, stmt.Stmt]
+
+# how a field is stored in `FlatTree.fields`
+NODE = 0  # node number
+OPTIONAL_NODE = 1  # node number, or -1 for None
+NODES = 2  # length of the list, then the node number of each item
+INT = 3  # the int itself
+BOOL = 4  # 1 or 0
+OBJECT = 5  # index into `FlatTree.objects`
+
+# every node class, `Expr`s then `Stmt`s, each in kind order
+NODE_CLASSES: Tuple[type, ...] = (
+    expr.Assign,
+    expr.Logical,
+    expr.Binary,
+    expr.Unary,
+    expr.Call,
+    expr.Literal,
+    expr.Variable,
+    expr.Grouping,
+    expr.Array,
+    expr.Index,
+    expr.SetIndex,
+    stmt.Function,
+    stmt.Var,
+    stmt.Expression,
+    stmt.If,
+    stmt.Print,
+    stmt.Return,
+    stmt.While,
+    stmt.Block,
+)
+
+# how each field of each class in `NODE_CLASSES` is stored
+NODE_FIELDS: Tuple[Tuple[int, ...], ...] = (
+    (OBJECT, NODE, INT, INT),  # Assign
+    (NODE, OBJECT, NODE),  # Logical
+    (NODE, OBJECT, NODE),  # Binary
+    (OBJECT, NODE),  # Unary
+    (NODE, OBJECT, NODES),  # Call
+    (OBJECT,),  # Literal
+    (OBJECT, INT, INT),  # Variable
+    (NODE,),  # Grouping
+    (OBJECT, NODES),  # Array
+    (NODE, OBJECT, NODE),  # Index
+    (NODE, OBJECT, NODE, NODE),  # SetIndex
+    (OBJECT, OBJECT, NODES, OBJECT, OBJECT, BOOL),  # Function
+    (OBJECT, OPTIONAL_NODE, BOOL),  # Var
+    (NODE,),  # Expression
+    (NODE, NODE, OPTIONAL_NODE),  # If
+    (NODE,),  # Print
+    (OBJECT, OPTIONAL_NODE),  # Return
+    (NODE, NODE),  # While
+    (NODES, INT),  # Block
+)
+
+CLASS_INDEX: Dict[type, int] = {
+    cls: i for (i, cls) in enumerate(NODE_CLASSES)
+}
+
+
+class FlatTreeError(Exception):
+    """Raised when the arrays of a `FlatTree` don't describe a tree"""
+
+
+class FlatTree:
+    """
+    Struct of arrays encoding of a list of statements. Nodes are numbered
+    in post order, so children come before their parents, and each node's
+    fields are stored in `fields` one after another in node order, as
+    `NODE_FIELDS` says.
+
+    :param array classes: index into `NODE_CLASSES` of each node
+    :param array fields: field entries of every node
+    :param List[object] objects: tokens, literal values and other fields
+    that aren't nodes or numbers
+    :param array roots: the statements, as node numbers
+    """
+
+    __slots__ = ("classes", "fields", "objects", "roots")
+
+    classes: array
+    fields: array
+    objects: List[object]
+    roots: array
+
+    def __init__(self) -> None:
+        self.classes = array("B")
+        self.fields = array("q")
+        self.objects = []
+        self.roots = array("q")
+
+    @classmethod
+    def encode(cls, statements: List[stmt.Stmt]) -> FlatTree:
+        tree = cls()
+        for statement in statements:
+            tree.roots.append(tree._add(statement))
+        return tree
+
+    def _add(self, root: Node) -> int:
+        """
+        Add `root` and everything under it, and return its number. Nodes
+        are visited from an explicit stack, twice each: once to schedule
+        their children, and once the children have been numbered.
+        """
+        # numbers of the nodes added whose parent hasn't been yet
+        numbers: List[int] = []
+        work: List[Tuple[Node, Optional[List[Node]]]] = [(root, None)]
+
+        while work:
+            (node, children) = work.pop()
+            index = CLASS_INDEX[type(node)]
+
+            if children is None:
+                children = []
+                for (field, how) in zip(node._fields, NODE_FIELDS[index]):
+                    value = getattr(node, field)
+                    if how == NODES:
+                        children.extend(value)
+                    elif how in (NODE, OPTIONAL_NODE) and value is not None:
+                        children.append(value)
+
+                work.append((node, children))
+                work.extend((child, None) for child in reversed(children))
+                continue
+
+            start = len(numbers) - len(children)
+            child_numbers = iter(numbers[start:])
+            del numbers[start:]
+
+            fields = self.fields
+            for (field, how) in zip(node._fields, NODE_FIELDS[index]):
+                value = getattr(node, field)
+                if how == NODE:
+                    fields.append(next(child_numbers))
+                elif how == OPTIONAL_NODE:
+                    fields.append(-1 if value is None else next(child_numbers))
+                elif how == NODES:
+                    fields.append(len(value))
+                    fields.extend(next(child_numbers) for _ in value)
+                elif how == INT or how == BOOL:
+                    fields.append(int(value))
+                else:
+                    fields.append(len(self.objects))
+                    self.objects.append(value)
+
+            self.classes.append(index)
+            numbers.append(len(self.classes) - 1)
+
+        return numbers[0]
+
+    def decode(self) -> List[stmt.Stmt]:
+        """
+        Build the statements back
+
+        :raises FlatTreeError: if the arrays don't describe a tree
+        """
+        nodes: List[Node] = []
+        fields = iter(self.fields)
+        objects = self.objects
+
+        try:
+            for index in self.classes:
+                args: List[object] = []
+                for how in NODE_FIELDS[index]:
+                    entry = next(fields)
+                    if how == NODE:
+                        args.append(nodes[entry])
+                    elif how == OPTIONAL_NODE:
+                        args.append(None if entry < 0 else nodes[entry])
+                    elif how == NODES:
+                        items = [nodes[next(fields)] for _ in range(entry)]
+                        args.append(items)
+                    elif how == INT:
+                        args.append(entry)
+                    elif how == BOOL:
+                        args.append(entry != 0)
+                    else:
+                        args.append(objects[entry])
+
+                nodes.append(NODE_CLASSES[index](*args))
+
+            return [nodes[root] for root in self.roots]  # type: ignore
+        except (IndexError, StopIteration) as err:
+            raise FlatTreeError("malformed tree") from err
+
+    def __getstate__(self) -> Tuple[bytes, bytes, List[object], bytes]:
+        # the arrays as bytes, so unpickling needs no classes but lox's own
+        return (
+            self.classes.tobytes(),
+            self.fields.tobytes(),
+            self.objects,
+            self.roots.tobytes(),
+        )
+
+    def __setstate__(
+        self, state: Tuple[bytes, bytes, List[object], bytes]
+    ) -> None:
+        self.__init__()  # type: ignore
+        try:
+            (classes, fields, objects, roots) = state
+            self.classes.frombytes(classes)
+            self.fields.frombytes(fields)
+            self.roots.frombytes(roots)
+        except (TypeError, ValueError) as err:
+            raise FlatTreeError("malformed state") from err
+
+        if type(objects) is not list:
+            raise FlatTreeError("malformed state")
+        self.objects = objects
+
+    def __len__(self) -> int:
+        return len(self.classes)
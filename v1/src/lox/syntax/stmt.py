@@ -1,7 +1,6 @@
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import TypeVar, Generic, List, Optional
+from typing import Any, Callable, TypeVar, Generic, List, Optional, Tuple
 
 from lox.token import Token
 from lox.syntax.expr import Expr
@@ -10,13 +9,58 @@ from lox.syntax.expr import Expr
 T = TypeVar("T")
 
 
+class StmtKind:
+    """
+    Integer tag of each `Stmt` class, stored in its `kind` attribute.
+    Tags are never reused, so new classes go at the end.
+    """
+
+    FUNCTION = 0
+    VAR = 1
+    EXPRESSION = 2
+    IF = 3
+    PRINT = 4
+    RETURN = 5
+    WHILE = 6
+    BLOCK = 7
+
+
+# name of the visitor method for each kind
+STMT_VISITORS: Tuple[str, ...] = (
+    "visit_function_stmt",
+    "visit_var_stmt",
+    "visit_expression_stmt",
+    "visit_if_stmt",
+    "visit_print_stmt",
+    "visit_return_stmt",
+    "visit_while_stmt",
+    "visit_block_stmt",
+)
+
+
 class Stmt:
+    __slots__ = ()
+
+    kind: int
+    _fields: Tuple[str, ...]
+
     def accept(self, visitor: StmtVisitor[T]) -> T:
-        name = type(self).__qualname__.replace(".", "_").lower()
-        return getattr(visitor, f"visit_{name}_stmt")(self)
+        return visitor._stmt_table[self.kind](visitor, self)
+
+    def __repr__(self) -> str:
+        fields = (f"{f}={getattr(self, f)!r}" for f in self._fields)
+        return f"{type(self).__name__}({', '.join(fields)})"
 
 
 class StmtVisitor(ABC, Generic[T]):
+    # visitor method for each kind, looked up once per visitor class
+    # instead of on every visit
+    _stmt_table: Tuple[Callable[[Any, Any], Any], ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._stmt_table = tuple(getattr(cls, name) for name in STMT_VISITORS)
+
     @abstractmethod
     def visit_function_stmt(self, stmt: Function) -> T:
         raise NotImplementedError
@@ -50,7 +94,6 @@ class StmtVisitor(ABC, Generic[T]):
         raise NotImplementedError
 
 
-@dataclass
 class Function(Stmt):
     """
     Function statement
@@ -58,27 +101,76 @@ class Function(Stmt):
     :param Token name:
     :param List[Token] params:
     :param List[Stmt] body:
+    :param Tuple[Tuple[int, int], ...] upvalues:
+    :param Tuple[int, ...] captured_params:
+    :param bool captured:
     """
 
+    __slots__ = (
+        "name",
+        "params",
+        "body",
+        "upvalues",
+        "captured_params",
+        "captured",
+    )
+
+    kind = StmtKind.FUNCTION
+    _fields = __slots__
+
     name: Token
     params: List[Token]
     body: List[Stmt]
+    upvalues: Tuple[Tuple[int, int], ...]
+    captured_params: Tuple[int, ...]
+    captured: bool
+
+    def __init__(
+        self,
+        name: Token,
+        params: List[Token],
+        body: List[Stmt],
+        upvalues: Tuple[Tuple[int, int], ...] = (),
+        captured_params: Tuple[int, ...] = (),
+        captured: bool = False,
+    ) -> None:
+        self.name = name
+        self.params = params
+        self.body = body
+        self.upvalues = upvalues
+        self.captured_params = captured_params
+        self.captured = captured
 
 
-@dataclass
 class Var(Stmt):
     """
     Var statement
 
     :param Token name:
     :param Optional[Expr] initializer:
+    :param bool captured:
     """
 
+    __slots__ = ("name", "initializer", "captured")
+
+    kind = StmtKind.VAR
+    _fields = __slots__
+
     name: Token
     initializer: Optional[Expr]
+    captured: bool
+
+    def __init__(
+        self,
+        name: Token,
+        initializer: Optional[Expr],
+        captured: bool = False,
+    ) -> None:
+        self.name = name
+        self.initializer = initializer
+        self.captured = captured
 
 
-@dataclass
 class Expression(Stmt):
     """
     Expression statement
@@ -86,10 +178,17 @@ class Expression(Stmt):
     :param Expr expression:
     """
 
+    __slots__ = ("expression",)
+
+    kind = StmtKind.EXPRESSION
+    _fields = __slots__
+
     expression: Expr
 
+    def __init__(self, expression: Expr) -> None:
+        self.expression = expression
+
 
-@dataclass
 class If(Stmt):
     """
     If statement
@@ -99,12 +198,26 @@ class If(Stmt):
     :param Optional[Stmt] branch_false:
     """
 
+    __slots__ = ("condition", "branch_true", "branch_false")
+
+    kind = StmtKind.IF
+    _fields = __slots__
+
     condition: Expr
     branch_true: Stmt
     branch_false: Optional[Stmt]
 
+    def __init__(
+        self,
+        condition: Expr,
+        branch_true: Stmt,
+        branch_false: Optional[Stmt],
+    ) -> None:
+        self.condition = condition
+        self.branch_true = branch_true
+        self.branch_false = branch_false
+
 
-@dataclass
 class Print(Stmt):
     """
     Print statement
@@ -112,10 +225,17 @@ class Print(Stmt):
     :param Expr expression:
     """
 
+    __slots__ = ("expression",)
+
+    kind = StmtKind.PRINT
+    _fields = __slots__
+
     expression: Expr
 
+    def __init__(self, expression: Expr) -> None:
+        self.expression = expression
+
 
-@dataclass
 class Return(Stmt):
     """
     Return statement
@@ -124,11 +244,19 @@ class Return(Stmt):
     :param Optional[Expr] value:
     """
 
+    __slots__ = ("keyword", "value")
+
+    kind = StmtKind.RETURN
+    _fields = __slots__
+
     keyword: Token
     value: Optional[Expr]
 
+    def __init__(self, keyword: Token, value: Optional[Expr]) -> None:
+        self.keyword = keyword
+        self.value = value
+
 
-@dataclass
 class While(Stmt):
     """
     While statement
@@ -137,16 +265,35 @@ class While(Stmt):
     :param Stmt body:
     """
 
+    __slots__ = ("condition", "body")
+
+    kind = StmtKind.WHILE
+    _fields = __slots__
+
     condition: Expr
     body: Stmt
 
+    def __init__(self, condition: Expr, body: Stmt) -> None:
+        self.condition = condition
+        self.body = body
+
 
-@dataclass
 class Block(Stmt):
     """
     Block statement
 
     :param List[Stmt] statements:
+    :param int base:
     """
 
+    __slots__ = ("statements", "base")
+
+    kind = StmtKind.BLOCK
+    _fields = __slots__
+
     statements: List[Stmt]
+    base: int
+
+    def __init__(self, statements: List[Stmt], base: int = -1) -> None:
+        self.statements = statements
+        self.base = base
@@ -0,0 +1,355 @@
+"""
+Run Lox test scripts in parallel and check their output against the
+expectations written in their comments, as in the crafting interpreters
+test suite:
+
+    print 1 + 2; // expect: 3
+    print -"a"; // expect runtime error: Operand must be a number
+    var a = ; // Error at ';': Expected expression
+    // [line 3] Error at end: Expected '}' after block
+
+Scripts run inside a pool of worker processes, each of which imports the
+interpreter once and then runs many scripts. With `--optimize` they run
+through the optimizer first, and must give the same results. With
+`--cache` each script's front end output goes through a `ProgramCache`,
+and the script is checked when run from it.
+
+    python -m lox.testrunner tests --engine all
+    python -m lox.testrunner tests --engine all --optimize
+    python -m lox.testrunner tests --engine all --cache
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import os
+import re
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from . import config
+from .cache import ProgramCache
+from .main import ENGINES, run
+
+
+EXPECTED_OUTPUT = re.compile(r"// expect: ?(.*)")
+EXPECTED_RUNTIME_ERROR = re.compile(r"// expect runtime error: (.+)")
+EXPECTED_ERROR = re.compile(r"// (Error.*)")
+EXPECTED_ERROR_LINE = re.compile(r"// \[line (\d+)\] (Error.*)")
+
+# what `--optimize` reports on stderr, which scripts don't expect
+OPTIMIZER_REPORT = re.compile(r"\[optimizer\] removed \d+ nodes")
+
+# exit codes of `python -m lox` for each kind of error
+COMPILE_ERROR = 65
+RUNTIME_ERROR = 70
+
+# a script to run: its path, the engine, and whether to optimize it and run
+# it from the cache
+Job = Tuple[str, str, bool, bool]
+
+
+class Expectations:
+    """
+    Output a test script expects, read from its comments
+
+    :param List[str] output: lines expected on stdout, including the report
+    of an expected runtime error
+    :param List[str] errors: lines expected on stderr
+    :param int status: expected exit code
+    """
+
+    __slots__ = ("output", "errors", "status")
+
+    output: List[str]
+    errors: List[str]
+    status: int
+
+    def __init__(self, source: str) -> None:
+        self.output = []
+        self.errors = []
+        self.status = 0
+        runtime_error: Optional[Tuple[str, int]] = None
+
+        for (number, line) in enumerate(source.splitlines(), 1):
+            match = EXPECTED_OUTPUT.search(line)
+            if match:
+                self.output.append(match.group(1))
+                continue
+
+            match = EXPECTED_RUNTIME_ERROR.search(line)
+            if match:
+                runtime_error = (match.group(1), number)
+                self.status = RUNTIME_ERROR
+                continue
+
+            match = EXPECTED_ERROR_LINE.search(line)
+            if match:
+                self.errors.append(f"[line {match.group(1)}] {match.group(2)}")
+                self.status = COMPILE_ERROR
+                continue
+
+            match = EXPECTED_ERROR.search(line)
+            if match:
+                self.errors.append(f"[line {number}] {match.group(1)}")
+                self.status = COMPILE_ERROR
+
+        # runtime errors are reported on stdout, after the output so far
+        if runtime_error is not None:
+            (message, number) = runtime_error
+            self.output.extend([message, f"[line {number}]"])
+
+
+class TestResult:
+    """
+    Outcome of running one script on one engine
+
+    :param str path: script that was run
+    :param str engine: key into `ENGINES`
+    :param bool optimize: whether the script ran through the optimizer
+    :param bool cache: whether the script ran from the cache
+    :param List[str] failures: how the run differed from the expectations,
+    empty if it passed
+    :param float elapsed: seconds spent running the script
+    """
+
+    __slots__ = ("path", "engine", "optimize", "cache", "failures", "elapsed")
+
+    path: str
+    engine: str
+    optimize: bool
+    cache: bool
+    failures: List[str]
+    elapsed: float
+
+    def __init__(
+        self,
+        path: str,
+        engine: str,
+        optimize: bool,
+        cache: bool,
+        failures: List[str],
+        elapsed: float,
+    ) -> None:
+        self.path = path
+        self.engine = engine
+        self.optimize = optimize
+        self.cache = cache
+        self.failures = failures
+        self.elapsed = elapsed
+
+    @property
+    def passed(self) -> bool:
+        return not self.failures
+
+
+def run_script(
+    source: str,
+    engine: str,
+    optimize: bool = False,
+    cache: Optional[ProgramCache] = None,
+) -> Tuple[int, List[str], List[str]]:
+    """
+    Run `source` in this process, capturing what it prints. The optimizer's
+    report is left out of the stderr lines.
+
+    :param Optional[ProgramCache] cache: cache to run the script from, or
+    to store it in
+
+    :return: exit code `python -m lox` would have, stdout lines and stderr
+    lines
+    """
+    config.had_error = False
+    config.had_runtime_error = False
+
+    (stdout, stderr) = (io.StringIO(), io.StringIO())
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        run(source, engine=engine, optimize=optimize, cache=cache)
+
+    if config.had_error:
+        status = COMPILE_ERROR
+    elif config.had_runtime_error:
+        status = RUNTIME_ERROR
+    else:
+        status = 0
+
+    errors = [
+        line
+        for line in stderr.getvalue().splitlines()
+        if not OPTIMIZER_REPORT.fullmatch(line)
+    ]
+    return (status, stdout.getvalue().splitlines(), errors)
+
+
+def compare(name: str, expected: List[str], actual: List[str]) -> List[str]:
+    """Describe the first difference between the expected and actual lines"""
+    for (i, (want, got)) in enumerate(zip(expected, actual)):
+        if want != got:
+            return [f"{name} line {i + 1}: expected {want!r}, got {got!r}"]
+
+    if len(actual) > len(expected):
+        return [f"unexpected {name}: {actual[len(expected)]!r}"]
+    elif len(actual) < len(expected):
+        return [f"missing {name}: {expected[len(actual)]!r}"]
+
+    return []
+
+
+def run_test(job: Job) -> TestResult:
+    """
+    Run the script at `path` on `engine`, optimized if `optimize` is set,
+    and check its expectations. With `cache` set, the script is run once to
+    fill its `ProgramCache`, and checked when run again from it.
+    """
+    (path, engine, optimize, use_cache) = job
+    start = time.perf_counter()
+    failures: List[str] = []
+
+    try:
+        with open(path, "r") as file:
+            source = file.read()
+
+        expected = Expectations(source)
+        cache = None
+        if use_cache:
+            cache = ProgramCache(path, source, engine, optimize)
+            run_script(source, engine, optimize, cache)
+            if expected.status != COMPILE_ERROR and cache.load() is None:
+                failures.append("not stored in the cache")
+
+        (status, output, errors) = run_script(source, engine, optimize, cache)
+    except Exception as err:
+        elapsed = time.perf_counter() - start
+        return TestResult(
+            path, engine, optimize, use_cache, [f"crashed: {err!r}"], elapsed
+        )
+
+    elapsed = time.perf_counter() - start
+    failures += compare("output", expected.output, output)
+    failures += compare("error", expected.errors, errors)
+    if status != expected.status:
+        failures.append(f"exit code {status}, expected {expected.status}")
+
+    return TestResult(path, engine, optimize, use_cache, failures, elapsed)
+
+
+def find_scripts(paths: List[str]) -> List[str]:
+    """Expand directories in `paths` into the Lox scripts they contain"""
+    scripts: List[str] = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            scripts.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.endswith(".lox")
+            )
+        else:
+            scripts.append(path)
+
+    return scripts
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))  # type: ignore
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run_tests(jobs: List[Job], workers: int) -> List[TestResult]:
+    """
+    Run `jobs` on a pool of `workers` processes, printing each result as it
+    comes in. With one worker, run them in this process.
+    """
+    results: List[TestResult] = []
+
+    if workers <= 1:
+        for job in jobs:
+            results.append(run_test(job))
+            report(results[-1])
+        return results
+
+    # hand out jobs in batches, so each process runs many scripts while the
+    # work still spreads evenly
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for result in executor.map(run_test, jobs, chunksize=chunksize):
+            results.append(result)
+            report(result)
+
+    return results
+
+
+def report(result: TestResult) -> None:
+    status = "PASS" if result.passed else "FAIL"
+    engine = result.engine
+    if result.optimize:
+        engine += " optimized"
+    if result.cache:
+        engine += " cached"
+    print(
+        f"{status}  {result.path} [{engine}]"
+        f"  {result.elapsed * 1000:.1f}ms"
+    )
+    for failure in result.failures:
+        print(f"      {failure}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(
+        prog="python -m lox.testrunner",
+        description="run lox scripts and check their // expect: comments",
+    )
+    arg_parser.add_argument(
+        "paths", nargs="+", help="scripts, or directories of scripts, to run"
+    )
+    arg_parser.add_argument(
+        "--engine",
+        choices=[*ENGINES.keys(), "all"],
+        default="tree",
+        help="engine to run the scripts with, or all of them",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=available_cores(),
+        help="number of worker processes, default one per available core",
+    )
+    arg_parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="run the optimizer over each script first",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="run each script from the front end output it cached",
+    )
+    args = arg_parser.parse_args()
+
+    engines = list(ENGINES.keys()) if args.engine == "all" else [args.engine]
+    jobs = [
+        (script, engine, args.optimize, args.cache)
+        for script in find_scripts(args.paths)
+        for engine in engines
+    ]
+
+    start = time.perf_counter()
+    results = run_tests(jobs, min(args.jobs, len(jobs)))
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for result in results if not result.passed)
+    print(
+        f"\n{len(results) - failed} passed, {failed} failed in {elapsed:.2f}s"
+    )
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,94 @@
-from enum import Enum
+from typing import Dict
 
 
-class TokenType(Enum):
+class TokenType:
+    """
+    Token kinds, as plain int class attributes rather than an `Enum`: the
+    parser and interpreter compare them constantly, and looking up an
+    `Enum` member costs several times more than a class attribute. Use
+    `TOKEN_NAMES` to get the name of a kind.
+    """
+
     # Single-character tokens
     LEFT_PAREN = 1
     RIGHT_PAREN = 2
     LEFT_BRACE = 3
     RIGHT_BRACE = 4
-    COMMA = 5
-    DOT = 6
-    MINUS = 7
-    PLUS = 8
-    SEMICOLON = 9
-    SLASH = 10
-    STAR = 11
+    LEFT_BRACKET = 5
+    RIGHT_BRACKET = 6
+    COMMA = 7
+    DOT = 8
+    MINUS = 9
+    PLUS = 10
+    SEMICOLON = 11
+    SLASH = 12
+    STAR = 13
     # One or two character tokens
-    BANG = 12
-    BANG_EQUAL = 13
-    EQUAL = 14
-    EQUAL_EQUAL = 15
-    GREATER = 16
-    GREATER_EQUAL = 17
-    LESS = 18
-    LESS_EQUAL = 19
+    BANG = 14
+    BANG_EQUAL = 15
+    EQUAL = 16
+    EQUAL_EQUAL = 17
+    GREATER = 18
+    GREATER_EQUAL = 19
+    LESS = 20
+    LESS_EQUAL = 21
     # Literals
-    IDENTIFIER = 20
-    STRING = 21
-    NUMBER = 22
+    IDENTIFIER = 22
+    STRING = 23
+    NUMBER = 24
     # Keywords
-    AND = 23
-    CLASS = 24
-    ELSE = 25
-    FALSE = 26
-    FUN = 27
-    FOR = 28
-    IF = 29
-    NIL = 30
-    OR = 31
-    PRINT = 32
-    RETURN = 33
-    SUPER = 34
-    THIS = 35
-    TRUE = 36
-    VAR = 37
-    WHILE = 38
-    EOF = 39
+    AND = 25
+    CLASS = 26
+    ELSE = 27
+    FALSE = 28
+    FUN = 29
+    FOR = 30
+    IF = 31
+    NIL = 32
+    OR = 33
+    PRINT = 34
+    RETURN = 35
+    SUPER = 36
+    THIS = 37
+    TRUE = 38
+    VAR = 39
+    WHILE = 40
+    EOF = 41
+
+
+TOKEN_NAMES: Dict[int, str] = {
+    value: name
+    for (name, value) in vars(TokenType).items()
+    if isinstance(value, int)
+}
 
 
 class Token:
-    type: TokenType
+    """
+    Token
+
+    :param int type: one of the `TokenType` kinds
+    :param str lexeme: source text. Identifier and keyword lexemes are shared
+    through the scanner's symbol table
+    :param object literal: value of a string or number literal
+    :param int line:
+    """
+
+    __slots__ = ("type", "lexeme", "literal", "line")
+
+    type: int
     lexeme: str
     literal: object
     line: int
 
-    def __init__(
-        self, type: TokenType, lexeme: str, literal: object, line: int
-    ):
+    def __init__(self, type: int, lexeme: str, literal: object, line: int):
         self.type = type
         self.lexeme = lexeme
         self.literal = literal
         self.line = line
 
     def __str__(self) -> str:
-        return f"{self.type} {self.lexeme} {self.literal}"
+        return f"{TOKEN_NAMES[self.type]} {self.lexeme} {self.literal}"
 
     def __repr__(self) -> str:
-        return f"Token({self.type}, {self.lexeme}, {self.literal})"
+        return f"Token({TOKEN_NAMES[self.type]}, {self.lexeme}, {self.literal})"
@@ -0,0 +1,4 @@
+from .chunk import Chunk
+from .compiler import Compiler
+from .opcode import OpCode
+from .vm import VM, InterpretResult
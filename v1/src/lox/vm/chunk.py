@@ -0,0 +1,74 @@
+import math
+from array import array
+from typing import Dict, List, Tuple
+
+
+class Chunk:
+    """
+    A compiled sequence of bytecode
+
+    :param array code: instruction stream, one unsigned byte per entry
+    :param List[object] constants: constant pool referenced by index
+    :param Dict[Tuple[type, object], int] constant_index: index of each
+    string and number in `constants`, by type and value
+    :param array lines: run-length encoded source lines, stored as
+    alternating (line, number of bytes on that line) pairs
+    """
+
+    code: array
+    constants: List[object]
+    constant_index: Dict[Tuple[type, object], int]
+    lines: array
+
+    def __init__(self) -> None:
+        self.code = array("B")
+        self.constants = []
+        self.constant_index = {}
+        self.lines = array("L")
+
+    def write(self, byte: int, line: int) -> None:
+        self.code.append(byte)
+
+        if self.lines and self.lines[-2] == line:
+            self.lines[-1] += 1
+        else:
+            self.lines.append(line)
+            self.lines.append(1)
+
+    def write_short(self, value: int, line: int) -> None:
+        self.write((value >> 8) & 0xFF, line)
+        self.write(value & 0xFF, line)
+
+    def add_constant(self, value: object) -> int:
+        """
+        Add `value` to the constant pool, reusing an existing entry for
+        strings and numbers, and return its index
+        """
+        # -0 is equal to 0, but prints and divides differently
+        if not isinstance(value, (str, float)) or is_negative_zero(value):
+            self.constants.append(value)
+            return len(self.constants) - 1
+
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+
+        return index
+
+    def get_line(self, offset: int) -> int:
+        """Return the source line of the byte at `offset`"""
+        for i in range(0, len(self.lines), 2):
+            offset -= self.lines[i + 1]
+            if offset < 0:
+                return self.lines[i]
+
+        return self.lines[-2]
+
+    def count(self) -> int:
+        return len(self.code)
+
+
+def is_negative_zero(value: object) -> bool:
+    return value == 0 and math.copysign(1.0, value) < 0  # type: ignore
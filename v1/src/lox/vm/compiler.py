@@ -0,0 +1,501 @@
+from __future__ import annotations
+from typing import List, Optional, Union
+
+from lox.syntax.expr import (
+    Expr,
+    ExprVisitor,
+    Assign,
+    Logical,
+    Binary,
+    Unary,
+    Call,
+    Literal,
+    Variable,
+    Grouping,
+    Array,
+    Index,
+    SetIndex,
+)
+from lox.syntax.stmt import (
+    Stmt,
+    StmtVisitor,
+    Function,
+    Var,
+    Expression,
+    If,
+    Print,
+    Return,
+    While,
+    Block,
+)
+from lox.token import Token, TokenType
+from lox.interpreter import operator_chain
+from lox import error
+
+from .chunk import Chunk
+from .objects import VMFunction
+from .opcode import OpCode
+
+
+UINT8_COUNT = 256
+UINT16_MAX = 0xFFFF
+
+BINARY_OPS = {
+    TokenType.BANG_EQUAL: OpCode.NOT_EQUAL,
+    TokenType.EQUAL_EQUAL: OpCode.EQUAL,
+    TokenType.GREATER: OpCode.GREATER,
+    TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+    TokenType.LESS: OpCode.LESS,
+    TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+    TokenType.MINUS: OpCode.SUBTRACT,
+    TokenType.PLUS: OpCode.ADD,
+    TokenType.SLASH: OpCode.DIVIDE,
+    TokenType.STAR: OpCode.MULTIPLY,
+}
+
+
+class Local:
+    """
+    Local variable slot of the function being compiled
+
+    :param str name:
+    :param int depth: scope depth, -1 while the initializer is compiling
+    :param bool is_captured: whether a closure captures this slot
+    """
+
+    name: str
+    depth: int
+    is_captured: bool
+
+    def __init__(self, name: str, depth: int) -> None:
+        self.name = name
+        self.depth = depth
+        self.is_captured = False
+
+
+class UpvalueRef:
+    """
+    Compile-time description of a captured variable
+
+    :param int index: slot (when `is_local`) or upvalue index in the
+    enclosing function
+    :param bool is_local: whether it captures a local of the enclosing
+    function or one of its upvalues
+    """
+
+    index: int
+    is_local: bool
+
+    def __init__(self, index: int, is_local: bool) -> None:
+        self.index = index
+        self.is_local = is_local
+
+
+class FunctionState:
+    """
+    Per-function compiler state
+
+    :param Optional[FunctionState] enclosing: state of the surrounding
+    function, None for the top level script
+    :param VMFunction function: function being compiled
+    :param List[Local] locals: locals in scope, slot 0 is the callee
+    :param List[UpvalueRef] upvalues:
+    :param int scope_depth:
+    """
+
+    enclosing: Optional[FunctionState]
+    function: VMFunction
+    locals: List[Local]
+    upvalues: List[UpvalueRef]
+    scope_depth: int
+
+    def __init__(
+        self, enclosing: Optional[FunctionState], function: VMFunction
+    ) -> None:
+        self.enclosing = enclosing
+        self.function = function
+        self.locals = [Local("", 0)]
+        self.upvalues = []
+        self.scope_depth = 0
+
+
+class Compiler(ExprVisitor[None], StmtVisitor[None]):
+    """
+    Compile parsed statements to bytecode. Variables are resolved here, in a
+    single pass, in the same way as the tree-walking `Resolver`.
+
+    :param FunctionState state: state of the innermost function
+    :param int line: line of the most recent token seen, used for nodes that
+    carry no token of their own
+    """
+
+    state: FunctionState
+    line: int
+
+    def __init__(self) -> None:
+        self.state = FunctionState(None, VMFunction())
+        self.line = 1
+
+    def compile(self, statements: List[Stmt]) -> VMFunction:
+        for s in statements:
+            self._compile(s)
+
+        self._emit_return()
+        return self.state.function
+
+    def _compile(self, node: object) -> None:
+        node.accept(self)  # type: ignore
+
+    # emitting
+
+    @property
+    def _chunk(self) -> Chunk:
+        return self.state.function.chunk
+
+    def _emit(self, *data: int) -> None:
+        for byte in data:
+            self._chunk.write(byte, self.line)
+
+    def _emit_short(self, op: OpCode, value: int) -> None:
+        self._emit(op)
+        self._chunk.write_short(value, self.line)
+
+    def _emit_return(self) -> None:
+        self._emit(OpCode.NIL, OpCode.RETURN)
+
+    def _make_constant(self, value: object) -> int:
+        index = self._chunk.add_constant(value)
+        if index > UINT16_MAX:
+            self._error("Too many constants in one chunk")
+            return 0
+
+        return index
+
+    def _emit_jump(self, op: OpCode) -> int:
+        self._emit_short(op, UINT16_MAX)
+        return self._chunk.count() - 2
+
+    def _patch_jump(self, offset: int) -> None:
+        jump = self._chunk.count() - offset - 2
+        if jump > UINT16_MAX:
+            self._error("Too much code to jump over")
+
+        self._chunk.code[offset] = (jump >> 8) & 0xFF
+        self._chunk.code[offset + 1] = jump & 0xFF
+
+    def _emit_loop(self, loop_start: int) -> None:
+        offset = self._chunk.count() - loop_start + 3
+        if offset > UINT16_MAX:
+            self._error("Loop body too large")
+
+        self._emit_short(OpCode.LOOP, offset)
+
+    def _error(self, message: str, token: Optional[Token] = None) -> None:
+        if token is None:
+            token = Token(TokenType.EOF, "", None, self.line)
+        error.ThrowError(token, message)
+
+    # scopes and variables
+
+    def _begin_scope(self) -> None:
+        self.state.scope_depth += 1
+
+    def _end_scope(self) -> None:
+        state = self.state
+        state.scope_depth -= 1
+
+        while state.locals and state.locals[-1].depth > state.scope_depth:
+            if state.locals.pop().is_captured:
+                self._emit(OpCode.CLOSE_UPVALUE)
+            else:
+                self._emit(OpCode.POP)
+
+    def _declare(self, name: Token) -> None:
+        """
+        Add `name` as a local of the current scope. Globals are late bound
+        and are not declared.
+        """
+        if self.state.scope_depth == 0:
+            return
+
+        if len(self.state.locals) > UINT16_MAX:
+            self._error("Too many local variables in function", name)
+            return
+
+        self.state.locals.append(Local(name.lexeme, -1))
+
+    def _mark_initialized(self) -> None:
+        if self.state.scope_depth == 0:
+            return
+
+        self.state.locals[-1].depth = self.state.scope_depth
+
+    def _define(self, name: Token) -> None:
+        if self.state.scope_depth > 0:
+            self._mark_initialized()
+            return
+
+        self._emit_short(OpCode.DEFINE_GLOBAL, self._make_constant(name.lexeme))
+
+    def _resolve_local(self, state: FunctionState, name: Token) -> int:
+        for i in range(len(state.locals) - 1, -1, -1):
+            local = state.locals[i]
+            if local.name == name.lexeme:
+                if local.depth == -1:
+                    self._error(
+                        "Can't read local variable in its own initializer",
+                        name,
+                    )
+                return i
+
+        return -1
+
+    def _add_upvalue(
+        self, state: FunctionState, index: int, is_local: bool
+    ) -> int:
+        for (i, upvalue) in enumerate(state.upvalues):
+            if upvalue.index == index and upvalue.is_local == is_local:
+                return i
+
+        if len(state.upvalues) >= UINT8_COUNT:
+            self._error("Too many closure variables in function")
+            return 0
+
+        state.upvalues.append(UpvalueRef(index, is_local))
+        state.function.upvalue_count = len(state.upvalues)
+        return len(state.upvalues) - 1
+
+    def _resolve_upvalue(self, state: FunctionState, name: Token) -> int:
+        if state.enclosing is None:
+            return -1
+
+        local = self._resolve_local(state.enclosing, name)
+        if local != -1:
+            state.enclosing.locals[local].is_captured = True
+            return self._add_upvalue(state, local, True)
+
+        upvalue = self._resolve_upvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self._add_upvalue(state, upvalue, False)
+
+        return -1
+
+    def _named_variable(self, name: Token, assign: bool) -> None:
+        self.line = name.line
+
+        slot = self._resolve_local(self.state, name)
+        if slot >= UINT8_COUNT:
+            self._emit_short(
+                OpCode.SET_LOCAL_LONG if assign else OpCode.GET_LOCAL_LONG,
+                slot,
+            )
+            return
+        elif slot != -1:
+            self._emit(OpCode.SET_LOCAL if assign else OpCode.GET_LOCAL, slot)
+            return
+
+        upvalue = self._resolve_upvalue(self.state, name)
+        if upvalue != -1:
+            self._emit(
+                OpCode.SET_UPVALUE if assign else OpCode.GET_UPVALUE, upvalue
+            )
+            return
+
+        self._emit_short(
+            OpCode.SET_GLOBAL if assign else OpCode.GET_GLOBAL,
+            self._make_constant(name.lexeme),
+        )
+
+    # expressions
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        self._compile(expr.value)
+        self._named_variable(expr.name, assign=True)
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        self._compile_chain(expr)
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        self._compile_chain(expr)
+
+    def _compile_chain(self, expr: Union[Binary, Logical]) -> None:
+        """
+        Compile `expr` and the binary and logical operators nested through
+        its left operands in a loop, so that a long chain such as
+        `a + b + c + ...` doesn't recurse once per operator
+        """
+        chain = operator_chain(expr)
+        self._compile(chain[-1].left)
+
+        for node in reversed(chain):
+            if type(node) is Binary:
+                self._compile(node.right)
+                self.line = node.operator.line
+                self._emit(BINARY_OPS[node.operator.type])
+            else:
+                self._logical(node)  # type: ignore
+
+    def _logical(self, expr: Logical) -> None:
+        """Compile a logical operator whose left operand is on the stack"""
+        self.line = expr.operator.line
+
+        if expr.operator.type == TokenType.OR:
+            else_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            end_jump = self._emit_jump(OpCode.JUMP)
+            self._patch_jump(else_jump)
+            self._emit(OpCode.POP)
+            self._compile(expr.right)
+            self._patch_jump(end_jump)
+        else:
+            end_jump = self._emit_jump(OpCode.JUMP_IF_FALSE)
+            self._emit(OpCode.POP)
+            self._compile(expr.right)
+            self._patch_jump(end_jump)
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        self._compile(expr.right)
+        self.line = expr.operator.line
+
+        if expr.operator.type == TokenType.MINUS:
+            self._emit(OpCode.NEGATE)
+        else:
+            self._emit(OpCode.NOT)
+
+    def visit_call_expr(self, expr: Call) -> None:
+        self._compile(expr.callee)
+        for arg in expr.arguments:
+            self._compile(arg)
+
+        self.line = expr.paren.line
+        self._emit(OpCode.CALL, len(expr.arguments))
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        if expr.value is None:
+            self._emit(OpCode.NIL)
+        elif expr.value is True:
+            self._emit(OpCode.TRUE)
+        elif expr.value is False:
+            self._emit(OpCode.FALSE)
+        else:
+            self._emit_short(OpCode.CONSTANT, self._make_constant(expr.value))
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        self._named_variable(expr.name, assign=False)
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        self._compile(expr.expression)
+
+    def visit_array_expr(self, expr: Array) -> None:
+        for element in expr.elements:
+            self._compile(element)
+
+        self.line = expr.bracket.line
+        if len(expr.elements) > UINT16_MAX:
+            self._error("Too many elements in array literal", expr.bracket)
+        self._emit_short(OpCode.BUILD_ARRAY, len(expr.elements))
+
+    def visit_index_expr(self, expr: Index) -> None:
+        self._compile(expr.target)
+        self._compile(expr.index)
+        self.line = expr.bracket.line
+        self._emit(OpCode.GET_INDEX)
+
+    def visit_setindex_expr(self, expr: SetIndex) -> None:
+        self._compile(expr.target)
+        self._compile(expr.index)
+        self._compile(expr.value)
+        self.line = expr.bracket.line
+        self._emit(OpCode.SET_INDEX)
+
+    # statements
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self.line = stmt.name.line
+        self._declare(stmt.name)
+        # a function may refer to itself, so it is usable before its body
+        # has been compiled
+        self._mark_initialized()
+
+        state = FunctionState(self.state, VMFunction(stmt.name.lexeme))
+        state.function.arity = len(stmt.params)
+        self.state = state
+
+        self._begin_scope()
+        for param in stmt.params:
+            self._declare(param)
+            self._mark_initialized()
+
+        for s in stmt.body:
+            self._compile(s)
+        self._emit_return()
+
+        self.state = state.enclosing  # type: ignore
+        self.line = stmt.name.line
+
+        self._emit_short(OpCode.CLOSURE, self._make_constant(state.function))
+        for upvalue in state.upvalues:
+            self._emit(1 if upvalue.is_local else 0)
+            self._chunk.write_short(upvalue.index, self.line)
+
+        self._define(stmt.name)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        self.line = stmt.name.line
+        self._declare(stmt.name)
+
+        if stmt.initializer is not None:
+            self._compile(stmt.initializer)
+        else:
+            self._emit(OpCode.NIL)
+
+        self._define(stmt.name)
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        self._compile(stmt.expression)
+        self._emit(OpCode.POP)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        self._compile(stmt.condition)
+        then_jump = self._emit_jump(OpCode.POP_JUMP_IF_FALSE)
+        self._compile(stmt.branch_true)
+
+        if stmt.branch_false is None:
+            self._patch_jump(then_jump)
+            return
+
+        else_jump = self._emit_jump(OpCode.JUMP)
+        self._patch_jump(then_jump)
+        self._compile(stmt.branch_false)
+        self._patch_jump(else_jump)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        self._compile(stmt.expression)
+        self._emit(OpCode.PRINT)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        self.line = stmt.keyword.line
+        if self.state.enclosing is None:
+            self._error("Can't return from top-level code.", stmt.keyword)
+
+        if stmt.value is None:
+            self._emit(OpCode.NIL)
+        else:
+            self._compile(stmt.value)
+
+        self._emit(OpCode.RETURN)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        loop_start = self._chunk.count()
+        self._compile(stmt.condition)
+
+        exit_jump = self._emit_jump(OpCode.POP_JUMP_IF_FALSE)
+        self._compile(stmt.body)
+        self._emit_loop(loop_start)
+
+        self._patch_jump(exit_jump)
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self._begin_scope()
+        for s in stmt.statements:
+            self._compile(s)
+        self._end_scope()
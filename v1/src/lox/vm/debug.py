@@ -0,0 +1,108 @@
+from .chunk import Chunk
+from .objects import VMFunction
+from .opcode import OpCode
+
+
+BYTE_OPERAND = {
+    OpCode.GET_LOCAL,
+    OpCode.SET_LOCAL,
+    OpCode.GET_UPVALUE,
+    OpCode.SET_UPVALUE,
+    OpCode.CALL,
+}
+SHORT_OPERAND = {
+    OpCode.GET_LOCAL_LONG,
+    OpCode.SET_LOCAL_LONG,
+    OpCode.BUILD_ARRAY,
+}
+CONSTANT_OPERAND = {
+    OpCode.CONSTANT,
+    OpCode.GET_GLOBAL,
+    OpCode.DEFINE_GLOBAL,
+    OpCode.SET_GLOBAL,
+}
+JUMP_OPERAND = {
+    OpCode.JUMP,
+    OpCode.JUMP_IF_FALSE,
+    OpCode.POP_JUMP_IF_FALSE,
+}
+
+
+def disassemble_chunk(chunk: Chunk, name: str) -> None:
+    print(f"== {name} ==")
+
+    offset = 0
+    while offset < chunk.count():
+        offset = disassemble_instruction(chunk, offset)
+
+    # nested functions live in the constant pool
+    for constant in chunk.constants:
+        if isinstance(constant, VMFunction):
+            disassemble_chunk(constant.chunk, str(constant))
+
+
+def disassemble_instruction(chunk: Chunk, offset: int) -> int:
+    line = chunk.get_line(offset)
+    if offset > 0 and line == chunk.get_line(offset - 1):
+        prefix = f"{offset:04} {'|':>4} "
+    else:
+        prefix = f"{offset:04} {line:>4} "
+
+    code = chunk.code
+    try:
+        op = OpCode(code[offset])
+    except ValueError:
+        print(f"{prefix}Unknown opcode {code[offset]}")
+        return offset + 1
+
+    if op in BYTE_OPERAND:
+        print(f"{prefix}{op.name:<16} {code[offset + 1]:4}")
+        return offset + 2
+    elif op in SHORT_OPERAND:
+        value = (code[offset + 1] << 8) | code[offset + 2]
+        print(f"{prefix}{op.name:<16} {value:4}")
+        return offset + 3
+    elif op in CONSTANT_OPERAND:
+        index = (code[offset + 1] << 8) | code[offset + 2]
+        print(f"{prefix}{op.name:<16} {index:4} '{chunk.constants[index]}'")
+        return offset + 3
+    elif op in JUMP_OPERAND or op == OpCode.LOOP:
+        jump = (code[offset + 1] << 8) | code[offset + 2]
+        sign = -1 if op == OpCode.LOOP else 1
+        print(f"{prefix}{op.name:<16} {offset:4} -> {offset + 3 + sign * jump}")
+        return offset + 3
+    elif op == OpCode.CLOSURE:
+        index = (code[offset + 1] << 8) | code[offset + 2]
+        function = chunk.constants[index]
+        print(f"{prefix}{op.name:<16} {index:4} {function}")
+        offset += 3
+        for _ in range(function.upvalue_count):  # type: ignore
+            kind = "local" if code[offset] else "upvalue"
+            index = (code[offset + 1] << 8) | code[offset + 2]
+            print(f"{offset:04}    |                     {kind} {index}")
+            offset += 3
+        return offset
+
+    print(f"{prefix}{op.name}")
+    return offset + 1
+
+
+def instruction_size(chunk: Chunk, offset: int) -> int:
+    """Return the size in bytes of the instruction at `offset`"""
+    op = chunk.code[offset]
+
+    if op in BYTE_OPERAND:
+        return 2
+    elif (
+        op in SHORT_OPERAND
+        or op in CONSTANT_OPERAND
+        or op in JUMP_OPERAND
+        or op == OpCode.LOOP
+    ):
+        return 3
+    elif op == OpCode.CLOSURE:
+        index = (chunk.code[offset + 1] << 8) | chunk.code[offset + 2]
+        function = chunk.constants[index]
+        return 3 + 3 * function.upvalue_count  # type: ignore
+
+    return 1
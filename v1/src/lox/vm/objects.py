@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import List, Optional
+
+from .chunk import Chunk
+
+
+class VMFunction:
+    """
+    Compiled Lox function
+
+    :param int arity: number of parameters
+    :param int upvalue_count: number of variables captured from enclosing
+    functions
+    :param Chunk chunk: compiled body
+    :param Optional[str] name: function name, None for the top level script
+    """
+
+    __slots__ = ("arity", "upvalue_count", "chunk", "name")
+
+    arity: int
+    upvalue_count: int
+    chunk: Chunk
+    name: Optional[str]
+
+    def __init__(self, name: Optional[str] = None) -> None:
+        self.arity = 0
+        self.upvalue_count = 0
+        self.chunk = Chunk()
+        self.name = name
+
+    def __str__(self) -> str:
+        if self.name is None:
+            return "<script>"
+        return f"<fn {self.name}>"
+
+
+class Upvalue:
+    """
+    Captured variable. While `is_open` it refers to a live slot of the VM
+    value stack, afterwards the value is stored in `closed`.
+
+    :param int location: index of the captured slot in the VM stack
+    """
+
+    __slots__ = ("location", "closed", "is_open")
+
+    location: int
+    closed: object
+    is_open: bool
+
+    def __init__(self, location: int) -> None:
+        self.location = location
+        self.closed = None
+        self.is_open = True
+
+
+class VMClosure:
+    """
+    Runtime function value: a `VMFunction` plus its captured upvalues
+
+    :param VMFunction function:
+    :param List[Upvalue] upvalues:
+    """
+
+    __slots__ = ("function", "upvalues")
+
+    function: VMFunction
+    upvalues: List[Upvalue]
+
+    def __init__(self, function: VMFunction, upvalues: List[Upvalue]) -> None:
+        self.function = function
+        self.upvalues = upvalues
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+class CallFrame:
+    """
+    Activation record of a running closure
+
+    :param VMClosure closure: closure being executed
+    :param int ip: offset of the next instruction in the closure's chunk
+    :param int base: stack index of the frame's slot 0 (the callee)
+    """
+
+    __slots__ = ("closure", "ip", "base")
+
+    closure: VMClosure
+    ip: int
+    base: int
+
+    def __init__(self, closure: VMClosure, ip: int, base: int) -> None:
+        self.closure = closure
+        self.ip = ip
+        self.base = base
@@ -0,0 +1,47 @@
+from enum import IntEnum
+
+
+class OpCode(IntEnum):
+    # Operand widths are noted next to each instruction. "short" operands are
+    # two bytes, big-endian.
+
+    CONSTANT = 0  # short: constant index
+    NIL = 1
+    TRUE = 2
+    FALSE = 3
+    POP = 4
+    GET_LOCAL = 5  # byte: stack slot
+    SET_LOCAL = 6  # byte: stack slot
+    GET_GLOBAL = 7  # short: constant index of name
+    DEFINE_GLOBAL = 8  # short: constant index of name
+    SET_GLOBAL = 9  # short: constant index of name
+    GET_UPVALUE = 10  # byte: upvalue index
+    SET_UPVALUE = 11  # byte: upvalue index
+    EQUAL = 12
+    NOT_EQUAL = 13
+    GREATER = 14
+    GREATER_EQUAL = 15
+    LESS = 16
+    LESS_EQUAL = 17
+    ADD = 18
+    SUBTRACT = 19
+    MULTIPLY = 20
+    DIVIDE = 21
+    NOT = 22
+    NEGATE = 23
+    PRINT = 24
+    JUMP = 25  # short: forward offset
+    JUMP_IF_FALSE = 26  # short: forward offset, leaves condition on stack
+    POP_JUMP_IF_FALSE = 27  # short: forward offset, pops condition
+    LOOP = 28  # short: backward offset
+    CALL = 29  # byte: argument count
+    # short: function constant, then an is_local byte and a short index for
+    # each upvalue
+    CLOSURE = 30
+    CLOSE_UPVALUE = 31
+    RETURN = 32
+    BUILD_ARRAY = 33  # short: element count
+    GET_INDEX = 34
+    SET_INDEX = 35
+    GET_LOCAL_LONG = 36  # short: stack slot
+    SET_LOCAL_LONG = 37  # short: stack slot
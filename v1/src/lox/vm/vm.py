@@ -0,0 +1,472 @@
+from __future__ import annotations
+from enum import Enum
+from typing import Dict, List
+
+from lox import config
+from lox.config import FRAMES_MAX
+from lox.interpreter import divide_by_zero, stringify
+from lox.error import NativeError
+from lox.lox_objects import LoxArray, LoxCallable, builtin
+from lox.lox_objects.lox_array import get_index, set_index
+from lox.lox_objects.lox_rope import concat, is_string
+from lox.syntax.stmt import Stmt
+
+from .compiler import Compiler
+from .objects import CallFrame, Upvalue, VMClosure, VMFunction
+from .opcode import OpCode
+
+# plain ints compare faster than IntEnum members in the dispatch loop
+CONSTANT = OpCode.CONSTANT.value
+NIL = OpCode.NIL.value
+TRUE = OpCode.TRUE.value
+FALSE = OpCode.FALSE.value
+POP = OpCode.POP.value
+GET_LOCAL = OpCode.GET_LOCAL.value
+SET_LOCAL = OpCode.SET_LOCAL.value
+GET_GLOBAL = OpCode.GET_GLOBAL.value
+DEFINE_GLOBAL = OpCode.DEFINE_GLOBAL.value
+SET_GLOBAL = OpCode.SET_GLOBAL.value
+GET_UPVALUE = OpCode.GET_UPVALUE.value
+SET_UPVALUE = OpCode.SET_UPVALUE.value
+EQUAL = OpCode.EQUAL.value
+NOT_EQUAL = OpCode.NOT_EQUAL.value
+GREATER = OpCode.GREATER.value
+GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+LESS = OpCode.LESS.value
+LESS_EQUAL = OpCode.LESS_EQUAL.value
+ADD = OpCode.ADD.value
+SUBTRACT = OpCode.SUBTRACT.value
+MULTIPLY = OpCode.MULTIPLY.value
+DIVIDE = OpCode.DIVIDE.value
+NOT = OpCode.NOT.value
+NEGATE = OpCode.NEGATE.value
+PRINT = OpCode.PRINT.value
+JUMP = OpCode.JUMP.value
+JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+POP_JUMP_IF_FALSE = OpCode.POP_JUMP_IF_FALSE.value
+LOOP = OpCode.LOOP.value
+CALL = OpCode.CALL.value
+CLOSURE = OpCode.CLOSURE.value
+CLOSE_UPVALUE = OpCode.CLOSE_UPVALUE.value
+RETURN = OpCode.RETURN.value
+BUILD_ARRAY = OpCode.BUILD_ARRAY.value
+GET_INDEX = OpCode.GET_INDEX.value
+SET_INDEX = OpCode.SET_INDEX.value
+GET_LOCAL_LONG = OpCode.GET_LOCAL_LONG.value
+SET_LOCAL_LONG = OpCode.SET_LOCAL_LONG.value
+
+
+class InterpretResult(Enum):
+    OK = 0
+    COMPILE_ERROR = 1
+    RUNTIME_ERROR = 2
+
+
+class RuntimeAbort(Exception):
+    """
+    Raised out of a native function when a Lox function it called failed.
+    The error has already been reported, so the VM just stops.
+    """
+
+
+class VM:
+    """
+    Stack based bytecode virtual machine
+
+    :param List[object] stack: value stack shared by all call frames
+    :param List[CallFrame] frames: active call frames, innermost last
+    :param Dict[str, object] globals: global variables by name
+    :param List[Upvalue] open_upvalues: upvalues still pointing into the
+    stack, ordered by stack location
+    """
+
+    stack: List[object]
+    frames: List[CallFrame]
+    globals: Dict[str, object]
+    open_upvalues: List[Upvalue]
+
+    def __init__(self) -> None:
+        self.stack = []
+        self.frames = []
+        self.globals = {}
+        self.open_upvalues = []
+
+        for (name, native) in builtin.NATIVES.items():
+            self.globals[name] = native
+
+    def interpret(self, statements: List[Stmt]) -> InterpretResult:
+        function = self._compile(statements)
+        if config.had_error:
+            return InterpretResult.COMPILE_ERROR
+
+        closure = VMClosure(function, [])
+        self.stack = [closure]
+        self.frames = [CallFrame(closure, 0, 0)]
+        self.open_upvalues = []
+
+        return self._run()
+
+    def call_value(self, callee: object, arguments: List[object]) -> object:
+        """
+        Call a Lox value from a native function. Closures are run to
+        completion by a nested `_run`, which returns as soon as their frame
+        returns.
+        """
+        if not isinstance(callee, (VMClosure, LoxCallable)):
+            raise NativeError("Can only call functions and classes")
+
+        arity = (
+            callee.function.arity
+            if type(callee) is VMClosure
+            else callee.arity()  # type: ignore
+        )
+        if len(arguments) != arity:
+            raise NativeError(
+                f"Expected {arity} arguments but got {len(arguments)}."
+            )
+
+        if type(callee) is not VMClosure:
+            return callee.call(self, arguments)  # type: ignore
+        if len(self.frames) == FRAMES_MAX:
+            raise NativeError("Stack overflow.")
+
+        exit_depth = len(self.frames)
+        base = len(self.stack)
+        self.stack.append(callee)
+        self.stack.extend(arguments)
+        self.frames.append(CallFrame(callee, 0, base))  # type: ignore
+
+        if self._run(exit_depth) is InterpretResult.RUNTIME_ERROR:
+            raise RuntimeAbort()
+
+        return self.stack.pop()
+
+    def _compile(self, statements: List[Stmt]) -> VMFunction:
+        return Compiler().compile(statements)
+
+    def _runtime_error(self, message: str) -> InterpretResult:
+        frame = self.frames[-1]
+        line = frame.closure.function.chunk.get_line(frame.ip - 1)
+
+        print(message)
+        print(f"[line {line}]")
+        config.had_runtime_error = True
+
+        self.stack = []
+        self.frames = []
+        self.open_upvalues = []
+        return InterpretResult.RUNTIME_ERROR
+
+    def _capture_upvalue(self, location: int) -> Upvalue:
+        for upvalue in self.open_upvalues:
+            if upvalue.location == location:
+                return upvalue
+
+        created = Upvalue(location)
+        self.open_upvalues.append(created)
+        self.open_upvalues.sort(key=lambda upvalue: upvalue.location)
+        return created
+
+    def _close_upvalues(self, last: int) -> None:
+        open_upvalues = self.open_upvalues
+        while open_upvalues and open_upvalues[-1].location >= last:
+            upvalue = open_upvalues.pop()
+            upvalue.closed = self.stack[upvalue.location]
+            upvalue.is_open = False
+
+    def _run(self, exit_depth: int = 0) -> InterpretResult:
+        """
+        Run until the frame count drops back to `exit_depth`. Nested runs
+        started by `call_value` leave the return value on the stack.
+        """
+        stack = self.stack
+        frames = self.frames
+        globals = self.globals
+        push = stack.append
+        pop = stack.pop
+
+        frame = frames[-1]
+        closure = frame.closure
+        code = closure.function.chunk.code
+        constants = closure.function.chunk.constants
+        ip = frame.ip
+        base = frame.base
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            # instructions are tested roughly in order of how often they run
+            if op == GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == CONSTANT:
+                push(constants[(code[ip] << 8) | code[ip + 1]])
+                ip += 2
+            elif op == GET_GLOBAL:
+                name = constants[(code[ip] << 8) | code[ip + 1]]
+                ip += 2
+                try:
+                    push(globals[name])  # type: ignore
+                except KeyError:
+                    frame.ip = ip
+                    return self._runtime_error(f"Undefined variable {name}")
+            elif op == POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip += (code[ip] << 8) | code[ip + 1]
+                ip += 2
+            elif op == SUBTRACT:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a - b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == ADD:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a + b  # type: ignore
+                elif is_string(a) and is_string(b):
+                    stack[-1] = concat(a, b)  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error(
+                        "Operands must both be numbers or strings"
+                    )
+            elif op == LESS:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a < b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == LESS_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a <= b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == POP:
+                pop()
+            elif op == CALL:
+                arg_count = code[ip]
+                ip += 1
+                callee = stack[-1 - arg_count]
+
+                if type(callee) is VMClosure:
+                    function = callee.function
+                    if arg_count != function.arity:
+                        frame.ip = ip
+                        return self._runtime_error(
+                            f"Expected {function.arity} arguments but got {arg_count}."
+                        )
+                    if len(frames) == FRAMES_MAX:
+                        frame.ip = ip
+                        return self._runtime_error("Stack overflow.")
+
+                    frame.ip = ip
+                    frame = CallFrame(callee, 0, len(stack) - arg_count - 1)
+                    frames.append(frame)
+                    closure = callee
+                    code = function.chunk.code
+                    constants = function.chunk.constants
+                    ip = 0
+                    base = frame.base
+                elif isinstance(callee, LoxCallable):
+                    fn_arity = callee.arity()
+                    if arg_count != fn_arity:
+                        frame.ip = ip
+                        return self._runtime_error(
+                            f"Expected {fn_arity} arguments but got {arg_count}."
+                        )
+
+                    arguments = stack[len(stack) - arg_count :]
+                    frame.ip = ip
+                    try:
+                        result = callee.call(self, arguments)  # type: ignore
+                    except NativeError as err:
+                        return self._runtime_error(err.message)
+                    except RuntimeAbort:
+                        return InterpretResult.RUNTIME_ERROR
+                    del stack[len(stack) - arg_count - 1 :]
+                    push(result)
+                else:
+                    frame.ip = ip
+                    return self._runtime_error(
+                        "Can only call functions and classes"
+                    )
+            elif op == RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self._close_upvalues(base)
+
+                frames.pop()
+                if not frames:
+                    pop()
+                    return InterpretResult.OK
+
+                del stack[base:]
+                push(result)
+                if len(frames) == exit_depth:
+                    return InterpretResult.OK
+
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                constants = closure.function.chunk.constants
+                ip = frame.ip
+                base = frame.base
+            elif op == GET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.is_open:
+                    push(stack[upvalue.location])
+                else:
+                    push(upvalue.closed)
+            elif op == SET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.is_open:
+                    stack[upvalue.location] = stack[-1]
+                else:
+                    upvalue.closed = stack[-1]
+            elif op == SET_GLOBAL:
+                name = constants[(code[ip] << 8) | code[ip + 1]]
+                ip += 2
+                if name not in globals:
+                    frame.ip = ip
+                    return self._runtime_error(f"Undefined variable {name}")
+                globals[name] = stack[-1]  # type: ignore
+            elif op == LOOP:
+                ip -= ((code[ip] << 8) | code[ip + 1]) - 2
+            elif op == JUMP:
+                ip += ((code[ip] << 8) | code[ip + 1]) + 2
+            elif op == JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += (code[ip] << 8) | code[ip + 1]
+                ip += 2
+            elif op == MULTIPLY:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a * b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == DIVIDE:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    try:
+                        stack[-1] = a / b  # type: ignore
+                    except ZeroDivisionError:
+                        stack[-1] = divide_by_zero(a, b)  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == GREATER:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a > b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == GREATER_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if type(a) is float and type(b) is float:
+                    stack[-1] = a >= b  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operands must be a number")
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op == NOT_EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] != b
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == NEGATE:
+                value = stack[-1]
+                if type(value) is float:
+                    stack[-1] = -value  # type: ignore
+                else:
+                    frame.ip = ip
+                    return self._runtime_error("Operand must be a number")
+            elif op == NIL:
+                push(None)
+            elif op == TRUE:
+                push(True)
+            elif op == FALSE:
+                push(False)
+            elif op == PRINT:
+                print(stringify(pop()))
+            elif op == DEFINE_GLOBAL:
+                name = constants[(code[ip] << 8) | code[ip + 1]]
+                ip += 2
+                globals[name] = pop()  # type: ignore
+            elif op == CLOSURE:
+                function = constants[(code[ip] << 8) | code[ip + 1]]
+                ip += 2
+
+                upvalues: List[Upvalue] = []
+                for _ in range(function.upvalue_count):  # type: ignore
+                    is_local = code[ip]
+                    index = (code[ip + 1] << 8) | code[ip + 2]
+                    ip += 3
+                    if is_local:
+                        upvalues.append(self._capture_upvalue(base + index))
+                    else:
+                        upvalues.append(closure.upvalues[index])
+
+                push(VMClosure(function, upvalues))  # type: ignore
+            elif op == GET_INDEX:
+                index = pop()
+                try:
+                    stack[-1] = get_index(stack[-1], index)
+                except NativeError as err:
+                    frame.ip = ip
+                    return self._runtime_error(err.message)
+            elif op == SET_INDEX:
+                value = pop()
+                index = pop()
+                try:
+                    set_index(stack[-1], index, value)
+                except NativeError as err:
+                    frame.ip = ip
+                    return self._runtime_error(err.message)
+                stack[-1] = value
+            elif op == BUILD_ARRAY:
+                count = (code[ip] << 8) | code[ip + 1]
+                ip += 2
+                if count:
+                    elements = stack[-count:]
+                    del stack[-count:]
+                else:
+                    elements = []
+                push(LoxArray.of(elements))
+            elif op == CLOSE_UPVALUE:
+                self._close_upvalues(len(stack) - 1)
+                pop()
+            elif op == GET_LOCAL_LONG:
+                push(stack[base + ((code[ip] << 8) | code[ip + 1])])
+                ip += 2
+            elif op == SET_LOCAL_LONG:
+                stack[base + ((code[ip] << 8) | code[ip + 1])] = stack[-1]
+                ip += 2
+            else:
+                frame.ip = ip
+                return self._runtime_error(f"Unknown opcode {op}")
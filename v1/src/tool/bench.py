@@ -0,0 +1,369 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from lox import config
+from lox.main import ENGINES, SCANNERS
+from lox.interpreter import Interpreter
+from lox.optimizer import Optimizer
+from lox.parser import Parser
+from lox.resolver import Resolver
+
+
+BENCHMARK_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks"
+)
+BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+# a phase only counts as regressed if it also got slower by this much, so
+# that noise in phases that take a few milliseconds is ignored
+MIN_REGRESSION = 0.005
+
+# phase name -> best and mean time over the repetitions, in seconds
+PhaseTimes = Dict[str, Dict[str, float]]
+
+# "tokens" -> tokens scanned, and phase -> peak bytes allocated while
+# scanning, then while scanning and parsing
+MemoryUsage = Dict[str, int]
+
+
+def generated_source(functions: int = 1000) -> str:
+    """
+    Build a large program that mostly declares functions it never calls, so
+    that its timings are dominated by the front end
+    """
+    lines: List[str] = []
+
+    for i in range(functions):
+        lines.append(f"fun f{i}(a, b) {{")
+        lines.append(f'  var s = "f{i}";')
+        lines.append(f"  if (a < b and !(a == {i})) {{ a = a + {i}.5; }}")
+        lines.append("  else { b = b * 2 - (a / 3); }")
+        lines.append("  while (a < b) { a = a + 1; }")
+        lines.append("  return a;")
+        lines.append("}")
+        lines.append(f"var v{i} = {i} * 2 + 1;")
+
+    lines.append("print f0(v0, v1);")
+    return "\n".join(lines) + "\n"
+
+
+def deep_source(terms: int = 100_000) -> str:
+    """
+    Build a program made of two chains of `terms` operators. Operators
+    of one precedence nest through their left operands, so each chain
+    parses to a tree as deep as the chain is long.
+    """
+    lines: List[str] = []
+
+    lines.append("fun chains(a, b) {")
+    lines.append("  print " + " + ".join(["a"] * terms) + ";")
+    lines.append("  return " + " and ".join(["b"] * terms) + ";")
+    lines.append("}")
+    lines.append("print chains(1, true);")
+
+    return "\n".join(lines) + "\n"
+
+
+def memory_source(lines: int = 100_000) -> str:
+    """
+    Build a program of `lines` short lines that reuse a few names, as real
+    programs do, so that its tokens dominate the front end's memory
+    """
+    templates = [
+        "var count{i} = total + {i} * 2;",
+        "total = total + count{i} - (index / 3);",
+        'if (index < limit) print "line {i}";',
+        "while (index < limit) index = index + step;",
+    ]
+    return "\n".join(
+        templates[i % len(templates)].format(i=i) for i in range(lines)
+    ) + "\n"
+
+
+def load_sources(names: List[str]) -> Dict[str, str]:
+    """Load the benchmark programs, all of them if `names` is empty"""
+    sources: Dict[str, str] = {}
+
+    for filename in sorted(os.listdir(BENCHMARK_DIR)):
+        (name, ext) = os.path.splitext(filename)
+        if ext == ".lox" and (not names or name in names):
+            with open(os.path.join(BENCHMARK_DIR, filename), "r") as file:
+                sources[name] = file.read()
+
+    if not names or "generated" in names:
+        sources["generated"] = generated_source()
+    if not names or "deep" in names:
+        sources["deep"] = deep_source()
+
+    return sources
+
+
+def timed(times: Dict[str, List[float]], phase: str, fn: Callable[[], object]):
+    start = time.perf_counter()
+    result = fn()
+    times.setdefault(phase, []).append(time.perf_counter() - start)
+    return result
+
+
+def run_phases(
+    source: str, engine: str, scanner: str, optimize: bool, repeat: int
+) -> PhaseTimes:
+    """
+    Run `source` through each phase `repeat` times. Every repetition starts
+    again from the source, since running a program caches state on its
+    nodes.
+    """
+    times: Dict[str, List[float]] = {}
+
+    for _ in range(repeat):
+        config.had_error = False
+        config.had_runtime_error = False
+
+        tokens = timed(times, "scan", SCANNERS[scanner](source).scan_tokens)
+        statements = timed(times, "parse", Parser(tokens).parse)
+
+        if optimize:
+            optimizer = Optimizer()
+            statements = timed(
+                times, "optimize", lambda: optimizer.optimize(statements)
+            )
+
+        interpreter = ENGINES[engine]()
+        if isinstance(interpreter, Interpreter):
+            timed(times, "resolve", lambda: Resolver().resolve(statements))
+
+        if config.had_error:
+            raise RuntimeError("benchmark has a compile error")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            timed(
+                times, "interpret", lambda: interpreter.interpret(statements)
+            )
+
+        if config.had_runtime_error:
+            raise RuntimeError("benchmark has a runtime error")
+
+    return {
+        phase: {"best": min(samples), "mean": sum(samples) / len(samples)}
+        for (phase, samples) in times.items()
+    }
+
+
+def measure_memory(source: str, scanner: str) -> MemoryUsage:
+    """
+    Find the peak memory allocated while scanning `source`, and while
+    scanning and then parsing it, as traced by `tracemalloc`
+    """
+    config.had_error = False
+    tracemalloc.start()
+    try:
+        tokens = SCANNERS[scanner](source).scan_tokens()
+        scan_peak = tracemalloc.get_traced_memory()[1]
+        Parser(tokens).parse()
+        parse_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    if config.had_error:
+        raise RuntimeError("benchmark has a compile error")
+
+    return {"tokens": len(tokens), "scan": scan_peak, "parse": parse_peak}
+
+
+def compare_memory(
+    usage: MemoryUsage, baseline: MemoryUsage, threshold: float
+) -> List[str]:
+    """Describe each phase whose peak memory grew past `threshold`"""
+    regressions: List[str] = []
+
+    for phase in ("scan", "parse"):
+        (before, after) = (baseline.get(phase), usage[phase])
+        if before is not None and after > before * (1 + threshold):
+            change = (after / before - 1) * 100
+            regressions.append(
+                f"memory {phase}: {before / 2**20:.1f}MiB -> "
+                f"{after / 2**20:.1f}MiB (+{change:.0f}%)"
+            )
+
+    return regressions
+
+
+def print_memory(scanner: str, usage: MemoryUsage) -> None:
+    print(f"{'scanner':16}{'tokens':>12}{'scan peak':>14}{'parse peak':>14}")
+    print(
+        f"{scanner:16}{usage['tokens']:>12}"
+        f"{usage['scan'] / 2**20:>11.1f}MiB"
+        f"{usage['parse'] / 2**20:>11.1f}MiB"
+    )
+
+
+def compare(
+    results: Dict[str, PhaseTimes],
+    baseline: Dict[str, PhaseTimes],
+    threshold: float,
+) -> List[str]:
+    """Describe each phase whose best time regressed past `threshold`"""
+    regressions: List[str] = []
+
+    for (name, phases) in results.items():
+        for (phase, result) in phases.items():
+            expected = baseline.get(name, {}).get(phase)
+            if expected is None:
+                continue
+
+            (before, after) = (expected["best"], result["best"])
+            if (
+                after > before * (1 + threshold)
+                and after - before > MIN_REGRESSION
+            ):
+                change = (after / before - 1) * 100
+                regressions.append(
+                    f"{name} {phase}: {before:.4f}s -> {after:.4f}s (+{change:.0f}%)"
+                )
+
+    return regressions
+
+
+def print_table(results: Dict[str, PhaseTimes]) -> None:
+    phases = ["scan", "parse", "optimize", "resolve", "interpret"]
+    shown = [p for p in phases if any(p in r for r in results.values())]
+
+    print(f"{'benchmark':16}" + "".join(f"{p:>12}" for p in shown))
+    for (name, result) in results.items():
+        row = "".join(
+            f"{result[p]['best']:>11.4f}s" if p in result else f"{'-':>12}"
+            for p in shown
+        )
+        print(f"{name:16}{row}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="time each phase of the lox benchmarks, or measure the "
+        "front end's memory with --memory"
+    )
+    arg_parser.add_argument(
+        "benchmarks", nargs="*", help="benchmarks to run, default all"
+    )
+    arg_parser.add_argument("--engine", choices=ENGINES.keys(), default="tree")
+    arg_parser.add_argument(
+        "--scanner", choices=SCANNERS.keys(), default="default"
+    )
+    arg_parser.add_argument("--optimize", action="store_true")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument(
+        "--json", action="store_true", help="print results as JSON"
+    )
+    arg_parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="measure peak memory of scanning and parsing a generated "
+        "100k line program, instead of timing the benchmarks",
+    )
+    arg_parser.add_argument(
+        "--baseline",
+        default=BASELINE,
+        help="baseline to compare against, holding results per engine",
+    )
+    arg_parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results in the baseline for the engine",
+    )
+    arg_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fail when a phase is this fraction slower than the baseline",
+    )
+    args = arg_parser.parse_args()
+
+    if args.memory:
+        memory_main(args)
+        return
+
+    results: Dict[str, PhaseTimes] = {}
+    for (name, source) in load_sources(args.benchmarks).items():
+        results[name] = run_phases(
+            source, args.engine, args.scanner, args.optimize, args.repeat
+        )
+
+    baselines: Dict[str, Dict[str, PhaseTimes]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baselines = json.load(file)
+
+    if args.save_baseline:
+        # merge, so that saving a few benchmarks keeps the others
+        baselines.setdefault(args.engine, {}).update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    if args.json:
+        json.dump(
+            {"engine": args.engine, "repeat": args.repeat, "results": results},
+            sys.stdout,
+            indent=2,
+        )
+        print()
+    else:
+        print_table(results)
+
+    baseline: Optional[Dict[str, PhaseTimes]] = baselines.get(args.engine)
+    if baseline is None or args.save_baseline:
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+def memory_main(args: argparse.Namespace) -> None:
+    """
+    Measure the front end's memory on `memory_source`. Baselines are kept
+    per scanner, under "memory" in the baseline file.
+    """
+    usage = measure_memory(memory_source(), args.scanner)
+
+    baselines: Dict[str, Dict[str, MemoryUsage]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as file:
+            baselines = json.load(file)
+
+    if args.save_baseline:
+        baselines.setdefault("memory", {})[args.scanner] = usage
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    if args.json:
+        json.dump({"scanner": args.scanner, "memory": usage}, sys.stdout)
+        print()
+    else:
+        print_memory(args.scanner, usage)
+
+    baseline = baselines.get("memory", {}).get(args.scanner)
+    if baseline is None or args.save_baseline:
+        return
+
+    regressions = compare_memory(usage, baseline, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import sys
+from typing import Callable, List, Tuple
+
+from lox import config
+from lox.scanner import Scanner, RegexScanner
+from lox.token import Token
+
+
+# sources exercising the corners of the lexical grammar, checked in
+# addition to any files given on the command line
+EDGE_CASES = [
+    "",
+    "// only a comment",
+    "a//b\nc",
+    "1.5 1. .5 1.2.3 007",
+    "!= == <= >= ! = < > / * - + ; , . ( ) { } [ ]",
+    "a[1][b[2]]=[]",
+    "and andy _or or_ class classy nil nil2 THIS this",
+    '"one\ntwo" x',
+    '"unterminated\nstring',
+    "@ # $ ^ & | ~ ` ? : ' \\",
+    "\t\r\n\n  x \n",
+    "é ok",
+    "a\0b",
+]
+
+TokenKey = Tuple[object, str, object, int]
+
+
+def scan(
+    scanner: Callable[[str], object], source: str
+) -> Tuple[List[TokenKey], str]:
+    """Scan `source`, returning the token stream and the reported errors"""
+    errors = io.StringIO()
+    config.had_error = False
+
+    with contextlib.redirect_stderr(errors):
+        tokens: List[Token] = scanner(source).scan_tokens()  # type: ignore
+
+    config.had_error = False
+    return (
+        [(t.type, t.lexeme, t.literal, t.line) for t in tokens],
+        errors.getvalue(),
+    )
+
+
+def compare(name: str, source: str) -> bool:
+    expected = scan(Scanner, source)
+    actual = scan(RegexScanner, source)
+
+    if expected == actual:
+        return True
+
+    print(f"FAIL {name}")
+    for (e, a) in zip(expected[0], actual[0]):
+        if e != a:
+            print(f"    first difference: {e} != {a}")
+            break
+    if len(expected[0]) != len(actual[0]):
+        print(f"    {len(expected[0])} tokens != {len(actual[0])} tokens")
+    if expected[1] != actual[1]:
+        print(f"    errors: {expected[1]!r} != {actual[1]!r}")
+
+    return False
+
+
+def main():
+    ok = True
+
+    for (i, source) in enumerate(EDGE_CASES):
+        ok &= compare(f"edge case {i}", source)
+
+    for filename in sys.argv[1:]:
+        with open(filename, "r") as file:
+            ok &= compare(filename, file.read())
+
+    if not ok:
+        sys.exit(1)
+
+    print(f"scanners agree on {len(EDGE_CASES) + len(sys.argv) - 1} sources")
+
+
+if __name__ == "__main__":
+    main()
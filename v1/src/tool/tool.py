@@ -20,7 +20,19 @@ class BaseName:
     long: str
 
 
-PropertiesType = List[Tuple[str, str]]
+# (name, type) or (name, type, default). Properties with a default are set
+# after parsing, and must come last.
+PropertiesType = List[Tuple[str, ...]]
+
+MAX_LINE_LENGTH = 79
+
+
+def kind_name(type_name: str) -> str:
+    return type_name.upper()
+
+
+def visit_name(bn: BaseName, type_name: str) -> str:
+    return f"visit_{type_name.lower()}_{bn.regular.lower()}"
 
 
 def define_type(
@@ -36,17 +48,52 @@ def define_type(
         for _ in range(leading_newlines):
             writeln()
 
-        writeln("@dataclass")
         writeln(f"class {type_name}({bn.regular}):")
         writeln('"""', 1)
         writeln(f"{type_name} {bn.long}", 1)
         writeln()
-        for (arg_name, arg_type) in properties:
+        for (arg_name, arg_type, *_) in properties:
             writeln(f":param {arg_type} {arg_name}:", 1)
         writeln('"""', 1)
         writeln()
-        for (arg_name, arg_type) in properties:
+
+        slots = ", ".join(f'"{arg_name}"' for (arg_name, *_) in properties)
+        if len(properties) == 1:
+            slots += ","
+        if len(slots) + 18 <= MAX_LINE_LENGTH:
+            writeln(f"__slots__ = ({slots})", 1)
+        else:
+            writeln("__slots__ = (", 1)
+            for (arg_name, *_) in properties:
+                writeln(f'"{arg_name}",', 2)
+            writeln(")", 1)
+        writeln()
+        writeln(f"kind = {bn.regular}Kind.{kind_name(type_name)}", 1)
+        writeln("_fields = __slots__", 1)
+        writeln()
+        for (arg_name, arg_type, *_) in properties:
             writeln(f"{arg_name}: {arg_type}", 1)
+        writeln()
+
+        params = []
+        for (arg_name, arg_type, *default) in properties:
+            if default:
+                params.append(f"{arg_name}: {arg_type} = {default[0]}")
+            else:
+                params.append(f"{arg_name}: {arg_type}")
+
+        signature = f"def __init__(self, {', '.join(params)}) -> None:"
+        if len(signature) + 4 <= MAX_LINE_LENGTH:
+            writeln(signature, 1)
+        else:
+            writeln("def __init__(", 1)
+            writeln("self,", 2)
+            for param in params:
+                writeln(f"{param},", 2)
+            writeln(") -> None:", 1)
+
+        for (arg_name, *_) in properties:
+            writeln(f"self.{arg_name} = {arg_name}", 2)
 
 
 def define_ast(
@@ -56,14 +103,18 @@ def define_ast(
     extra_imports: List[str] = [],
 ):
     filename = os.path.join(output_dir, bn.regular.lower() + ".py")
+    visitors = f"{bn.regular.upper()}_VISITORS"
+    table = f"_{bn.regular.lower()}_table"
 
     with open(filename, "w") as file:
         writeln = _writeln(file)
 
         writeln("from __future__ import annotations")
         writeln("from abc import ABC, abstractmethod")
-        writeln("from dataclasses import dataclass")
-        writeln("from typing import TypeVar, Generic, List, Optional")
+        writeln(
+            "from typing import Any, Callable, TypeVar, Generic, List, "
+            "Optional, Tuple"
+        )
         writeln()
         writeln("from lox.token import Token")
 
@@ -75,24 +126,64 @@ def define_ast(
         writeln('T = TypeVar("T")')
         writeln()
         writeln()
+        writeln(f"class {bn.regular}Kind:")
+        writeln('"""', 1)
+        writeln(
+            f"Integer tag of each `{bn.regular}` class, stored in its `kind` "
+            "attribute.",
+            1,
+        )
+        writeln(
+            "Tags are never reused, so new classes go at the end.",
+            1,
+        )
+        writeln('"""', 1)
+        writeln()
+        for (i, name) in enumerate(derived_types.keys()):
+            writeln(f"{kind_name(name)} = {i}", 1)
+        writeln()
+        writeln()
+        writeln("# name of the visitor method for each kind")
+        writeln(f"{visitors}: Tuple[str, ...] = (")
+        for name in derived_types.keys():
+            writeln(f'"{visit_name(bn, name)}",', 1)
+        writeln(")")
+        writeln()
+        writeln()
         writeln(f"class {bn.regular}:")
+        writeln("__slots__ = ()", 1)
+        writeln()
+        writeln("kind: int", 1)
+        writeln("_fields: Tuple[str, ...]", 1)
+        writeln()
         writeln(
             f"def accept(self, visitor: {bn.regular}Visitor[T]) -> T:",
             1,
         )
-        writeln('name = type(self).__qualname__.replace(".", "_").lower()', 2)
+        writeln(f"return visitor.{table}[self.kind](visitor, self)", 2)
+        writeln()
+        writeln("def __repr__(self) -> str:", 1)
+        writeln("fields = (f\"{f}={getattr(self, f)!r}\" for f in self._fields)", 2)
+        writeln('return f"{type(self).__name__}({\', \'.join(fields)})"', 2)
+        writeln()
+        writeln()
+        writeln(f"class {bn.regular}Visitor(ABC, Generic[T]):")
+        writeln("# visitor method for each kind, looked up once per visitor class", 1)
+        writeln("# instead of on every visit", 1)
+        writeln(f"{table}: Tuple[Callable[[Any, Any], Any], ...] = ()", 1)
+        writeln()
+        writeln("def __init_subclass__(cls, **kwargs: Any) -> None:", 1)
+        writeln("super().__init_subclass__(**kwargs)", 2)
         writeln(
-            f'return getattr(visitor, f"visit_{{name}}_{bn.regular.lower()}")(self)',
+            f"cls.{table} = tuple(getattr(cls, name) for name in {visitors})",
             2,
         )
         writeln()
-        writeln()
-        writeln(f"class {bn.regular}Visitor(ABC, Generic[T]):")
 
         for name in derived_types.keys():
             writeln("@abstractmethod", 1)
             writeln(
-                f"def visit_{name.lower()}_{bn.regular.lower()}(self, {bn.regular.lower()}: {name}) -> T:",
+                f"def {visit_name(bn, name)}(self, {bn.regular.lower()}: {name}) -> T:",
                 1,
             )
             writeln("raise NotImplementedError", 2)
@@ -111,59 +202,329 @@ def define_ast(
     print(f"{filename} created successfully")
 
 
+# how `FlatTree` stores a field, by its type. Anything else is kept as an
+# object.
+FLAT_FIELDS = {
+    "Expr": "NODE",
+    "Stmt": "NODE",
+    "Optional[Expr]": "OPTIONAL_NODE",
+    "Optional[Stmt]": "OPTIONAL_NODE",
+    "List[Expr]": "NODES",
+    "List[Stmt]": "NODES",
+    "int": "INT",
+    "bool": "BOOL",
+}
+
+FLAT_HEADER = """\
+from __future__ import annotations
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+from lox.syntax import expr, stmt
+
+
+Node = Union[expr.Expr, stmt.Stmt]
+
+# how a field is stored in `FlatTree.fields`
+NODE = 0  # node number
+OPTIONAL_NODE = 1  # node number, or -1 for None
+NODES = 2  # length of the list, then the node number of each item
+INT = 3  # the int itself
+BOOL = 4  # 1 or 0
+OBJECT = 5  # index into `FlatTree.objects`
+"""
+
+FLAT_TREE = """\
+CLASS_INDEX: Dict[type, int] = {
+    cls: i for (i, cls) in enumerate(NODE_CLASSES)
+}
+
+
+class FlatTreeError(Exception):
+    \"\"\"Raised when the arrays of a `FlatTree` don't describe a tree\"\"\"
+
+
+class FlatTree:
+    \"\"\"
+    Struct of arrays encoding of a list of statements. Nodes are numbered
+    in post order, so children come before their parents, and each node's
+    fields are stored in `fields` one after another in node order, as
+    `NODE_FIELDS` says.
+
+    :param array classes: index into `NODE_CLASSES` of each node
+    :param array fields: field entries of every node
+    :param List[object] objects: tokens, literal values and other fields
+    that aren't nodes or numbers
+    :param array roots: the statements, as node numbers
+    \"\"\"
+
+    __slots__ = ("classes", "fields", "objects", "roots")
+
+    classes: array
+    fields: array
+    objects: List[object]
+    roots: array
+
+    def __init__(self) -> None:
+        self.classes = array("B")
+        self.fields = array("q")
+        self.objects = []
+        self.roots = array("q")
+
+    @classmethod
+    def encode(cls, statements: List[stmt.Stmt]) -> FlatTree:
+        tree = cls()
+        for statement in statements:
+            tree.roots.append(tree._add(statement))
+        return tree
+
+    def _add(self, root: Node) -> int:
+        \"\"\"
+        Add `root` and everything under it, and return its number. Nodes
+        are visited from an explicit stack, twice each: once to schedule
+        their children, and once the children have been numbered.
+        \"\"\"
+        # numbers of the nodes added whose parent hasn't been yet
+        numbers: List[int] = []
+        work: List[Tuple[Node, Optional[List[Node]]]] = [(root, None)]
+
+        while work:
+            (node, children) = work.pop()
+            index = CLASS_INDEX[type(node)]
+
+            if children is None:
+                children = []
+                for (field, how) in zip(node._fields, NODE_FIELDS[index]):
+                    value = getattr(node, field)
+                    if how == NODES:
+                        children.extend(value)
+                    elif how in (NODE, OPTIONAL_NODE) and value is not None:
+                        children.append(value)
+
+                work.append((node, children))
+                work.extend((child, None) for child in reversed(children))
+                continue
+
+            start = len(numbers) - len(children)
+            child_numbers = iter(numbers[start:])
+            del numbers[start:]
+
+            fields = self.fields
+            for (field, how) in zip(node._fields, NODE_FIELDS[index]):
+                value = getattr(node, field)
+                if how == NODE:
+                    fields.append(next(child_numbers))
+                elif how == OPTIONAL_NODE:
+                    fields.append(-1 if value is None else next(child_numbers))
+                elif how == NODES:
+                    fields.append(len(value))
+                    fields.extend(next(child_numbers) for _ in value)
+                elif how == INT or how == BOOL:
+                    fields.append(int(value))
+                else:
+                    fields.append(len(self.objects))
+                    self.objects.append(value)
+
+            self.classes.append(index)
+            numbers.append(len(self.classes) - 1)
+
+        return numbers[0]
+
+    def decode(self) -> List[stmt.Stmt]:
+        \"\"\"
+        Build the statements back
+
+        :raises FlatTreeError: if the arrays don't describe a tree
+        \"\"\"
+        nodes: List[Node] = []
+        fields = iter(self.fields)
+        objects = self.objects
+
+        try:
+            for index in self.classes:
+                args: List[object] = []
+                for how in NODE_FIELDS[index]:
+                    entry = next(fields)
+                    if how == NODE:
+                        args.append(nodes[entry])
+                    elif how == OPTIONAL_NODE:
+                        args.append(None if entry < 0 else nodes[entry])
+                    elif how == NODES:
+                        items = [nodes[next(fields)] for _ in range(entry)]
+                        args.append(items)
+                    elif how == INT:
+                        args.append(entry)
+                    elif how == BOOL:
+                        args.append(entry != 0)
+                    else:
+                        args.append(objects[entry])
+
+                nodes.append(NODE_CLASSES[index](*args))
+
+            return [nodes[root] for root in self.roots]  # type: ignore
+        except (IndexError, StopIteration) as err:
+            raise FlatTreeError("malformed tree") from err
+
+    def __getstate__(self) -> Tuple[bytes, bytes, List[object], bytes]:
+        # the arrays as bytes, so unpickling needs no classes but lox's own
+        return (
+            self.classes.tobytes(),
+            self.fields.tobytes(),
+            self.objects,
+            self.roots.tobytes(),
+        )
+
+    def __setstate__(
+        self, state: Tuple[bytes, bytes, List[object], bytes]
+    ) -> None:
+        self.__init__()  # type: ignore
+        try:
+            (classes, fields, objects, roots) = state
+            self.classes.frombytes(classes)
+            self.fields.frombytes(fields)
+            self.roots.frombytes(roots)
+        except (TypeError, ValueError) as err:
+            raise FlatTreeError("malformed state") from err
+
+        if type(objects) is not list:
+            raise FlatTreeError("malformed state")
+        self.objects = objects
+
+    def __len__(self) -> int:
+        return len(self.classes)
+"""
+
+
+def define_flat(
+    output_dir: str, trees: List[Tuple[BaseName, Dict[str, PropertiesType]]]
+):
+    """
+    Write flat.py, the `FlatTree` encoding of the classes in `trees`, which
+    stores each field as `FLAT_FIELDS` says
+    """
+    filename = os.path.join(output_dir, "flat.py")
+
+    with open(filename, "w") as file:
+        writeln = _writeln(file)
+
+        file.write(FLAT_HEADER)
+        writeln()
+        writeln("# every node class, `Expr`s then `Stmt`s, each in kind order")
+        writeln("NODE_CLASSES: Tuple[type, ...] = (")
+        for (bn, derived_types) in trees:
+            for type_name in derived_types.keys():
+                writeln(f"{bn.regular.lower()}.{type_name},", 1)
+        writeln(")")
+        writeln()
+        writeln("# how each field of each class in `NODE_CLASSES` is stored")
+        writeln("NODE_FIELDS: Tuple[Tuple[int, ...], ...] = (")
+        for (_, derived_types) in trees:
+            for (type_name, properties) in derived_types.items():
+                hows = [
+                    FLAT_FIELDS.get(arg_type, "OBJECT")
+                    for (_, arg_type, *_) in properties
+                ]
+                entry = f"({', '.join(hows)}{',' if len(hows) == 1 else ''}),"
+                writeln(f"{entry}  # {type_name}", 1)
+        writeln(")")
+        writeln()
+        file.write(FLAT_TREE)
+
+    print(f"{filename} created successfully")
+
+
 def generate_ast(args: List[str]):
     output_dir = args[0]
 
-    define_ast(
-        output_dir,
-        BaseName("Expr", "expression"),
-        {
-            "Assign": [("name", "Token"), ("value", "Expr")],
-            "Logical": [
-                ("left", "Expr"),
-                ("operator", "Token"),
-                ("right", "Expr"),
-            ],
-            "Binary": [
-                ("left", "Expr"),
-                ("operator", "Token"),
-                ("right", "Expr"),
-            ],
-            "Unary": [("operator", "Token"), ("right", "Expr")],
-            "Call": [
-                ("callee", "Expr"),
-                ("paren", "Token"),
-                ("arguments", "List[Expr]"),
-            ],
-            "Literal": [("value", "object")],
-            "Variable": [("name", "Token")],
-            "Grouping": [("expression", "Expr")],
-        },
-    )
+    expr_types: Dict[str, PropertiesType] = {
+        # depth and slot are filled in by the resolver. A depth of -1
+        # means the variable is global, and its slot in the global
+        # table is filled in when it is first run. A variable a closure
+        # captures is kept in a `Cell`, and its depth is stored as
+        # `CELL - depth` (see lox.environment).
+        "Assign": [
+            ("name", "Token"),
+            ("value", "Expr"),
+            ("depth", "int", "-1"),
+            ("slot", "int", "-1"),
+        ],
+        "Logical": [
+            ("left", "Expr"),
+            ("operator", "Token"),
+            ("right", "Expr"),
+        ],
+        "Binary": [
+            ("left", "Expr"),
+            ("operator", "Token"),
+            ("right", "Expr"),
+        ],
+        "Unary": [("operator", "Token"), ("right", "Expr")],
+        "Call": [
+            ("callee", "Expr"),
+            ("paren", "Token"),
+            ("arguments", "List[Expr]"),
+        ],
+        "Literal": [("value", "object")],
+        "Variable": [
+            ("name", "Token"),
+            ("depth", "int", "-1"),
+            ("slot", "int", "-1"),
+        ],
+        "Grouping": [("expression", "Expr")],
+        "Array": [("bracket", "Token"), ("elements", "List[Expr]")],
+        "Index": [
+            ("target", "Expr"),
+            ("bracket", "Token"),
+            ("index", "Expr"),
+        ],
+        "SetIndex": [
+            ("target", "Expr"),
+            ("bracket", "Token"),
+            ("index", "Expr"),
+            ("value", "Expr"),
+        ],
+    }
+
+    stmt_types: Dict[str, PropertiesType] = {
+        # filled in by the resolver: where the cells the function
+        # captures are, as (depth, slot) from where it is declared, the
+        # slots of parameters that closures capture, and whether its
+        # name is captured
+        "Function": [
+            ("name", "Token"),
+            ("params", "List[Token]"),
+            ("body", "List[Stmt]"),
+            ("upvalues", "Tuple[Tuple[int, int], ...]", "()"),
+            ("captured_params", "Tuple[int, ...]", "()"),
+            ("captured", "bool", "False"),
+        ],
+        "Var": [
+            ("name", "Token"),
+            ("initializer", "Optional[Expr]"),
+            ("captured", "bool", "False"),
+        ],
+        "Expression": [("expression", "Expr")],
+        "If": [
+            ("condition", "Expr"),
+            ("branch_true", "Stmt"),
+            ("branch_false", "Optional[Stmt]"),
+        ],
+        "Print": [("expression", "Expr")],
+        "Return": [("keyword", "Token"), ("value", "Optional[Expr]")],
+        "While": [("condition", "Expr"), ("body", "Stmt")],
+        # filled in by the resolver: the first slot of the block's
+        # variables in the environment of the function it runs in, or -1
+        # for a top level block, which gets an environment of its own
+        "Block": [("statements", "List[Stmt]"), ("base", "int", "-1")],
+    }
 
+    expr_base = BaseName("Expr", "expression")
+    stmt_base = BaseName("Stmt", "statement")
+    define_ast(output_dir, expr_base, expr_types)
     define_ast(
-        output_dir,
-        BaseName("Stmt", "statement"),
-        {
-            "Function": [
-                ("name", "Token"),
-                ("params", "List[Token]"),
-                ("body", "List[Stmt]"),
-            ],
-            "Var": [("name", "Token"), ("initializer", "Optional[Expr]")],
-            "Expression": [("expression", "Expr")],
-            "If": [
-                ("condition", "Expr"),
-                ("branch_true", "Stmt"),
-                ("branch_false", "Optional[Stmt]"),
-            ],
-            "Print": [("expression", "Expr")],
-            "Return": [("keyword", "Token"), ("value", "Optional[Expr]")],
-            "While": [("condition", "Expr"), ("body", "Stmt")],
-            "Block": [("statements", "List[Stmt]")],
-        },
-        ["from lox.syntax.expr import Expr"],
+        output_dir, stmt_base, stmt_types, ["from lox.syntax.expr import Expr"]
     )
+    define_flat(output_dir, [(expr_base, expr_types), (stmt_base, stmt_types)])
 
 
 def main():